@@ -9,13 +9,44 @@ Uso da array numpy (API/backend):
     from eyebrows import extract_eyebrows_from_array
     res = extract_eyebrows_from_array(image_bgr, predictor_path="/path/to/shape_predictor_68_face_landmarks.dat")
     # res["face_detected"], res["left_mask"], res["right_mask"],
-    # res["left_area"], res["right_area"], res["pixels_img"], res["overlay_img"]
+    # res["left_area"], res["right_area"], res["pixels_img"], res["overlay_img"], res["face_rect"]
+
+    # volto già noto (es. da MediaPipe o da una chiamata precedente): niente HOG
+    res = extract_eyebrows_from_array(image_bgr, predictor_path=..., face_rect=(x1, y1, x2, y2))
+
+    # HOG su copia ridotta (rettangolo riportato a piena risoluzione)
+    res = extract_eyebrows_from_array(image_bgr, predictor_path=..., detect_max_width=600)
+
+Backend (selezione con backend=... o variabile d'ambiente EYEBROWS_BACKEND):
+    "dlib"      : HOG + shape predictor 68 punti (default storico)
+    "mediapipe" : polilinee sopracciglia dai 478 landmark FaceMesh, stessa segmentazione
+                  _segment_one. Se il chiamante ha già i landmark (in pixel, N×2) li passa
+                  con landmarks=... e nessun modello viene rieseguito:
+    res = extract_eyebrows_from_array(image_bgr, backend="mediapipe", landmarks=pts_px)
 """
 
 import cv2
-import dlib
 import numpy as np
 import os
+import threading
+
+try:
+    import dlib
+    DLIB_AVAILABLE = True
+except ImportError:
+    DLIB_AVAILABLE = False
+
+try:
+    import mediapipe as mp
+    MEDIAPIPE_AVAILABLE = True
+except ImportError:
+    MEDIAPIPE_AVAILABLE = False
+
+if not (DLIB_AVAILABLE or MEDIAPIPE_AVAILABLE):
+    raise ImportError("eyebrows.py richiede dlib oppure mediapipe")
+
+BACKENDS = ("dlib", "mediapipe")
+DEFAULT_BACKEND = os.getenv("EYEBROWS_BACKEND", "dlib").strip().lower()
 
 _predictor_cache = {}   # key = percorso assoluto, value = dlib predictor
 
@@ -29,6 +60,116 @@ def _get_predictor(path: str = "shape_predictor_68_face_landmarks.dat"):
 # alias backward-compat (usato da _get_predictor() chiamate vecchie)
 _predictor = None
 
+_detector = None        # detector HOG dlib, creato una volta per processo
+
+
+def _get_detector():
+    """Restituisce (creandolo alla prima chiamata) il detector HOG frontale dlib."""
+    global _detector
+    if _detector is None:
+        _detector = dlib.get_frontal_face_detector()
+    return _detector
+
+
+def _as_rectangle(face_rect, w: int, h: int):
+    """Converte (x1, y1, x2, y2) o dlib.rectangle in dlib.rectangle limitato all'immagine."""
+    if hasattr(face_rect, "left"):
+        x1, y1, x2, y2 = face_rect.left(), face_rect.top(), face_rect.right(), face_rect.bottom()
+    else:
+        x1, y1, x2, y2 = face_rect
+    x1, x2 = int(np.clip(x1, 0, w - 1)), int(np.clip(x2, 0, w - 1))
+    y1, y2 = int(np.clip(y1, 0, h - 1)), int(np.clip(y2, 0, h - 1))
+    return dlib.rectangle(x1, y1, x2, y2)
+
+
+# Landmark MediaPipe FaceMesh il cui bounding box approssima il rettangolo HOG di
+# dlib: guance (234, 454), sommità sopracciglia (105, 334, 66, 296), mento (152)
+MEDIAPIPE_FACE_BOX_LANDMARKS = (234, 454, 105, 334, 66, 296, 152)
+
+
+def face_rect_from_points(points: np.ndarray, indices=None) -> tuple:
+    """
+    Bounding box (x1, y1, x2, y2) di landmark in pixel (array N×2), da passare
+    come face_rect. Con landmark FaceMesh usare indices=MEDIAPIPE_FACE_BOX_LANDMARKS.
+    """
+    pts = np.asarray(points, dtype=np.float64)
+    if indices is not None:
+        pts = pts[list(indices)]
+    x1, y1 = np.floor(pts.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(pts.max(axis=0)).astype(int)
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+# Polilinee sopracciglia FaceMesh, ordinate da sinistra a destra nell'immagine come
+# i punti dlib 17-21 / 22-26; il centro del sopracciglio è la media bordo sup./inf.
+_MP_LEFT_UPPER  = (70, 63, 105, 66, 107)
+_MP_LEFT_LOWER  = (46, 53, 52, 65, 55)
+_MP_RIGHT_UPPER = (336, 296, 334, 293, 300)
+_MP_RIGHT_LOWER = (285, 295, 282, 283, 276)
+
+_face_mesh = None
+_face_mesh_lock = threading.Lock()   # FaceMesh non è thread-safe
+
+
+def mediapipe_landmarks(image_bgr: np.ndarray):
+    """
+    Esegue FaceMesh (statico, refine_landmarks, istanza in cache) e ritorna i
+    landmark del primo volto in pixel come array N×2 float, oppure None.
+    """
+    global _face_mesh
+    if not MEDIAPIPE_AVAILABLE:
+        raise ImportError("mediapipe non disponibile")
+    h, w = image_bgr.shape[:2]
+    rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+    with _face_mesh_lock:
+        if _face_mesh is None:
+            _face_mesh = mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=True, max_num_faces=1,
+                refine_landmarks=True, min_detection_confidence=0.5)
+        res = _face_mesh.process(rgb)
+    if not res.multi_face_landmarks:
+        return None
+    lm = res.multi_face_landmarks[0].landmark
+    return np.array([(p.x * w, p.y * h) for p in lm], dtype=np.float64)
+
+
+def eyebrow_points_from_mediapipe(landmarks: np.ndarray) -> tuple:
+    """
+    Da landmark FaceMesh in pixel (N×2, N ≥ 468) ricava le polilinee centrali
+    delle due sopracciglia (5 punti interi ciascuna, come dlib) e il box volto
+    equivalente a quello dlib. Ritorna (lpts, rpts, face_rect).
+    """
+    pts = np.asarray(landmarks, dtype=np.float64)
+    lpts = (pts[list(_MP_LEFT_UPPER)] + pts[list(_MP_LEFT_LOWER)]) / 2.0
+    rpts = (pts[list(_MP_RIGHT_UPPER)] + pts[list(_MP_RIGHT_LOWER)]) / 2.0
+    face_rect = face_rect_from_points(pts, MEDIAPIPE_FACE_BOX_LANDMARKS)
+    return np.rint(lpts).astype(int), np.rint(rpts).astype(int), face_rect
+
+
+def detect_face_rect(gray: np.ndarray, detect_max_width: int = None, upsample: int = 1):
+    """
+    Rileva il volto più grande con il detector HOG (in cache).
+
+    Se detect_max_width è impostato e l'immagine è più larga, la detection gira
+    su una copia ridotta e il rettangolo viene riportato a piena risoluzione.
+    Ritorna dlib.rectangle oppure None se nessun volto è stato trovato.
+    """
+    h, w = gray.shape[:2]
+    scale = 1.0
+    small = gray
+    if detect_max_width and w > detect_max_width:
+        scale = w / detect_max_width
+        small = cv2.resize(gray, (detect_max_width, max(1, round(h / scale))),
+                           interpolation=cv2.INTER_AREA)
+    faces = _get_detector()(small, upsample)
+    if not faces:
+        return None
+    face = max(faces, key=lambda r: r.width() * r.height())
+    if scale == 1.0:
+        return face
+    return _as_rectangle((round(face.left() * scale), round(face.top() * scale),
+                          round(face.right() * scale), round(face.bottom() * scale)), w, h)
+
 
 def _segment_one(gray, image, pts, face_h):
     xs, ys = pts[:, 0], pts[:, 1]
@@ -96,10 +237,25 @@ def extract_eyebrows(image_path: str, predictor_path: str = "shape_predictor_68_
 def extract_eyebrows_from_array(
     image_bgr: np.ndarray,
     predictor_path: str = "shape_predictor_68_face_landmarks.dat",
+    face_rect=None,
+    detect_max_width: int = None,
+    upsample: int = 1,
+    backend: str = None,
+    landmarks: np.ndarray = None,
 ) -> dict:
     """
     Versione array: accetta numpy BGR direttamente (es. decodificato da base64).
 
+    backend          : "dlib" o "mediapipe" (None = DEFAULT_BACKEND da EYEBROWS_BACKEND;
+                       se il backend richiesto non è installato si usa l'altro)
+    landmarks        : solo mediapipe — landmark FaceMesh già calcolati, in pixel (N×2)
+
+    face_rect        : (x1, y1, x2, y2) o dlib.rectangle del volto già noto → salta il HOG
+                       (il box guida anche i margini della segmentazione: deve essere
+                       paragonabile a quello di dlib, vedi face_rect_from_points)
+    detect_max_width : larghezza massima dell'immagine su cui gira il HOG (None = piena)
+    upsample         : upsample del detector HOG (1 = comportamento storico)
+
     Ritorna dict con:
       face_detected : bool
       left_mask     : numpy uint8 maschera binaria sopracciglio sinistro
@@ -108,6 +264,8 @@ def extract_eyebrows_from_array(
       right_area    : int pixel sopracciglio destro
       pixels_img    : numpy BGR solo pixel sopraccigliari su sfondo nero
       overlay_img   : numpy BGR originale con sopracciglia evidenziate
+      face_rect     : (x1, y1, x2, y2) del volto usato, riutilizzabile come seed
+      backend       : backend effettivamente usato
     """
     h, w = image_bgr.shape[:2]
     result = dict(
@@ -117,21 +275,44 @@ def extract_eyebrows_from_array(
         left_area=0, right_area=0,
         pixels_img=np.zeros_like(image_bgr),
         overlay_img=image_bgr.copy(),
+        face_rect=None,
+        backend=None,
     )
 
-    predictor = _get_predictor(predictor_path)
-    gray      = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
-    detector  = dlib.get_frontal_face_detector()
-    faces     = detector(gray, 1)
-    if not faces:
-        return result
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend sopracciglia sconosciuto: {backend!r} (attesi {BACKENDS})")
+    if backend == "dlib" and not DLIB_AVAILABLE:
+        backend = "mediapipe"
+    elif backend == "mediapipe" and not MEDIAPIPE_AVAILABLE and landmarks is None:
+        backend = "dlib"
+    result["backend"] = backend
+
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    if backend == "mediapipe":
+        pts = landmarks if landmarks is not None else mediapipe_landmarks(image_bgr)
+        if pts is None:
+            return result
+        lpts, rpts, box = eyebrow_points_from_mediapipe(pts)
+        face_h = box[3] - box[1] + 1   # come dlib.rectangle.height()
+        if face_h <= 1:
+            return result
+        result["face_rect"] = box
+    else:
+        predictor = _get_predictor(predictor_path)
+        if face_rect is not None:
+            face = _as_rectangle(face_rect, w, h)
+        else:
+            face = detect_face_rect(gray, detect_max_width, upsample)
+        if face is None or face.is_empty():
+            return result
+        result["face_rect"] = (face.left(), face.top(), face.right(), face.bottom())
+        lm     = predictor(gray, face)
+        lpts   = np.array([(lm.part(i).x, lm.part(i).y) for i in range(17, 22)])
+        rpts   = np.array([(lm.part(i).x, lm.part(i).y) for i in range(22, 27)])
+        face_h = face.height()
 
     result["face_detected"] = True
-    face   = max(faces, key=lambda r: r.width() * r.height())
-    lm     = predictor(gray, face)
-    lpts   = np.array([(lm.part(i).x, lm.part(i).y) for i in range(17, 22)])
-    rpts   = np.array([(lm.part(i).x, lm.part(i).y) for i in range(22, 27)])
-    face_h = face.height()
 
     left_blob,  bl = _segment_one(gray, image_bgr, lpts, face_h)
     right_blob, br = _segment_one(gray, image_bgr, rpts, face_h)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Store condiviso dello stato di sessione per il server WebSocket dei frame.
+
+Separa lo stato *condivisibile* di una sessione (abbinamento desktop/iPhone,
+membership dei device, orientamento operatore, parametri anteprima, metadati
+dello scorer) dagli oggetti locali al processo (websocket, MediaPipe, buffer
+JPEG). Con uno store condiviso più worker `websocket_frame_api.py` possono
+stare dietro un load balancer e un riavvio non perde gli abbinamenti.
+
+Implementazioni:
+  MemorySessionStore  → dict in-process (default, un solo worker)
+  FileSessionStore    → directory condivisa su disco (più worker sulla stessa
+                        macchina; stand-in locale dello store di rete)
+  RedisSessionStore   → Redis (pacchetto `redis` opzionale), più macchine
+
+Oltre allo stato, lo store fa da relay tra worker: ogni worker riceve i
+messaggi a lui indirizzati con `listen(worker_id)`.
+
+Selezione via URL (variabile KIMERIKA_WS_SESSION_STORE):
+  memory://                 (default)
+  file:///var/lib/kimerika/ws_sessions
+  redis://localhost:6379/0
+"""
+
+import asyncio
+import base64
+import copy
+import hashlib
+import json
+import os
+import time
+import uuid
+from urllib.parse import urlparse
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+def _json_default(obj):
+    # I messaggi di relay possono contenere payload binari (JPEG per desktop binari)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return {'__bytes__': base64.b64encode(bytes(obj)).decode('ascii')}
+    raise TypeError(f"Tipo non serializzabile: {type(obj).__name__}")
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and '__bytes__' in obj:
+        return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, default=_json_default, ensure_ascii=False)
+
+
+def loads(raw):
+    return json.loads(raw, object_hook=_json_object_hook)
+
+
+class SessionStore:
+    """Interfaccia dello store. Tutti i metodi sono coroutine.
+
+    Lo stato di una sessione è un dict JSON-serializzabile; `update` applica
+    una funzione di modifica in modo atomico rispetto agli altri worker.
+    """
+
+    async def load(self, token: str) -> dict | None:
+        raise NotImplementedError
+
+    async def update(self, token: str, mutate) -> dict:
+        """Applica mutate(state) (state = {} se assente) e salva. Restituisce lo stato."""
+        raise NotImplementedError
+
+    async def delete(self, token: str):
+        raise NotImplementedError
+
+    async def tokens(self) -> list:
+        raise NotImplementedError
+
+    async def publish(self, worker_id: str, message: dict):
+        """Recapita un messaggio di relay al worker indicato."""
+        raise NotImplementedError
+
+    async def listen(self, worker_id: str):
+        """Async iterator dei messaggi di relay per questo worker."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def heartbeat(self, worker_id: str, ttl: float):
+        raise NotImplementedError
+
+    async def live_workers(self) -> set:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Store in-process: comportamento storico, un solo worker."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._queues = {}
+        self._workers = {}
+
+    async def load(self, token):
+        state = self._sessions.get(token)
+        return copy.deepcopy(state) if state is not None else None
+
+    async def update(self, token, mutate):
+        state = self._sessions.get(token, {})
+        mutate(state)
+        self._sessions[token] = state
+        return copy.deepcopy(state)
+
+    async def delete(self, token):
+        self._sessions.pop(token, None)
+
+    async def tokens(self):
+        return list(self._sessions)
+
+    async def publish(self, worker_id, message):
+        self._queues.setdefault(worker_id, asyncio.Queue()).put_nowait(message)
+
+    async def listen(self, worker_id):
+        queue = self._queues.setdefault(worker_id, asyncio.Queue())
+        while True:
+            yield await queue.get()
+
+    async def heartbeat(self, worker_id, ttl):
+        self._workers[worker_id] = time.time() + ttl
+
+    async def live_workers(self):
+        now = time.time()
+        return {w for w, expires in self._workers.items() if expires > now}
+
+
+class FileSessionStore(SessionStore):
+    """Store su directory condivisa.
+
+    Layout:
+      sessions/<sha256(token)>.json   stato (scrittura atomica tmp + os.replace)
+      locks/<sha256(token)>.lock      lock esclusivo (O_EXCL) per update
+      inbox/<worker_id>/*.json        relay: un file per messaggio, letto a polling
+      workers/<worker_id>             heartbeat: contiene la scadenza
+    """
+
+    POLL_INTERVAL = 0.05   # secondi tra due scansioni dell'inbox
+    LOCK_TIMEOUT = 5.0     # un lock più vecchio è considerato abbandonato
+
+    def __init__(self, root: str):
+        self.root = root
+        for sub in ('sessions', 'locks', 'inbox', 'workers'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _key(self, token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _session_path(self, token):
+        return os.path.join(self.root, 'sessions', self._key(token) + '.json')
+
+    @staticmethod
+    def _write_atomic(path, text):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _acquire(self, token):
+        path = os.path.join(self.root, 'locks', self._key(token) + '.lock')
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return path
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > self.LOCK_TIMEOUT:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Lock sessione non ottenuto: {path}")
+                time.sleep(0.005)
+
+    def _update_sync(self, token, mutate):
+        lock = self._acquire(token)
+        try:
+            path = self._session_path(token)
+            state = self._read(path) or {}
+            mutate(state)
+            state['token'] = token
+            self._write_atomic(path, dumps(state))
+            return state
+        finally:
+            try:
+                os.remove(lock)
+            except FileNotFoundError:
+                pass
+
+    async def load(self, token):
+        return await asyncio.to_thread(self._read, self._session_path(token))
+
+    async def update(self, token, mutate):
+        return await asyncio.to_thread(self._update_sync, token, mutate)
+
+    async def delete(self, token):
+        try:
+            await asyncio.to_thread(os.remove, self._session_path(token))
+        except FileNotFoundError:
+            pass
+
+    def _tokens_sync(self):
+        tokens = []
+        folder = os.path.join(self.root, 'sessions')
+        for name in os.listdir(folder):
+            if name.endswith('.json'):
+                state = self._read(os.path.join(folder, name))
+                if state and state.get('token'):
+                    tokens.append(state['token'])
+        return tokens
+
+    async def tokens(self):
+        return await asyncio.to_thread(self._tokens_sync)
+
+    def _publish_sync(self, worker_id, message):
+        folder = os.path.join(self.root, 'inbox', worker_id)
+        os.makedirs(folder, exist_ok=True)
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+        self._write_atomic(os.path.join(folder, name), dumps(message))
+
+    async def publish(self, worker_id, message):
+        await asyncio.to_thread(self._publish_sync, worker_id, message)
+
+    def _drain_sync(self, folder):
+        messages = []
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(folder, name)
+            msg = self._read(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            if msg is not None:
+                messages.append(msg)
+        return messages
+
+    async def listen(self, worker_id):
+        folder = os.path.join(self.root, 'inbox', worker_id)
+        os.makedirs(folder, exist_ok=True)
+        while True:
+            for msg in await asyncio.to_thread(self._drain_sync, folder):
+                yield msg
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def heartbeat(self, worker_id, ttl):
+        path = os.path.join(self.root, 'workers', worker_id)
+        await asyncio.to_thread(self._write_atomic, path, str(time.time() + ttl))
+
+    def _live_workers_sync(self):
+        now = time.time()
+        folder = os.path.join(self.root, 'workers')
+        live = set()
+        for name in os.listdir(folder):
+            try:
+                with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+                    if float(f.read().strip() or 0) > now:
+                        live.add(name)
+            except (OSError, ValueError):
+                continue
+        return live
+
+    async def live_workers(self):
+        return await asyncio.to_thread(self._live_workers_sync)
+
+
+class RedisSessionStore(SessionStore):
+    """Store Redis: stato in chiavi JSON, relay su canali pub/sub per worker."""
+
+    PREFIX = 'kimerika:ws:'
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("Pacchetto 'redis' non installato: pip install redis")
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    def _key(self, token):
+        return f"{self.PREFIX}session:{token}"
+
+    async def load(self, token):
+        raw = await self._redis.get(self._key(token))
+        return loads(raw) if raw else None
+
+    async def update(self, token, mutate):
+        async with self._redis.lock(f"{self.PREFIX}lock:{token}", timeout=5, blocking_timeout=5):
+            raw = await self._redis.get(self._key(token))
+            state = loads(raw) if raw else {}
+            mutate(state)
+            await self._redis.set(self._key(token), dumps(state))
+            return state
+
+    async def delete(self, token):
+        await self._redis.delete(self._key(token))
+
+    async def tokens(self):
+        prefix = self._key('')
+        return [k[len(prefix):] async for k in self._redis.scan_iter(match=prefix + '*')]
+
+    async def publish(self, worker_id, message):
+        await self._redis.publish(f"{self.PREFIX}relay:{worker_id}", dumps(message))
+
+    async def listen(self, worker_id):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(f"{self.PREFIX}relay:{worker_id}")
+        try:
+            async for item in pubsub.listen():
+                if item.get('type') == 'message':
+                    yield loads(item['data'])
+        finally:
+            await pubsub.close()
+
+    async def heartbeat(self, worker_id, ttl):
+        await self._redis.set(f"{self.PREFIX}worker:{worker_id}", str(time.time()), ex=max(1, int(ttl)))
+
+    async def live_workers(self):
+        prefix = f"{self.PREFIX}worker:"
+        return {k[len(prefix):] async for k in self._redis.scan_iter(match=prefix + '*')}
+
+    async def close(self):
+        await self._redis.close()
+
+
+def create_session_store(url: str | None) -> SessionStore:
+    """Istanzia lo store a partire da un URL (memory://, file://path, redis://...)."""
+    if not url or url.startswith('memory:'):
+        return MemorySessionStore()
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        return FileSessionStore(parsed.netloc + parsed.path if parsed.netloc else parsed.path)
+    if parsed.scheme in ('redis', 'rediss'):
+        return RedisSessionStore(url)
+    raise ValueError(f"Session store non supportato: {url}")
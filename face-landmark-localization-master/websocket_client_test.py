@@ -2,9 +2,19 @@
 """
 Client di esempio per testare l'API WebSocket
 Simula l'invio di frame dalla webcam
+
+Modalità carico (coppie iPhone+desktop simulate, report JSON):
+    python websocket_client_test.py load --sessions 8 --fps 10 --duration 30 \
+        --frames-dir registrazione/ --server-pid $(pgrep -f websocket_frame_api) \
+        --report load_report.json
 """
 
+import argparse
 import asyncio
+import glob
+import os
+import struct
+import uuid
 import websockets
 import json
 import base64
@@ -184,18 +194,324 @@ async def test_static_images_client():
     except Exception as e:
         logger.error(f"Errore test statico: {e}")
 
+# ═══════════════════════════════════════════════════════════════════════════
+# 📈 LOAD TEST: N sessioni iPhone+desktop in parallelo
+# ═══════════════════════════════════════════════════════════════════════════
+# Stesso formato binario di websocket_frame_api.py (sezione PROTOCOLLO BINARIO)
+BIN_CLIENT_HEADER = struct.Struct('<BBBxI')
+BIN_SERVER_HEADER = struct.Struct('<BBxxII')
+BIN_ACTION_CODES = {'process_frame': 1, 'scan_frame': 2, 'iphone_frame': 3}
+RESULTS_POLL_INTERVAL = 5.0  # secondi tra due get_results intermedi del desktop
+
+
+def load_jpeg_sequence(frames_dir, max_frames=300):
+    """JPEG registrati (ordinati per nome); fallback su frame sintetici."""
+    frames = []
+    if frames_dir:
+        paths = sorted(glob.glob(os.path.join(frames_dir, '*.jpg')) +
+                       glob.glob(os.path.join(frames_dir, '*.jpeg')))
+        for path in paths[:max_frames]:
+            with open(path, 'rb') as f:
+                frames.append(f.read())
+    if not frames:
+        logger.warning("Nessun JPEG registrato: uso frame sintetici (nessun volto rilevato)")
+        for i in range(30):
+            img = np.full((720, 1280, 3), 40, dtype=np.uint8)
+            cv2.circle(img, (640 + (i - 15) * 8, 360), 180, (180, 200, 230), -1)
+            _, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            frames.append(buf.tobytes())
+    return frames
+
+
+def encode_binary_frame(action, seq, jpeg, session_token=''):
+    token = session_token.encode('utf-8')
+    return BIN_CLIENT_HEADER.pack(1, BIN_ACTION_CODES[action], len(token), seq) + token + jpeg
+
+
+def decode_binary_reply(message):
+    """Restituisce (tipo, seq, metadati JSON) di un messaggio binario del server."""
+    _, msg_type, seq, json_len = BIN_SERVER_HEADER.unpack_from(message, 0)
+    meta = json.loads(bytes(message[BIN_SERVER_HEADER.size:BIN_SERVER_HEADER.size + json_len]))
+    return msg_type, seq, meta
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {f"p{p}": None for p in points} | {"max": None}
+    ordered = sorted(values)
+    result = {f"p{p}": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 1)
+              for p in points}
+    result["max"] = round(ordered[-1], 1)
+    return result
+
+
+def read_rss_mb(pid):
+    """RSS del processo server da /proc (Linux); None se non disponibile."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class LoadSession:
+    """Una coppia simulata: iPhone che invia frame + desktop che riceve i risultati."""
+
+    def __init__(self, index, args, frames):
+        self.index = index
+        self.args = args
+        self.frames = frames
+        self.token = f"load_{uuid.uuid4().hex}"
+        self.sent_at = {}            # seq → istante di invio
+        self.sent = 0
+        self.responses = 0
+        self.latencies_ms = []       # richiesta → risposta all'iPhone/client
+        self.desktop_latencies_ms = []  # invio iPhone → iphone_frame_processed sul desktop
+        self.desktop_frames = 0
+        self.server_dropped = 0
+        self.results_polls = 0
+        self.final_frames = None
+        self.max_fps = args.fps
+        self.errors = 0
+
+    def _on_reply(self, seq):
+        t0 = self.sent_at.pop(seq, None)
+        if t0 is not None:
+            self.responses += 1
+            self.latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    async def _stream(self, ws, action, stop_at):
+        seq = 0
+        while time.perf_counter() < stop_at:
+            t_next = time.perf_counter() + 1.0 / max(1, min(self.args.fps, self.max_fps))
+            seq += 1
+            jpeg = self.frames[(self.index * 7 + seq) % len(self.frames)]
+            token = '' if action == 'iphone_frame' else self.token
+            self.sent_at[seq] = time.perf_counter()
+            await ws.send(encode_binary_frame(action, seq, jpeg, token))
+            self.sent += 1
+            await asyncio.sleep(max(0.0, t_next - time.perf_counter()))
+
+    async def _read_phone(self, ws):
+        async for message in ws:
+            if isinstance(message, bytes):
+                _, seq, meta = decode_binary_reply(message)
+                self._on_reply(seq)
+                self.server_dropped = meta.get('frames_dropped', self.server_dropped)
+                continue
+            data = json.loads(message)
+            if data.get('action') == 'frame_scanned':
+                self._on_reply(data.get('seq'))
+            elif data.get('action') == 'flow_control' and self.args.honor_flow_control:
+                self.max_fps = data.get('max_fps', self.max_fps)
+            elif 'error' in data:
+                self.errors += 1
+
+    async def _read_desktop(self, ws, results_event):
+        async for message in ws:
+            if isinstance(message, bytes):
+                msg_type, seq, _ = decode_binary_reply(message)
+                if msg_type == 0x82:  # iphone_frame_processed
+                    self.desktop_frames += 1
+                    t0 = self.sent_at.get(seq)
+                    if t0 is not None:
+                        self.desktop_latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+                continue
+            data = json.loads(message)
+            if data.get('action') == 'results_ready':
+                self.results_polls += 1
+                if data.get('is_final'):
+                    self.final_frames = data.get('frames_count', 0)
+                    results_event.set()
+
+    async def run(self):
+        uri, args = self.args.uri, self.args
+        stop_at = time.perf_counter() + args.duration
+        results_event = asyncio.Event()
+        async with websockets.connect(uri, max_size=None) as desktop:
+            await desktop.send(json.dumps({"action": "register_desktop", "session_token": self.token,
+                                           "binary": True}))
+            await desktop.send(json.dumps({"action": "start_webcam", "session_token": self.token,
+                                           "preview": {"max_width": 640, "max_fps": 10, "quality": 70}}))
+            desktop_reader = asyncio.create_task(self._read_desktop(desktop, results_event))
+
+            async with websockets.connect(uri, max_size=None) as phone:
+                if args.action == 'iphone_frame':
+                    await phone.send(json.dumps({"action": "iphone_connect", "session_token": self.token,
+                                                 "deviceId": f"load-device-{self.index:04d}",
+                                                 "userAgent": "websocket_client_test load"}))
+                else:
+                    await phone.send(json.dumps({"action": "start_session", "session_token": self.token,
+                                                 "session_id": f"load_{self.index:04d}"}))
+                phone_reader = asyncio.create_task(self._read_phone(phone))
+
+                async def poll_results():
+                    while time.perf_counter() < stop_at:
+                        await asyncio.sleep(RESULTS_POLL_INTERVAL)
+                        await desktop.send(json.dumps({"action": "get_results"}))
+
+                poller = asyncio.create_task(poll_results())
+                try:
+                    await self._stream(phone, args.action, stop_at)
+                    await asyncio.sleep(args.drain)  # attende le ultime risposte
+                finally:
+                    poller.cancel()
+                    phone_reader.cancel()
+
+            await desktop.send(json.dumps({"action": "get_results", "final": True}))
+            try:
+                await asyncio.wait_for(results_event.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                self.errors += 1
+            desktop_reader.cancel()
+
+    def report(self):
+        return {
+            "session": self.index,
+            "sent": self.sent,
+            "responses": self.responses,
+            "unanswered": self.sent - self.responses,
+            "server_frames_dropped": self.server_dropped,
+            "desktop_frames": self.desktop_frames,
+            "latency_ms": percentiles(self.latencies_ms),
+            "desktop_latency_ms": percentiles(self.desktop_latencies_ms),
+            "results_polls": self.results_polls,
+            "final_frames": self.final_frames,
+            "errors": self.errors,
+        }
+
+
+async def admin_status(uri, admin_token):
+    try:
+        async with websockets.connect(uri) as ws:
+            await ws.send(json.dumps({"action": "admin_status", "admin_token": admin_token}))
+            return json.loads(await asyncio.wait_for(ws.recv(), timeout=5))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def run_load_test(args):
+    """Avvia le sessioni simulate e produce il report aggregato."""
+    frames = load_jpeg_sequence(args.frames_dir)
+    sessions = [LoadSession(i, args, frames) for i in range(args.sessions)]
+    logger.info(f"Load test: {args.sessions} sessioni × {args.fps} fps × {args.duration}s "
+                f"({args.action}, {len(frames)} frame registrati)")
+
+    rss_samples = []
+
+    async def sample_rss():
+        while True:
+            rss = read_rss_mb(args.server_pid) if args.server_pid else None
+            if rss is not None:
+                rss_samples.append(round(rss, 1))
+            await asyncio.sleep(1.0)
+
+    sampler = asyncio.create_task(sample_rss())
+    t_start = time.perf_counter()
+    outcomes = []
+    for i in range(0, len(sessions), args.ramp_batch):
+        batch = sessions[i:i + args.ramp_batch]
+        outcomes += [asyncio.create_task(s.run()) for s in batch]
+        await asyncio.sleep(args.ramp_delay)
+    results = await asyncio.gather(*outcomes, return_exceptions=True)
+    elapsed = time.perf_counter() - t_start
+    sampler.cancel()
+
+    failed = [repr(r) for r in results if isinstance(r, Exception)]
+    status = await admin_status(args.uri, args.admin_token)
+    all_lat = [v for s in sessions for v in s.latencies_ms]
+    all_desk = [v for s in sessions for v in s.desktop_latencies_ms]
+    sent = sum(s.sent for s in sessions)
+    responses = sum(s.responses for s in sessions)
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "config": {k: v for k, v in vars(args).items() if k not in ('admin_token', 'func')},
+        "elapsed_s": round(elapsed, 2),
+        "totals": {
+            "sessions": len(sessions),
+            "sessions_failed": len(failed),
+            "frames_sent": sent,
+            "responses": responses,
+            "throughput_fps": round(responses / elapsed, 2) if elapsed else 0.0,
+            "unanswered_frames": sent - responses,
+            "server_frames_dropped": sum(s.server_dropped for s in sessions),
+            "desktop_frames": sum(s.desktop_frames for s in sessions),
+            "latency_ms": percentiles(all_lat),
+            "desktop_latency_ms": percentiles(all_desk),
+        },
+        "server": {
+            "rss_mb_peak": max(rss_samples) if rss_samples else None,
+            "rss_mb_last": rss_samples[-1] if rss_samples else None,
+            "rss_mb_samples": rss_samples,
+            "admin_status": status,
+        },
+        "failures": failed,
+        "sessions": [s.report() for s in sessions],
+    }
+
+    totals = report["totals"]
+    logger.info(f"📈 Throughput: {totals['throughput_fps']} frame/s su {totals['sessions']} sessioni "
+                f"({totals['sessions_failed']} fallite)")
+    logger.info(f"   Latenza ms: {totals['latency_ms']}  desktop: {totals['desktop_latency_ms']}")
+    logger.info(f"   Frame senza risposta: {totals['unanswered_frames']}  "
+                f"scartati dal server: {totals['server_frames_dropped']}")
+    logger.info(f"   RSS server picco: {report['server']['rss_mb_peak']} MB")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logger.info(f"   Report salvato: {args.report}")
+    return report
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Client di test / load test per WebSocket Frame API")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('webcam', help="test interattivo con webcam")
+    sub.add_parser('static', help="test con immagini statiche")
+    load = sub.add_parser('load', help="simula N sessioni iPhone+desktop e produce un report")
+    load.add_argument('--uri', default="ws://localhost:8765")
+    load.add_argument('--sessions', type=int, default=4, help="coppie iPhone+desktop simultanee")
+    load.add_argument('--fps', type=float, default=10.0, help="frame al secondo per sessione")
+    load.add_argument('--duration', type=float, default=30.0, help="secondi di streaming")
+    load.add_argument('--action', choices=['iphone_frame', 'process_frame', 'scan_frame'],
+                      default='iphone_frame', help="azione usata per lo streaming dei frame")
+    load.add_argument('--frames-dir', help="directory con la sequenza JPEG registrata")
+    load.add_argument('--server-pid', type=int, help="PID del server per campionare l'RSS")
+    load.add_argument('--admin-token', default=os.environ.get('KIMERIKA_WS_ADMIN_TOKEN'))
+    load.add_argument('--no-flow-control', dest='honor_flow_control', action='store_false',
+                      help="ignora i messaggi flow_control (invia sempre a --fps)")
+    load.add_argument('--ramp-batch', type=int, default=4, help="sessioni avviate per scaglione")
+    load.add_argument('--ramp-delay', type=float, default=0.5, help="secondi tra due scaglioni")
+    load.add_argument('--drain', type=float, default=2.0, help="secondi di attesa delle ultime risposte")
+    load.add_argument('--report', help="percorso del report JSON (trend tra release)")
+    return parser
+
+
 if __name__ == "__main__":
-    import sys
-    
-    print("🎯 Client di test per WebSocket Frame API")
-    print("1. Test con webcam (default)")
-    print("2. Test con immagini statiche")
-    
-    choice = input("Scegli test (1/2): ").strip()
-    
-    if choice == "2":
+    args = build_arg_parser().parse_args()
+
+    if args.command == 'load':
+        asyncio.run(run_load_test(args))
+    elif args.command == 'static':
         logger.info("Avvio test con immagini statiche...")
         asyncio.run(test_static_images_client())
-    else:
+    elif args.command == 'webcam':
         logger.info("Avvio test con webcam...")
-        asyncio.run(test_webcam_client())
\ No newline at end of file
+        asyncio.run(test_webcam_client())
+    else:
+        print("🎯 Client di test per WebSocket Frame API")
+        print("1. Test con webcam (default)")
+        print("2. Test con immagini statiche")
+
+        choice = input("Scegli test (1/2): ").strip()
+
+        if choice == "2":
+            logger.info("Avvio test con immagini statiche...")
+            asyncio.run(test_static_images_client())
+        else:
+            logger.info("Avvio test con webcam...")
+            asyncio.run(test_webcam_client())
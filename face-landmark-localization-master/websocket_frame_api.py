@@ -15,10 +15,25 @@ import mediapipe as mp
 import time
 import os
 import io
+import heapq
+import itertools
+import struct
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from collections import deque
 import logging
 import sys
 
+from session_store import create_session_store
+
+# orjson (opzionale): serializzazione JSON 5-10x più veloce sui messaggi caldi
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Configurazione logging: usa stdout (già unbuffered con python3 -u)
 # così i log vengono scritti immediatamente senza buffering su stderr
 logging.basicConfig(
@@ -29,14 +44,599 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# === PROTOCOLLO BINARIO ===
+# Alternativa al JSON+base64 per i frame: nessun json.loads di stringhe da MB,
+# nessun b64decode e nessun re-encode base64 verso il desktop.
+#
+# Client → server:
+#   [0]     u8   versione (BIN_PROTOCOL_VERSION)
+#   [1]     u8   azione (chiave di BIN_ACTIONS)
+#   [2]     u8   lunghezza session_token in byte (0 = token della connessione)
+#   [3]     u8   riservato
+#   [4:8]   u32  seq (little-endian)
+#   [8:8+n] session_token UTF-8
+#   [...]   JPEG grezzo
+#
+# Server → client:
+#   [0]     u8   versione
+#   [1]     u8   tipo messaggio (BIN_MSG_*)
+#   [2:4]   u16  riservato
+#   [4:8]   u32  seq della richiesta
+#   [8:12]  u32  lunghezza JSON (padding con spazi a multipli di 4)
+#   [...]   JSON metadati (stessi campi del messaggio JSON, senza landmark/frame)
+#   [...]   landmark [x0,y0,x1,y1,...]; gruppi in 'landmark_layout' =
+#           {gruppo: [primo_punto, n_punti]}, 'landmarks_bytes'.
+#           'landmark_dtype' = 'f4' (float32 LE normalizzati, default) o 'i2'
+#           (int16 LE, codifica scelta dal client con 'landmark_encoding')
+#   [...]   JPEG grezzo ('jpeg_bytes' byte, solo per iphone_frame_processed)
+# I client legacy continuano a usare il protocollo JSON senza modifiche.
+BIN_PROTOCOL_VERSION = 1
+BIN_CLIENT_HEADER = struct.Struct('<BBBxI')
+BIN_SERVER_HEADER = struct.Struct('<BBxxII')
+BIN_ACTIONS = {1: 'process_frame', 2: 'scan_frame', 3: 'iphone_frame'}
+BIN_MSG_FRAME_PROCESSED = 0x81
+BIN_MSG_IPHONE_FRAME_PROCESSED = 0x82
+
+
+class BinaryProtocolError(ValueError):
+    """Messaggio binario malformato."""
+
+
+def _decode_binary_request(message: bytes) -> dict:
+    """Converte un messaggio binario client nello stesso dict del protocollo JSON.
+
+    Il JPEG viene messo in 'frame_data' (o 'frame' per iphone_frame) come bytes.
+    """
+    if len(message) < BIN_CLIENT_HEADER.size:
+        raise BinaryProtocolError("header troppo corto")
+    version, code, token_len, seq = BIN_CLIENT_HEADER.unpack_from(message, 0)
+    if version != BIN_PROTOCOL_VERSION:
+        raise BinaryProtocolError(f"versione protocollo non supportata: {version}")
+    action = BIN_ACTIONS.get(code)
+    if action is None:
+        raise BinaryProtocolError(f"azione binaria sconosciuta: {code}")
+    offset = BIN_CLIENT_HEADER.size
+    data = {'action': action, 'seq': seq}
+    if token_len:
+        data['session_token'] = bytes(message[offset:offset + token_len]).decode('utf-8')
+    payload = bytes(message[offset + token_len:])
+    data['frame' if action == 'iphone_frame' else 'frame_data'] = payload
+    return data
+
+
+def _dumps(obj) -> str:
+    """JSON dei messaggi WebSocket: orjson se installato, altrimenti stdlib."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(obj)
+
+
+# ── Landmark compatti per overlay live ───────────────────────────────────────
+# Solo i punti necessari al rendering: contorno viso, occhi, naso, bocca.
+# Gli indici sono concatenati una volta sola: per ogni frame basta un gather
+# numpy sull'array (N, 2) dei landmark normalizzati.
+LM_GROUPS = {
+    # Oval: contorno viso sinistro→alto→destro→basso
+    'oval': [10,338,297,332,284,251,389,356,454,323,361,288,
+             397,365,379,378,400,377,152,148,176,149,150,136,
+             172,58,132,93,234,127,162,21,54,103,67,109],
+    # Occhio sinistro (esterno → interno)
+    'l_eye': [33,7,163,144,145,153,154,155,133,173,157,158,159,160,161,246],
+    # Occhio destro
+    'r_eye': [362,382,381,380,374,373,390,249,263,466,388,387,386,385,384,398],
+    # Naso (ponte + punta + narici)
+    'nose': [168,6,197,195,5,4,45,220,115,48],
+    # Sopracciglio sinistro
+    'l_brow': [276,283,282,295,285,300,293,334,296,336],
+    # Sopracciglio destro
+    'r_brow': [46,53,52,65,55,70,63,105,66,107],
+    # Bocca (labbro esterno)
+    'mouth': [61,146,91,181,84,17,314,405,321,375,291,
+              308,324,318,402,317,14,87,178,88,95],
+}
+LM_GATHER_INDEX = np.concatenate([np.asarray(idx, dtype=np.intp) for idx in LM_GROUPS.values()])
+LANDMARK_LAYOUT = {}
+_start = 0
+for _group, _indices in LM_GROUPS.items():
+    LANDMARK_LAYOUT[_group] = [_start, len(_indices)]
+    _start += len(_indices)
+
+# Codifiche dei landmark scelte dal client con 'landmark_encoding':
+#   'float'      → float normalizzati [0,1] (4 decimali nel JSON, float32 nel binario)
+#   'int16_norm' → interi = coordinata normalizzata × LANDMARK_INT16_SCALE
+#   'int16_px'   → interi in pixel dell'immagine originale ('image_size' = [w, h])
+#   'none'       → landmark omessi (client che non disegnano l'overlay)
+LANDMARK_ENCODINGS = ('float', 'int16_norm', 'int16_px', 'none')
+LANDMARK_INT16_SCALE = 32767
+
+
+def _requested_encoding(data: dict, default: str = 'float') -> str:
+    """'landmark_encoding' del messaggio se valido, altrimenti default."""
+    encoding = data.get('landmark_encoding')
+    return encoding if encoding in LANDMARK_ENCODINGS else default
+
+
+def _quantize_landmarks(points: np.ndarray, encoding: str, image_size=None) -> np.ndarray:
+    """Landmark (K, 2) normalizzati → array nella codifica richiesta."""
+    if encoding == 'int16_norm':
+        return np.rint(points * LANDMARK_INT16_SCALE).clip(-32768, 32767).astype('<i2')
+    if encoding == 'int16_px':
+        w, h = image_size or (1, 1)
+        return np.rint(points * (w, h)).clip(-32768, 32767).astype('<i2')
+    return points
+
+
+def _landmark_fields(encoding: str) -> dict:
+    """Campi che descrivono la codifica dei landmark (vuoto per 'float', storico)."""
+    if encoding in ('float', 'none'):
+        return {}
+    scale = LANDMARK_INT16_SCALE if encoding == 'int16_norm' else 1
+    return {'landmark_encoding': encoding, 'landmark_scale': scale}
+
+
+def _json_landmarks(message: dict, encoding: str = 'float') -> dict:
+    """Copia del messaggio con i landmark (ndarray) convertiti in liste per gruppo."""
+    points = message.get('landmarks')
+    if not isinstance(points, np.ndarray):
+        return message
+    message = dict(message)
+    if encoding == 'none':
+        del message['landmarks']
+        return message
+    if encoding == 'float':
+        flat = np.round(points, 4).ravel().tolist()
+    else:
+        flat = _quantize_landmarks(points, encoding, message.get('image_size')).ravel().tolist()
+    message['landmarks'] = {
+        group: flat[2 * start:2 * (start + count)] for group, (start, count) in LANDMARK_LAYOUT.items()
+    }
+    message.update(_landmark_fields(encoding))
+    return message
+
+
+def _encode_binary_message(msg_type: int, seq, meta: dict, jpeg: bytes | None = None,
+                           landmark_encoding: str = 'float') -> bytes:
+    """Serializza una risposta nel formato binario server → client."""
+    meta = dict(meta)
+    points = meta.pop('landmarks', None)
+    blob = b''
+    if isinstance(points, np.ndarray) and landmark_encoding != 'none':
+        values = _quantize_landmarks(points, landmark_encoding, meta.get('image_size'))
+        meta['landmark_layout'] = LANDMARK_LAYOUT
+        meta['landmark_dtype'] = 'f4' if landmark_encoding == 'float' else 'i2'
+        meta.update(_landmark_fields(landmark_encoding))
+        blob = values.astype('<f4', copy=False).tobytes() if landmark_encoding == 'float' else values.tobytes()
+    meta['landmarks_bytes'] = len(blob)
+    meta['jpeg_bytes'] = len(jpeg) if jpeg else 0
+    body = _dumps(meta).encode('utf-8')
+    body += b' ' * (-len(body) % 4)  # allinea i landmark per Float32Array/Int16Array lato JS
+    header = BIN_SERVER_HEADER.pack(BIN_PROTOCOL_VERSION, msg_type, seq or 0, len(body))
+    return b''.join((header, body, blob, jpeg or b''))
+
+
+def _jpeg_bytes(frame) -> bytes:
+    """Byte JPEG da IncomingFrame, frame binario (bytes) o legacy (stringa base64)."""
+    if isinstance(frame, IncomingFrame):
+        return frame.jpeg
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        return bytes(frame)
+    return base64.b64decode(frame)
+
+
+def _jpeg_b64(frame) -> str:
+    """Stringa base64 da IncomingFrame, frame binario (bytes) o legacy (già base64)."""
+    if isinstance(frame, IncomingFrame):
+        return frame.b64
+    if isinstance(frame, str):
+        return frame
+    return base64.b64encode(frame).decode('utf-8')
+
+
+# Marker SOF (Start Of Frame) che contengono le dimensioni dell'immagine
+_JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                               0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+
+
+def _jpeg_dimensions(data: bytes):
+    """(larghezza, altezza) lette dall'header JPEG senza decodificare (None se illeggibile)."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # byte di riempimento
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # marker senza lunghezza
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            h, w = struct.unpack_from('>HH', data, i + 5)
+            return (w, h) if w and h else None
+        i += 2 + struct.unpack_from('>H', data, i + 2)[0]
+    return None
+
+
+class IncomingFrame:
+    """Frame ricevuto dal client che attraversa rotazione, scoring e buffer.
+
+    Il JPEG viene decodificato una sola volta (alla prima richiesta di .image)
+    e le trasformazioni lavorano sull'ndarray. Il re-encode avviene solo se
+    servono di nuovo i byte (frame tenuto nel buffer o inoltrato al desktop);
+    un frame non trasformato restituisce i byte/base64 originali senza copie.
+
+    Per l'inferenza basta image_for(lato): libjpeg decodifica direttamente a
+    1/2, 1/4 o 1/8 (IMREAD_REDUCED_*, downscale nel dominio DCT) e la
+    decodifica a piena risoluzione avviene solo se serve davvero (re-encode
+    dopo una rotazione, anteprima più grande). La rotazione è registrata e
+    applicata a ogni decodifica, anche successiva.
+    """
+
+    REENCODE_QUALITY = 85  # qualità JPEG dopo una trasformazione (es. rotazione)
+    REDUCED_MODES = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                     (4, cv2.IMREAD_REDUCED_COLOR_4),
+                     (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+    __slots__ = ('_jpeg', '_b64', '_source', '_image', '_decoded', '_reduced', '_size', '_rotated')
+
+    def __init__(self, data):
+        if isinstance(data, str):
+            self._jpeg, self._b64 = None, data
+        else:
+            self._jpeg, self._b64 = bytes(data), None
+        self._source = None   # JPEG ricevuto, sorgente di tutte le decodifiche
+        self._image = None
+        self._decoded = False
+        self._reduced = {}    # fattore di riduzione → ndarray
+        self._size = None
+        self._rotated = False
+
+    def _source_jpeg(self) -> bytes:
+        if self._source is None:
+            self._source = self.jpeg
+        return self._source
+
+    def _decode(self, flag):
+        img = cv2.imdecode(np.frombuffer(self._source_jpeg(), np.uint8), flag)
+        if img is not None and self._rotated:
+            img = cv2.rotate(img, cv2.ROTATE_180)
+        return img
+
+    @property
+    def image(self):
+        """ndarray BGR a piena risoluzione (None se il JPEG non è valido)."""
+        if not self._decoded:
+            self._decoded = True
+            self._image = self._decode(cv2.IMREAD_COLOR)
+            # Le dimensioni reali vincono sull'header: l'orientamento EXIF può scambiare i lati
+            if self._image is not None:
+                self._size = (self._image.shape[1], self._image.shape[0])
+        return self._image
+
+    @property
+    def size(self):
+        """(larghezza, altezza) originali; dall'header JPEG se non ancora decodificato."""
+        if self._size is None:
+            if not self._decoded:
+                self._size = _jpeg_dimensions(self._source_jpeg())
+            if self._size is None and self.image is None:
+                return None  # JPEG non valido (la decodifica completa imposta _size)
+        return self._size
+
+    def image_for(self, max_dim: int):
+        """ndarray BGR con lato maggiore ≥ max_dim, alla risoluzione ridotta più
+        piccola possibile (il chiamante completa il resize)."""
+        if self._image is not None:
+            return self._image
+        size = self.size
+        if size is None:
+            return None
+        for factor, flag in self.REDUCED_MODES:
+            if max(size) // factor < max_dim:
+                continue
+            if factor not in self._reduced:
+                img = self._decode(flag)
+                if img is None:
+                    return self.image
+                # L'orientamento EXIF applicato da imdecode può scambiare i lati
+                if img.shape[1] != img.shape[0] and (img.shape[1] > img.shape[0]) != (size[0] > size[1]):
+                    self._size = (size[1], size[0])
+                self._reduced[factor] = img
+            return self._reduced[factor]
+        return self.image
+
+    @property
+    def jpeg(self) -> bytes:
+        if self._jpeg is None:
+            if self._b64 is not None:
+                self._jpeg = base64.b64decode(self._b64)
+            else:
+                _, buf = cv2.imencode('.jpg', self.image, [cv2.IMWRITE_JPEG_QUALITY, self.REENCODE_QUALITY])
+                self._jpeg = buf.tobytes()
+        return self._jpeg
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.jpeg).decode('utf-8')
+        return self._b64
+
+    def rotate_180(self) -> bool:
+        """Ruota il frame; i byte verranno rigenerati solo se richiesti."""
+        if self.size is None:
+            return False
+        self._rotated = not self._rotated
+        if self._image is not None:
+            self._image = cv2.rotate(self._image, cv2.ROTATE_180)
+        self._reduced = {f: cv2.rotate(img, cv2.ROTATE_180) for f, img in self._reduced.items()}
+        self._jpeg = None
+        self._b64 = None
+        return True
+
+
+class TopKFrameBuffer:
+    """Buffer top-K dei frame candidati basato su un min-heap con chiave score.
+
+    Il peggiore candidato è sempre in testa all'heap: soglia e sostituzione
+    costano O(log n), senza riordinare il buffer a ogni frame.
+
+    Regole di diversità opzionali (disattivate di default):
+      min_frame_gap    → due candidati devono distare almeno N frame; un nuovo
+                         frame troppo vicino compete solo con i suoi vicini.
+      pose_bin_deg /
+      max_per_pose_bin → al più M candidati per cella pitch/yaw di ampiezza D°;
+                         a cella piena il nuovo frame compete col peggiore della cella.
+    max_bytes (0 = nessun limite) limita la memoria dei candidati (JPEG +
+    landmark): oltre il limite vengono rimossi i peggiori.
+    Le rimozioni sono "lazy": gli elementi rimossi restano nell'heap marcati
+    come non vivi e vengono scartati quando arrivano in testa.
+    """
+
+    _SCORE, _SEQ, _ENTRY, _ALIVE = range(4)
+
+    ENTRY_OVERHEAD = 1024  # byte stimati per dict e metadati di un candidato
+
+    def __init__(self, capacity, min_frame_gap=0, pose_bin_deg=0.0, max_per_pose_bin=0, max_bytes=0):
+        self.capacity = capacity
+        self.min_frame_gap = min_frame_gap
+        self.pose_bin_deg = pose_bin_deg
+        self.max_per_pose_bin = max_per_pose_bin
+        self.max_bytes = max_bytes
+        self.clear()
+
+    @classmethod
+    def entry_nbytes(cls, entry):
+        """Byte approssimati occupati da un candidato (JPEG + landmark + overhead)."""
+        landmarks = entry.get('landmarks')
+        return (len(entry.get('jpeg') or b'') + getattr(landmarks, 'nbytes', 0)
+                + cls.ENTRY_OVERHEAD)
+
+    def clear(self):
+        self._heap = []            # [score, seq, entry, alive]
+        self._seq = itertools.count()
+        self._live = 0
+        self._by_frame = {}        # frame_number -> item (solo con min_frame_gap)
+        self._bins = {}            # pose bin -> (min-heap di item, contatore vivi)
+        self.version = 0           # incrementato a ogni modifica del contenuto
+        self.nbytes = 0            # memoria stimata dei candidati vivi
+
+    def __len__(self):
+        return self._live
+
+    def entries(self):
+        """Candidati vivi, in ordine arbitrario."""
+        return [it[self._ENTRY] for it in self._heap if it[self._ALIVE]]
+
+    def min_score(self):
+        """Score del peggiore candidato vivo (None se vuoto)."""
+        self._prune(self._heap)
+        return self._heap[0][self._SCORE] if self._heap else None
+
+    def top(self, k):
+        """I k migliori candidati in ordine di score decrescente (O(n log k))."""
+        live = [it for it in self._heap if it[self._ALIVE]]
+        return [it[self._ENTRY] for it in heapq.nlargest(k, live, key=lambda it: it[self._SCORE])]
+
+    def add(self, entry):
+        """Inserisce un candidato già ammesso dal chiamante.
+
+        Restituisce 'added', 'replaced' (rimpiazzati il peggiore o i rivali di
+        diversità) oppure 'rejected_diversity'.
+        """
+        score = entry['score']
+        rivals = self._diversity_rivals(entry)
+        if rivals:
+            if score <= max(it[self._SCORE] for it in rivals):
+                return 'rejected_diversity'
+            for it in rivals:
+                self._remove(it)
+            self._push(entry)
+            outcome = 'replaced'
+        elif self._live < self.capacity:
+            self._push(entry)
+            outcome = 'added'
+        else:
+            # Buffer pieno: il nuovo candidato prende il posto del peggiore
+            self._prune(self._heap)
+            self._remove(self._heap[0])
+            self._push(entry)
+            outcome = 'replaced'
+        self._enforce_max_bytes()
+        return outcome
+
+    def _enforce_max_bytes(self):
+        """Rimuove i peggiori finché la memoria stimata rientra in max_bytes."""
+        while self.max_bytes and self.nbytes > self.max_bytes and self._live > 1:
+            self._prune(self._heap)
+            self._remove(self._heap[0])
+
+    # ── interni ────────────────────────────────────────────────────────────
+    def _pose_bin(self, entry):
+        d = self.pose_bin_deg
+        return (int(entry['pitch'] // d), int(entry['yaw'] // d))
+
+    def _diversity_rivals(self, entry):
+        rivals = []
+        if self.min_frame_gap > 0:
+            n = entry['frame_number']
+            for k in range(n - self.min_frame_gap + 1, n + self.min_frame_gap):
+                it = self._by_frame.get(k)
+                if it is not None:
+                    rivals.append(it)
+        if self.pose_bin_deg > 0 and self.max_per_pose_bin > 0:
+            bin_heap, count = self._bins.get(self._pose_bin(entry), ([], 0))
+            if count >= self.max_per_pose_bin:
+                self._prune(bin_heap)
+                if not any(it is bin_heap[0] for it in rivals):
+                    rivals.append(bin_heap[0])
+        return rivals
+
+    def _push(self, entry):
+        if len(self._heap) > 2 * self.capacity:
+            self._compact()
+        item = [entry['score'], next(self._seq), entry, True]
+        heapq.heappush(self._heap, item)
+        self._live += 1
+        self.nbytes += self.entry_nbytes(entry)
+        if self.min_frame_gap > 0:
+            self._by_frame[entry['frame_number']] = item
+        if self.pose_bin_deg > 0 and self.max_per_pose_bin > 0:
+            key = self._pose_bin(entry)
+            bin_heap, count = self._bins.get(key, ([], 0))
+            heapq.heappush(bin_heap, item)
+            self._bins[key] = (bin_heap, count + 1)
+        self.version += 1
+
+    def _remove(self, item):
+        item[self._ALIVE] = False
+        self._live -= 1
+        entry = item[self._ENTRY]
+        self.nbytes -= self.entry_nbytes(entry)
+        if self.min_frame_gap > 0:
+            self._by_frame.pop(entry['frame_number'], None)
+        if self.pose_bin_deg > 0 and self.max_per_pose_bin > 0:
+            key = self._pose_bin(entry)
+            bin_heap, count = self._bins[key]
+            self._bins[key] = (bin_heap, count - 1)
+        self.version += 1
+
+    def _prune(self, heap):
+        while heap and not heap[0][self._ALIVE]:
+            heapq.heappop(heap)
+
+    def _compact(self):
+        """Ricostruisce gli heap senza gli elementi rimossi (liberando i JPEG)."""
+        self._heap = [it for it in self._heap if it[self._ALIVE]]
+        heapq.heapify(self._heap)
+        for key, (bin_heap, count) in list(self._bins.items()):
+            live = [it for it in bin_heap if it[self._ALIVE]]
+            if live:
+                heapq.heapify(live)
+                self._bins[key] = (live, count)
+            else:
+                del self._bins[key]
+
+
+def _atomic_write(path: str, data: bytes):
+    """Scrive un file via file temporaneo + os.replace: mai file parziali su disco."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ResultWriter:
+    """Persistenza dei risultati (JPEG + best_frames_data.json) fuori dall'event loop.
+
+    Un solo thread scrive in ordine di arrivo; un job superato da uno più
+    recente per la stessa cartella di sessione viene saltato (conta solo
+    l'ultima classifica).
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-writer')
+        self._latest = {}  # session_dir -> generazione dell'ultimo job
+        self._lock = threading.Lock()
+        self._generation = itertools.count(1)
+
+    def submit(self, session_dir: str, files: list, json_result: dict):
+        """Accoda la scrittura di files [(nome, bytes)] e del JSON della sessione."""
+        generation = next(self._generation)
+        with self._lock:
+            self._latest[session_dir] = generation
+        return self._executor.submit(self._write, session_dir, generation, files, json_result)
+
+    def _write(self, session_dir, generation, files, json_result):
+        with self._lock:
+            if self._latest.get(session_dir) != generation:
+                return False
+        try:
+            os.makedirs(session_dir, exist_ok=True)
+            for filename, data in files:
+                _atomic_write(os.path.join(session_dir, filename), data)
+            _atomic_write(os.path.join(session_dir, "best_frames_data.json"),
+                          json.dumps(json_result, indent=2, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            logger.error(f"Salvataggio risultati fallito ({session_dir}): {e}")
+            return False
+        finally:
+            with self._lock:
+                if self._latest.get(session_dir) == generation:
+                    del self._latest[session_dir]
+        return True
+
+
+# Writer condiviso da tutti gli scorer del processo
+_result_writer = ResultWriter()
+
+
+# ── Scansione yaw leggera (scan_frame) ───────────────────────────────────────
+# La scan usa un FaceMesh dedicato (senza refine dell'iride, input ≤ 256 px) su
+# un thread proprio: non attende lo scoring di process_frame sul loop e non ne
+# condivide il grafo (MediaPipe non è thread-safe, il thread unico serializza).
+# Con SCAN_TRACKING il FaceMesh della scan lavora in modalità video: MediaPipe
+# riusa come ROI i landmark della scan precedente e salta il face detector
+# finché il tracking regge (su una perdita torna da solo alla detection).
+SCAN_MAX_DIM = 256
+SCAN_TRACKING = os.environ.get('KIMERIKA_WS_SCAN_TRACKING', '1') != '0'
+_scan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='yaw-scan')
+
+
 class WebSocketFrameScorer:
     """Versione WebSocket del FrameScorer"""
     
-    def __init__(self, max_frames=10):
+    # Memoria stimata di un'istanza FaceMesh (grafo TFLite + buffer), usata
+    # solo per la contabilità delle sessioni: non è misurabile per istanza.
+    FACEMESH_BYTES_ESTIMATE = 30 * 1024 * 1024
+    SCAN_FACEMESH_BYTES_ESTIMATE = 20 * 1024 * 1024  # FaceMesh della scan, senza iride
+
+    # ── Inferenza su ROI ─────────────────────────────────────────────────────
+    # Con il telefono su treppiede il volto si sposta poco tra due frame:
+    # FaceMesh gira prima sul ritaglio attorno al volto precedente e solo se lì
+    # non lo trova (o lo trova tagliato dal bordo) ripete sul frame intero.
+    ROI_EXPAND = 0.5        # margine del ritaglio, in frazioni del lato del volto
+    ROI_EDGE_MARGIN = 0.02  # landmark entro il 2% dal bordo del ritaglio → volto tagliato
+    ROI_MAX_AREA = 0.8      # ritaglio oltre l'80% del frame → frame intero direttamente
+
+    def __init__(self, max_frames=10, min_frame_gap=0, pose_bin_deg=0.0, max_per_pose_bin=0,
+                 max_frame_bytes=0):
         self.max_frames = max_frames
-        self.best_frames = []  # Buffer circolare - mantiene solo i migliori
         self.buffer_size = max_frames * 4  # Buffer 4x per catturare più variazioni (40 frame)
+        # Min-heap top-K: mantiene solo i migliori, il peggiore sempre in testa
+        self.best_frames = TopKFrameBuffer(
+            self.buffer_size,
+            min_frame_gap=min_frame_gap,
+            pose_bin_deg=pose_bin_deg,
+            max_per_pose_bin=max_per_pose_bin,
+            max_bytes=max_frame_bytes
+        )
         self.output_dir = "websocket_best_frames"
+        self.session_dir = None
+        self._result_cache = None        # (versione buffer, risultato, byte stimati)
+        self._persisted_signature = None  # classifica top-K già scritta su disco
         self.frames_added = 0
         self.frames_processed = 0  # Contatore frame totali processati
         self.session_id = None
@@ -54,38 +654,70 @@ class WebSocketFrameScorer:
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        # FaceMesh leggero della scansione yaw: creato alla prima scan_frame
+        self._scan_mesh = None
+        self.scans = 0
+        self.scan_avg_ms = None  # media mobile del tempo di scan (misurata a parte)
+        # ROI del volto precedente (x0, y0, x1, y1 normalizzati sul frame) e statistiche
+        self._roi_box = None
+        self.roi_attempts = 0
+        self.roi_hits = 0
+        self.roi_avg_ms = None   # media mobile dell'inferenza sul ritaglio
+        self.full_avg_ms = None  # media mobile dell'inferenza sul frame intero
         
         # Crea directory di output se non esiste
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
     
+    def memory_bytes(self) -> int:
+        """Memoria approssimata trattenuta dallo scorer (modello + frame bufferizzati)."""
+        model = self.FACEMESH_BYTES_ESTIMATE if self.face_mesh is not None else 0
+        if self._scan_mesh is not None:
+            model += self.SCAN_FACEMESH_BYTES_ESTIMATE
+        cache = self._result_cache[2] if self._result_cache else 0
+        return model + self.best_frames.nbytes + cache
+
+    def close(self):
+        """Rilascia FaceMesh e i frame bufferizzati (scorer non più utilizzabile)."""
+        self.best_frames.clear()
+        self._result_cache = None
+        if self.face_mesh is not None:
+            try:
+                self.face_mesh.close()
+            except Exception:
+                pass
+            self.face_mesh = None
+        if self._scan_mesh is not None:
+            # Chiuso sul thread della scan, dopo eventuali scan in corso
+            _scan_executor.submit(self._scan_mesh.close)
+            self._scan_mesh = None
+
     def start_session(self, session_id):
         """Inizia una nuova sessione"""
         self.session_id = session_id
-        self.best_frames = []
+        self.best_frames.clear()
         self.frames_added = 0
         self.frames_processed = 0  # Reset contatore frame
         self.min_score_threshold = 0  # Reset soglia
+        self._result_cache = None
+        self._persisted_signature = None
+        self._roi_box = None
         
-        # Crea sottocartella per la sessione
+        # Sottocartella della sessione: creata dal ResultWriter alla prima scrittura
         self.session_dir = os.path.join(self.output_dir, f"session_{session_id}")
-        if not os.path.exists(self.session_dir):
-            os.makedirs(self.session_dir)
     
-    def get_all_mediapipe_landmarks(self, mediapipe_landmarks, img_width, img_height):
-        """Estrae TUTTI i landmark MediaPipe (468 punti)"""
-        num_landmarks = len(mediapipe_landmarks.landmark)
-        all_landmarks = np.zeros((num_landmarks, 2))
-        
-        for i in range(num_landmarks):
-            landmark = mediapipe_landmarks.landmark[i]
-            x = landmark.x * img_width
-            y = landmark.y * img_height
-            x = max(1, min(img_width-1, x))
-            y = max(1, min(img_height-1, y))
-            all_landmarks[i, 0] = x
-            all_landmarks[i, 1] = y
-        
+    @staticmethod
+    def normalized_landmarks(mediapipe_landmarks) -> np.ndarray:
+        """Landmark MediaPipe come array (N, 2) normalizzato [0,1]."""
+        return np.array([(lm.x, lm.y) for lm in mediapipe_landmarks.landmark], dtype=np.float64)
+
+    def get_all_mediapipe_landmarks(self, mediapipe_landmarks, img_width, img_height, normalized=None):
+        """Estrae TUTTI i landmark MediaPipe (468 punti) in pixel, limitati a [1, lato-1]"""
+        if normalized is None:
+            normalized = self.normalized_landmarks(mediapipe_landmarks)
+        all_landmarks = normalized * (img_width, img_height)
+        np.clip(all_landmarks[:, 0], 1, img_width - 1, out=all_landmarks[:, 0])
+        np.clip(all_landmarks[:, 1], 1, img_height - 1, out=all_landmarks[:, 1])
         return all_landmarks
     
     def calculate_head_pose_from_mediapipe(self, landmarks_array, img_width, img_height):
@@ -240,35 +872,108 @@ class WebSocketFrameScorer:
             'total_center_distance': round(total_distance, 4),
         }
     
+    def _expand_roi(self, norm_landmarks):
+        """ROI per il prossimo frame: bbox dei landmark allargato di ROI_EXPAND."""
+        x_min, y_min = norm_landmarks.min(axis=0)
+        x_max, y_max = norm_landmarks.max(axis=0)
+        dx = (x_max - x_min) * self.ROI_EXPAND
+        dy = (y_max - y_min) * self.ROI_EXPAND
+        return (max(0.0, x_min - dx), max(0.0, y_min - dy), min(1.0, x_max + dx), min(1.0, y_max + dy))
+
+    @staticmethod
+    def _ema(avg, value):
+        return value if avg is None else 0.8 * avg + 0.2 * value
+
+    def _run_face_mesh(self, mp_frame):
+        """FaceMesh sulla ROI del frame precedente, con fallback sul frame intero.
+
+        Restituisce (lista di landmark (N, 2) normalizzati sul frame, True se è bastata la ROI).
+        """
+        mp_h, mp_w = mp_frame.shape[:2]
+        roi = self._roi_box
+        if roi is not None and (roi[2] - roi[0]) * (roi[3] - roi[1]) < self.ROI_MAX_AREA:
+            x0, y0 = int(roi[0] * mp_w), int(roi[1] * mp_h)
+            x1, y1 = int(np.ceil(roi[2] * mp_w)), int(np.ceil(roi[3] * mp_h))
+            crop = mp_frame[y0:y1, x0:x1]
+            if crop.shape[0] > 1 and crop.shape[1] > 1:
+                self.roi_attempts += 1
+                t0 = time.perf_counter()
+                results = self.face_mesh.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+                self.roi_avg_ms = self._ema(self.roi_avg_ms, (time.perf_counter() - t0) * 1000.0)
+                if results.multi_face_landmarks:
+                    local = self.normalized_landmarks(results.multi_face_landmarks[0])
+                    if local.min() > self.ROI_EDGE_MARGIN and local.max() < 1.0 - self.ROI_EDGE_MARGIN:
+                        # Coordinate del ritaglio → coordinate normalizzate del frame
+                        norm = (local * (x1 - x0, y1 - y0) + (x0, y0)) / (mp_w, mp_h)
+                        self.roi_hits += 1
+                        self._roi_box = self._expand_roi(norm)
+                        return [norm], True
+
+        t0 = time.perf_counter()
+        results = self.face_mesh.process(cv2.cvtColor(mp_frame, cv2.COLOR_BGR2RGB))
+        self.full_avg_ms = self._ema(self.full_avg_ms, (time.perf_counter() - t0) * 1000.0)
+        faces = [self.normalized_landmarks(f) for f in results.multi_face_landmarks or []]
+        self._roi_box = self._expand_roi(faces[0]) if faces else None
+        return faces, False
+
+    def roi_stats(self) -> dict:
+        """Quante inferenze sono state risolte sulla ROI e con quali tempi medi."""
+        return {
+            "roi_attempts": self.roi_attempts,
+            "roi_hits": self.roi_hits,
+            "roi_hit_rate": round(self.roi_hits / self.roi_attempts, 3) if self.roi_attempts else None,
+            "roi_avg_ms": round(self.roi_avg_ms, 2) if self.roi_avg_ms else None,
+            "full_avg_ms": round(self.full_avg_ms, 2) if self.full_avg_ms else None,
+        }
+
     async def scan_frame_yaw(self, frame_data):
         """Calcola solo il yaw di un frame senza salvarlo nel buffer.
         Usato per la scansione rapida in Fase 1 dell'analisi video.
-        Accetta frame piccoli (160px) per massima velocità.
-        Restituisce {'yaw': float|None, 'faces_detected': int}."""
+        Gira sul thread della scan con il FaceMesh leggero (vedi SCAN_MAX_DIM).
+        Restituisce {'yaw': float|None, 'faces_detected': int, 'scan_ms': float}."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_scan_executor, self._scan_frame_yaw_sync, frame_data)
+
+    def _scan_frame_yaw_sync(self, frame_data):
+        t0 = time.perf_counter()
+        result = {"yaw": None, "faces_detected": 0}
         try:
-            frame_bytes = base64.b64decode(frame_data)
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if self.face_mesh is None:
+                return result  # scorer chiuso dal reaper
+            incoming = frame_data if isinstance(frame_data, IncomingFrame) else IncomingFrame(frame_data)
+            frame = incoming.image_for(SCAN_MAX_DIM)
             if frame is None:
-                return {"yaw": None, "faces_detected": 0}
+                return result
             h, w = frame.shape[:2]
-            # Scala a max 160px (già piccolo, ma assicura consistenza)
-            SCAN_MAX_DIM = 160
             if max(h, w) > SCAN_MAX_DIM:
                 scale = SCAN_MAX_DIM / max(h, w)
                 frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
                 h, w = frame.shape[:2]
+            if self._scan_mesh is None:
+                self._scan_mesh = self.mp_face_mesh.FaceMesh(
+                    static_image_mode=not SCAN_TRACKING,
+                    max_num_faces=1,
+                    refine_landmarks=False,
+                    min_detection_confidence=0.5,
+                    min_tracking_confidence=0.5
+                )
             rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.face_mesh.process(rgb)
+            results = self._scan_mesh.process(rgb)
             if not results.multi_face_landmarks:
-                return {"yaw": None, "faces_detected": 0}
+                return result
             lm_raw = results.multi_face_landmarks[0]
             all_lm = self.get_all_mediapipe_landmarks(lm_raw, w, h)
             pose = self.calculate_head_pose_from_mediapipe(all_lm, w, h)
-            return {"yaw": round(float(pose[1]), 3), "faces_detected": 1}
+            result.update(yaw=round(float(pose[1]), 3), faces_detected=1)
+            return result
         except Exception as e:
             logger.debug(f"scan_frame_yaw errore: {e}")
-            return {"yaw": None, "faces_detected": 0}
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            result['scan_ms'] = round(elapsed_ms, 2)
+            self.scans += 1
+            self.scan_avg_ms = elapsed_ms if self.scan_avg_ms is None else 0.8 * self.scan_avg_ms + 0.2 * elapsed_ms
 
     async def process_frame(self, frame_data):
         """Processa un singolo frame ricevuto dal client"""
@@ -277,38 +982,41 @@ class WebSocketFrameScorer:
             self.frames_processed += 1
             current_frame_number = self.frames_processed
 
-            # Decodifica il frame da base64
-            frame_bytes = base64.b64decode(frame_data)
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Decodifica il frame una sola volta (IncomingFrame, bytes binari o base64 legacy),
+            # direttamente alla risoluzione ridotta utile a MediaPipe
+            MEDIAPIPE_MAX_DIM = 640
+            incoming = frame_data if isinstance(frame_data, IncomingFrame) else IncomingFrame(frame_data)
+            frame = incoming.image_for(MEDIAPIPE_MAX_DIM)
 
             if frame is None:
                 return {"error": "Impossibile decodificare il frame"}
 
-            h, w = frame.shape[:2]
+            w, h = incoming.size  # dimensioni originali, anche se decodificato ridotto
 
             # ── RESIZE PER MEDIAPIPE ──────────────────────────────────────────
             # MediaPipe è ottimizzato per immagini ~640px: su frame ad alta
             # risoluzione (>1280px) il calcolo diventa molto lento senza
             # alcun guadagno di accuratezza. Facciamo il resize SOLO per
             # il rilevamento; conserviamo il frame originale per la restituzione.
-            MEDIAPIPE_MAX_DIM = 640
             if max(h, w) > MEDIAPIPE_MAX_DIM:
                 scale = MEDIAPIPE_MAX_DIM / max(h, w)
                 mp_w = int(w * scale)
                 mp_h = int(h * scale)
-                mp_frame = cv2.resize(frame, (mp_w, mp_h), interpolation=cv2.INTER_AREA)
+                if frame.shape[:2] == (mp_h, mp_w):
+                    mp_frame = frame  # la decodifica ridotta ha già la dimensione giusta
+                else:
+                    mp_frame = cv2.resize(frame, (mp_w, mp_h), interpolation=cv2.INTER_AREA)
             else:
                 mp_frame = frame
-                mp_w, mp_h = w, h
+                mp_w, mp_h = frame.shape[1], frame.shape[0]
             # ─────────────────────────────────────────────────────────────────
 
-            # Processa con MediaPipe sul frame ridotto
-            rgb_frame = cv2.cvtColor(mp_frame, cv2.COLOR_BGR2RGB)
-            results = self.face_mesh.process(rgb_frame)
+            # Processa con MediaPipe sul frame ridotto (prima sulla ROI del volto precedente)
+            faces, roi_hit = self._run_face_mesh(mp_frame)
 
-            faces_found = len(results.multi_face_landmarks) if results.multi_face_landmarks else 0
-            logger.info(f"[FRAME #{current_frame_number:04d}] orig={w}x{h} mp={mp_w}x{mp_h} volti={faces_found}")
+            faces_found = len(faces)
+            logger.info(f"[FRAME #{current_frame_number:04d}] orig={w}x{h} mp={mp_w}x{mp_h} "
+                        f"volti={faces_found}{' roi' if roi_hit else ''}")
             
             response = {
                 "frame_processed": True,
@@ -317,10 +1025,11 @@ class WebSocketFrameScorer:
                 "total_frames_collected": len(self.best_frames)
             }
             
-            if results.multi_face_landmarks:
-                for face_landmarks in results.multi_face_landmarks:
+            if faces:
+                for norm_landmarks in faces:
                     # Estrai landmark usando le dimensioni del frame ridotto (per MediaPipe)
-                    all_landmarks = self.get_all_mediapipe_landmarks(face_landmarks, mp_w, mp_h)
+                    all_landmarks = self.get_all_mediapipe_landmarks(None, mp_w, mp_h,
+                                                                     normalized=norm_landmarks)
 
                     if len(all_landmarks) >= 6:
                         # Calcola bounding box nel frame ridotto
@@ -362,9 +1071,15 @@ class WebSocketFrameScorer:
                                 })
                                 return response
                             
-                            # Aggiungi frame al sistema di scoring
+                            # Aggiungi frame al sistema di scoring.
+                            # Conserviamo i byte JPEG (≈10x più leggeri del BGR
+                            # decodificato) e i landmark riportati alla risoluzione originale:
+                            # get_best_frames_result li restituisce senza decode/re-encode.
+                            # 'jpeg' si aggiunge solo se il frame entra nel buffer: un frame
+                            # ruotato viene decodificato a piena risoluzione solo in quel caso.
                             frame_data = {
-                                'frame': frame.copy(),
+                                'image_size': (w, h),
+                                'landmarks': (all_landmarks * (w / mp_w)).astype(np.float32),
                                 'frame_number': current_frame_number,  # Numero frame originale
                                 'score': score,
                                 'timestamp': time.time(),
@@ -384,86 +1099,44 @@ class WebSocketFrameScorer:
                             if is_excellent:                        reason = "EXCELLENT(>=75)"
                             elif score >= self.min_score_threshold: reason = "SCORE_OK"
 
-                            if len(self.best_frames) < self.buffer_size:
-                                # Buffer non pieno - aggiungi se supera soglia minima
-                                if reason:
-                                    self.best_frames.append(frame_data)
-                                    self.frames_added += 1
+                            pose_log = f"P={head_pose[0]:.1f}° Y={head_pose[1]:.1f}° R={head_pose[2]:.1f}°"
+                            if reason:
+                                frame_data['jpeg'] = incoming.jpeg  # re-encode solo se trasformato
+                                was_full = len(self.best_frames) >= self.buffer_size
+                                outcome = self.best_frames.add(frame_data)
+                                if outcome == 'rejected_diversity':
                                     logger.info(
-                                        f"[FRAME #{current_frame_number:04d}] ACCETTATO({reason}) "
-                                        f"score={score:.1f} pose_s={score_details['pose_score']:.1f} "
-                                        f"size_s={score_details['size_score']:.1f} "
-                                        f"P={head_pose[0]:.1f}° Y={head_pose[1]:.1f}° R={head_pose[2]:.1f}° "
-                                        f"buf={len(self.best_frames)}/{self.buffer_size} thr={self.min_score_threshold:.1f}"
+                                        f"[FRAME #{current_frame_number:04d}] SCARTATO(DIVERSITÀ) "
+                                        f"score={score:.1f} {pose_log}"
                                     )
-                                    # Riordina e aggiorna soglia quando raggiungi buffer_size
-                                    if len(self.best_frames) == self.buffer_size:
-                                        self.best_frames.sort(key=lambda x: x['score'], reverse=True)
-                                        self.min_score_threshold = max(50, self.best_frames[-1]['score'])
-                                        logger.info(f"[BUFFER PIENO] soglia aggiornata → {self.min_score_threshold:.1f}")
                                 else:
+                                    self.frames_added += 1
+                                    label = "SOSTITUZIONE" if outcome == 'replaced' else "ACCETTATO"
                                     logger.info(
-                                        f"[FRAME #{current_frame_number:04d}] SCARTATO "
-                                        f"score={score:.1f} < thr={self.min_score_threshold:.1f} "
-                                        f"P={head_pose[0]:.1f}° Y={head_pose[1]:.1f}° R={head_pose[2]:.1f}°"
+                                        f"[FRAME #{current_frame_number:04d}] {label}({reason}) "
+                                        f"score={score:.1f} pose_s={score_details['pose_score']:.1f} "
+                                        f"size_s={score_details['size_score']:.1f} {pose_log} "
+                                        f"buf={len(self.best_frames)}/{self.buffer_size} thr={self.min_score_threshold:.1f}"
                                     )
-                            elif reason:
-                                # Buffer pieno - sostituisci il peggiore se questo è migliore O se è eccellente/frontale
-                                logger.info(
-                                    f"[FRAME #{current_frame_number:04d}] SOSTITUZIONE({reason}) "
-                                    f"score={score:.1f} pose_s={score_details['pose_score']:.1f} "
-                                    f"size_s={score_details['size_score']:.1f} "
-                                    f"P={head_pose[0]:.1f}° Y={head_pose[1]:.1f}° R={head_pose[2]:.1f}°"
-                                )
-                                self.best_frames[-1] = frame_data
-                                self.frames_added += 1
-                                
-                                # Riordina e aggiorna soglia
-                                self.best_frames.sort(key=lambda x: x['score'], reverse=True)
-                                self.min_score_threshold = max(50, self.best_frames[-1]['score'])
+                                    # A buffer pieno la soglia segue il peggiore in testa all'heap: O(1)
+                                    if len(self.best_frames) >= self.buffer_size:
+                                        self.min_score_threshold = max(50, self.best_frames.min_score())
+                                        if not was_full:
+                                            logger.info(f"[BUFFER PIENO] soglia aggiornata → {self.min_score_threshold:.1f}")
                             else:
                                 logger.info(
                                     f"[FRAME #{current_frame_number:04d}] SCARTATO "
-                                    f"score={score:.1f} < thr={self.min_score_threshold:.1f} "
-                                    f"P={head_pose[0]:.1f}° Y={head_pose[1]:.1f}° R={head_pose[2]:.1f}°"
+                                    f"score={score:.1f} < thr={self.min_score_threshold:.1f} {pose_log}"
                                 )
                             
                             # Roll già in range naturale dall'approccio geometrico
                             normalized_roll_display = head_pose[2]
 
-                            # ── LANDMARK COMPATTI PER OVERLAY LIVE ───────────────────────
-                            # Inviamo i landmark normalizzati [0,1] come lista flat [x0,y0,x1,y1,...]
-                            # Solo i punti necessari al rendering: contorno viso, occhi, naso, bocca.
-                            # Gruppi: OVAL(36), L_EYE(16), R_EYE(16), NOSE(9), L_BROW(10), R_BROW(10)
-                            LM_GROUPS = {
-                                # Oval: contorno viso sinistro→alto→destro→basso
-                                'oval': [10,338,297,332,284,251,389,356,454,323,361,288,
-                                         397,365,379,378,400,377,152,148,176,149,150,136,
-                                         172,58,132,93,234,127,162,21,54,103,67,109],
-                                # Occhio sinistro (esterno → interno)
-                                'l_eye': [33,7,163,144,145,153,154,155,133,173,157,158,159,160,161,246],
-                                # Occhio destro
-                                'r_eye': [362,382,381,380,374,373,390,249,263,466,388,387,386,385,384,398],
-                                # Naso (ponte + punta + narici)
-                                'nose': [168,6,197,195,5,4,45,220,115,48],
-                                # Sopracciglio sinistro
-                                'l_brow': [276,283,282,295,285,300,293,334,296,336],
-                                # Sopracciglio destro
-                                'r_brow': [46,53,52,65,55,70,63,105,66,107],
-                                # Bocca (labbro esterno)
-                                'mouth': [61,146,91,181,84,17,314,405,321,375,291,
-                                          308,324,318,402,317,14,87,178,88,95],
-                            }
-                            lm_out = {}
-                            for group, indices in LM_GROUPS.items():
-                                coords = []
-                                for idx in indices:
-                                    if idx < len(face_landmarks.landmark):
-                                        lm = face_landmarks.landmark[idx]
-                                        coords.append(round(lm.x, 4))
-                                        coords.append(round(lm.y, 4))
-                                lm_out[group] = coords
-                            # ─────────────────────────────────────────────────────────────
+                            # Landmark per overlay live: un solo gather sugli indici di LM_GROUPS.
+                            # Restano ndarray normalizzati: la codifica (float, int16, JSON o
+                            # binario) la sceglie chi invia, in base al client.
+                            lm_out = (norm_landmarks[LM_GATHER_INDEX]
+                                      if len(norm_landmarks) > LM_GATHER_INDEX.max() else None)
 
                             response.update({
                                 "faces_detected": 1,
@@ -479,7 +1152,8 @@ class WebSocketFrameScorer:
                                     "position_score": round(score_details['position_score'], 2),
                                     "face_ratio": round(score_details['face_ratio'], 4)
                                 },
-                                "landmarks": lm_out
+                                "landmarks": lm_out,
+                                "image_size": [w, h]
                             })
             
             return response
@@ -488,16 +1162,27 @@ class WebSocketFrameScorer:
             logger.error(f"Errore processing frame: {e}")
             return {"error": f"Errore nel processing: {str(e)}"}
     
-    def get_best_frames_result(self):
-        """Restituisce i migliori 10 frame e il JSON"""
+    def get_best_frames_result(self, final=False):
+        """Restituisce i migliori 10 frame e il JSON.
+
+        La risposta è costruita dalla memoria (e riusata finché il buffer non
+        cambia); la scrittura su disco è affidata al ResultWriter e avviene solo
+        per i risultati finali o quando la classifica top-K è cambiata.
+        """
         if len(self.best_frames) == 0:
             return {"error": "Nessun frame processato"}
 
+        cached = self._result_cache
+        if cached is not None and cached[0] == self.best_frames.version:
+            result = cached[1]
+            if final:
+                self._persist(result['_files'], result['json_data'], final=True)
+            return {k: v for k, v in result.items() if k != '_files'}
+
         # ✅ COPIA ATOMICA: Ordina e copia il buffer per evitare race condition
         # Durante la preparazione della risposta, process_frame() potrebbe modificare il buffer
         # Creando una copia snapshot garantiamo che frames_base64 e frames_data siano coerenti
-        self.best_frames.sort(key=lambda x: x['score'], reverse=True)
-        best_frames_snapshot = [frame.copy() for frame in self.best_frames[:self.max_frames]]
+        best_frames_snapshot = [frame.copy() for frame in self.best_frames.top(self.max_frames)]
 
         # Usa lo snapshot invece del buffer originale
         best_frames = best_frames_snapshot
@@ -506,15 +1191,14 @@ class WebSocketFrameScorer:
         frames_base64 = []
         frames_data = []
         
+        files = []
+        
         for i, frame_data in enumerate(best_frames):
-            # Salva frame come immagine (qualità 97 per massima fedeltà - vicino a successo.jpg)
+            # Byte JPEG originali del client: nessuna perdita da re-encode
             filename = f"frame_{i+1:02d}.jpg"
-            filepath = os.path.join(self.session_dir, filename)
-            cv2.imwrite(filepath, frame_data['frame'], [cv2.IMWRITE_JPEG_QUALITY, 97])
+            files.append((filename, frame_data['jpeg']))
             
-            # Converti frame in base64 per la risposta (qualità 97 per preservare dettagli LB/RB)
-            _, buffer = cv2.imencode('.jpg', frame_data['frame'], [cv2.IMWRITE_JPEG_QUALITY, 97])
-            frame_b64 = base64.b64encode(buffer).decode('utf-8')
+            frame_b64 = base64.b64encode(frame_data['jpeg']).decode('utf-8')
             frames_base64.append({
                 'filename': filename,
                 'data': frame_b64,
@@ -528,6 +1212,10 @@ class WebSocketFrameScorer:
                 'rank': frame_data.get('frame_number', i + 1),
                 'total_score': round(frame_data['score'], 2),
                 'timestamp': frame_data['timestamp'],
+                'image_size': {
+                    'width': int(frame_data['image_size'][0]),
+                    'height': int(frame_data['image_size'][1])
+                },
                 'pose': {
                     'pitch': round(frame_data['pitch'], 2),
                     'yaw': round(frame_data['yaw'], 2),
@@ -551,20 +1239,22 @@ class WebSocketFrameScorer:
             }
             frames_data.append(json_data)
         
-        # ── RIEPILGO TOP-10 SU LOG ──────────────────────────────────────────────
-        logger.info("=" * 72)
-        logger.info(f"TOP-{len(best_frames)} FRAMES SELEZIONATI (sessione {self.session_id})")
-        logger.info(f"{'Rank':>4}  {'Frame':>6}  {'Score':>6}  {'Pose':>5}  {'Size':>5}  {'Pos':>5}  {'Pitch':>7}  {'Yaw':>7}  {'Roll':>7}")
-        logger.info("-" * 72)
-        for i, fd in enumerate(best_frames):
-            sd = fd['score_details']
-            logger.info(
-                f"{i+1:>4}  #{fd.get('frame_number',i+1):>5}  "
-                f"{fd['score']:>6.2f}  {sd['pose_score']:>5.1f}  "
-                f"{sd['size_score']:>5.1f}  {sd['position_score']:>5.1f}  "
-                f"{fd['pitch']:>+7.2f}°  {fd['yaw']:>+7.2f}°  {fd['roll']:>+7.2f}°"
-            )
-        logger.info("=" * 72)
+        # ── RIEPILGO TOP-10 SU LOG (solo se la classifica è cambiata) ──────────
+        signature = tuple((fd.get('frame_number'), fd['score']) for fd in best_frames)
+        if signature != self._persisted_signature:
+            logger.info("=" * 72)
+            logger.info(f"TOP-{len(best_frames)} FRAMES SELEZIONATI (sessione {self.session_id})")
+            logger.info(f"{'Rank':>4}  {'Frame':>6}  {'Score':>6}  {'Pose':>5}  {'Size':>5}  {'Pos':>5}  {'Pitch':>7}  {'Yaw':>7}  {'Roll':>7}")
+            logger.info("-" * 72)
+            for i, fd in enumerate(best_frames):
+                sd = fd['score_details']
+                logger.info(
+                    f"{i+1:>4}  #{fd.get('frame_number',i+1):>5}  "
+                    f"{fd['score']:>6.2f}  {sd['pose_score']:>5.1f}  "
+                    f"{sd['size_score']:>5.1f}  {sd['position_score']:>5.1f}  "
+                    f"{fd['pitch']:>+7.2f}°  {fd['yaw']:>+7.2f}°  {fd['roll']:>+7.2f}°"
+                )
+            logger.info("=" * 72)
         # ────────────────────────────────────────────────────────────────────────
 
         # Crea JSON finale
@@ -588,12 +1278,10 @@ class WebSocketFrameScorer:
             'frames': frames_data
         }
         
-        # Salva JSON su file
-        json_filepath = os.path.join(self.session_dir, "best_frames_data.json")
-        with open(json_filepath, 'w', encoding='utf-8') as f:
-            json.dump(json_result, f, indent=2, ensure_ascii=False)
+        # Scrittura su disco in background (JPEG + JSON), mai nell'event loop
+        self._persist(files, json_result, final=final, signature=signature)
         
-        return {
+        result = {
             "success": True,
             "session_id": self.session_id,
             "frames_count": len(best_frames),
@@ -602,50 +1290,698 @@ class WebSocketFrameScorer:
             "json_data": json_result,
             "files_saved_to": self.session_dir
         }
+        cache_nbytes = sum(len(f['data']) for f in frames_base64)
+        self._result_cache = (self.best_frames.version, {**result, '_files': files}, cache_nbytes)
+        return result
+
+    def _persist(self, files, json_result, final=False, signature=None):
+        """Accoda la scrittura se il risultato è finale o la classifica top-K è cambiata."""
+        if signature is None:
+            signature = self._persisted_signature
+        if self.session_dir is None or (not final and signature == self._persisted_signature):
+            return
+        self._persisted_signature = signature
+        _result_writer.submit(self.session_dir, files, json_result)
 
 # === STRUTTURA SESSIONI ISOLATE PER UTENTE ===
 # Ogni entry: session_token -> {
 #   'desktop_ws': websocket | None,
+#   'desktop_binary': bool (desktop registrato con protocollo binario),
+#   'desktop_landmarks': codifica landmark per il desktop (LANDMARK_ENCODINGS),
+#   'preview': {max_width, max_fps, quality} | None (anteprima dichiarata dal desktop),
 #   'active_webcam': bool,
 #   'iphone_devices': { device_id: { websocket, connected_at, user_agent, last_frame } },
 #   'frame_scorer': WebSocketFrameScorer,
-#   'created_at': float
+#   'ingest_slot': LatestFrameSlot,
+#   'ingest_worker': asyncio.Task | None,
+#   'created_at': float,
+#   'token': str,
+#   'desktop_worker', 'shared_iphones', 'scorer_worker', 'webcam_epoch'
+#       (vista dello stato condiviso, vedi sotto)
 # }
+# I websocket, lo scorer e lo slot sono locali al worker; i campi condivisi
+# (SHARED_SESSION_FIELDS + membership) sono una copia dello store.
 _user_sessions: dict = {}
 SESSION_TTL = 3600  # 1 ora di inattività → rimozione automatica
 
+# ── Reaper sessioni e limiti di memoria ──────────────────────────────────────
+# Il reaper gira in background: rimuove le sessioni scadute e, oltre il tetto
+# globale, libera le sessioni inattive (nessun desktop né iPhone connesso)
+# a partire da quella inattiva da più tempo. Le stime sono approssimate:
+# FaceMesh a forfait + byte dei JPEG/landmark bufferizzati + frame in attesa.
+REAPER_INTERVAL = 30.0  # secondi tra due passate del reaper
+SESSION_MEMORY_LIMIT = int(os.environ.get('KIMERIKA_WS_MEMORY_LIMIT_MB', 2048)) * 1024 * 1024
+SESSION_MAX_FRAME_BYTES = int(os.environ.get('KIMERIKA_WS_SESSION_FRAMES_MB', 32)) * 1024 * 1024
+ADMIN_TOKEN = os.environ.get('KIMERIKA_WS_ADMIN_TOKEN')  # se impostato, richiesto da admin_status
+
+# ── Store condiviso multi-worker ─────────────────────────────────────────────
+# Lo stato condivisibile vive in session_store (memory:// di default, file://
+# o redis:// per più worker dietro load balancer). Documento per token: {
+#   'created_at', 'last_activity', 'webcam_epoch',
+#   'active_webcam', 'operator_lying', 'desktop_binary', 'desktop_landmarks', 'preview',
+#   'desktop': {'worker'} | None,
+#   'iphones': { device_id: {'worker', 'connected_at', 'user_agent', 'last_frame'} },
+#   'scorer': {'worker', 'session_id'}   (worker che possiede il buffer dei frame)
+# }
+# Il percorso caldo (iphone_frame) legge solo la copia locale: lo store viene
+# scritto sulle azioni di controllo e i worker coinvolti ricevono un 'sync'.
+WORKER_ID = os.environ.get('KIMERIKA_WS_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+SESSION_STORE_URL = os.environ.get('KIMERIKA_WS_SESSION_STORE', 'memory://')
+WORKER_HEARTBEAT_INTERVAL = 5.0  # secondi tra due heartbeat del worker
+WORKER_TTL = 15.0                # worker senza heartbeat da 15 s → membership ignorate
+STORE_PRUNE_INTERVAL = 60.0      # secondi tra due pulizie delle sessioni scadute nello store
+SHARED_SESSION_FIELDS = ('active_webcam', 'operator_lying', 'desktop_binary', 'desktop_landmarks', 'preview')
+_session_store = create_session_store(SESSION_STORE_URL)
+_live_workers: set = {WORKER_ID}
+
+# ── Flow control iPhone → server ─────────────────────────────────────────────
+FLOW_CONTROL_INTERVAL = 1.0   # secondi tra due messaggi 'flow_control' allo stesso iPhone
+FLOW_CONTROL_MIN_FPS = 2      # mai chiedere meno di 2 fps (il coaching resta reattivo)
+FLOW_CONTROL_MAX_FPS = 30     # tetto della camera (getUserMedia frameRate max)
+FLOW_CONTROL_HEADROOM = 0.85  # usa l'85% della capacità misurata
+
+# ── Target di cattura negoziato dal server ───────────────────────────────────
+# Ogni flow_control porta un 'target' {fps, max_dim, quality} calcolato dal
+# carico dell'intero processo: tutti gli stream condividono lo stesso event
+# loop, quindi ogni stream riceve una quota equa del tempo di inferenza.
+# Risoluzione e qualità scendono/salgono di un livello per intervallo
+# (isteresi) in base a utilizzo, coda di inferenza e frame scartati.
+CAPTURE_LEVELS = ((1280, 85), (960, 75), (720, 70), (640, 65), (480, 60))  # (lato max px, qualità JPEG)
+CAPTURE_STEP_DOWN_LOAD = 0.90   # utilizzo stimato oltre cui si scende di livello
+CAPTURE_STEP_UP_LOAD = 0.60     # utilizzo sotto cui si risale
+CAPTURE_STEP_DOWN_DROPS = 0.25  # frazione di frame scartati nell'ultimo intervallo
+CAPTURE_STREAM_IDLE = 2.0       # secondi senza frame → stream non più attivo
+
+# ── Anteprima iPhone → desktop ───────────────────────────────────────────────
+# Il desktop dichiara {max_width, max_fps, quality} con 'preview' in start_webcam /
+# register_desktop o con l'azione 'preview_config'. Senza dichiarazione il frame
+# viene inoltrato così com'è (comportamento storico), ma sempre sotto watermark.
+PREVIEW_WRITE_WATERMARK = 512 * 1024  # byte in coda sul socket desktop oltre cui non si inoltra
+PREVIEW_FULL_RES_SCORE = 92           # nuovo miglior frame ≥ 92: inoltrato a piena risoluzione
+PREVIEW_DEFAULT_QUALITY = 70
+
+
+class LatestFrameSlot:
+    """Slot di ingestione "latest-frame-wins" per gli iphone_frame di una sessione.
+
+    Il loop di lettura del WebSocket deposita qui ogni frame ricevuto e torna
+    subito a leggere: il buffer del socket viene così svuotato a velocità di rete.
+    Il worker della sessione preleva sempre e solo il frame più recente; un frame
+    ancora in attesa quando ne arriva uno nuovo viene scartato e contato.
+    """
+
+    def __init__(self):
+        self._pending = None
+        self._event = asyncio.Event()
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.avg_process_ms = None  # media mobile esponenziale del tempo di scoring
+        self.last_flow_control = 0.0
+        self.arrival_fps = 0.0      # media mobile del rate di arrivo
+        self.last_arrival = 0.0
+        self.target_level = 0       # indice in CAPTURE_LEVELS
+        self._interval_start = (0, 0)  # (ricevuti, scartati) all'ultimo flow_control
+
+    def record_arrival(self):
+        """Aggiorna la media mobile del rate di arrivo dei frame (alpha = 0.2)."""
+        now = time.time()
+        if self.last_arrival:
+            dt = max(1e-3, now - self.last_arrival)
+            self.arrival_fps = 0.8 * self.arrival_fps + 0.2 * (1.0 / dt)
+        self.last_arrival = now
+
+    def is_streaming(self, now: float) -> bool:
+        return now - self.last_arrival < CAPTURE_STREAM_IDLE
+
+    def has_pending(self) -> bool:
+        return self._pending is not None
+
+    def utilisation(self) -> float:
+        """Frazione di un secondo di event loop consumata da questo stream."""
+        if not self.avg_process_ms:
+            return 0.0
+        return min(1.0, self.arrival_fps * self.avg_process_ms / 1000.0)
+
+    def interval_drop_ratio(self) -> float:
+        """Frazione di frame scartati dall'ultimo flow_control (e nuovo intervallo)."""
+        received0, dropped0 = self._interval_start
+        received = self.frames_received - received0
+        dropped = self.frames_dropped - dropped0
+        self._interval_start = (self.frames_received, self.frames_dropped)
+        return dropped / received if received else 0.0
+
+    def put(self, item):
+        """Deposita un frame; sostituisce (e conta come scartato) quello in attesa."""
+        if self._pending is not None:
+            self.frames_dropped += 1
+        self._pending = item
+        self.frames_received += 1
+        self.record_arrival()
+        self._event.set()
+
+    async def get(self):
+        """Attende e restituisce il frame più recente non ancora processato."""
+        while self._pending is None:
+            self._event.clear()
+            await self._event.wait()
+        item, self._pending = self._pending, None
+        return item
+
+    def record_processing(self, elapsed_ms: float):
+        """Aggiorna la media mobile del tempo di elaborazione (alpha = 0.2)."""
+        self.frames_processed += 1
+        if self.avg_process_ms is None:
+            self.avg_process_ms = elapsed_ms
+        else:
+            self.avg_process_ms = 0.8 * self.avg_process_ms + 0.2 * elapsed_ms
+
+    def sustainable_fps(self) -> int:
+        """Frame al secondo che il server riesce a reggere per questa sessione."""
+        if not self.avg_process_ms:
+            return FLOW_CONTROL_MAX_FPS
+        fps = int(1000.0 / self.avg_process_ms * FLOW_CONTROL_HEADROOM)
+        return max(FLOW_CONTROL_MIN_FPS, min(FLOW_CONTROL_MAX_FPS, fps))
+
+    def pending_nbytes(self) -> int:
+        """Byte del frame in attesa di elaborazione (0 se lo slot è vuoto)."""
+        if self._pending is None:
+            return 0
+        return len(self._pending.get('frame_data') or b'')
+
+    def stats(self) -> dict:
+        return {
+            "frames_received": self.frames_received,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            "avg_process_ms": round(self.avg_process_ms, 1) if self.avg_process_ms else None,
+        }
+
+
 def _get_or_create_session(session_token: str) -> dict:
     """Restituisce la sessione per il token, creandola se non esiste."""
     if session_token not in _user_sessions:
         _user_sessions[session_token] = {
             'desktop_ws': None,
+            'desktop_binary': False,
+            'desktop_landmarks': 'float',
+            'preview': None,
+            'preview_last_sent': 0.0,
+            'preview_best_score': 0.0,
+            'preview_skipped': 0,
             'active_webcam': False,
             'iphone_devices': {},
-            'frame_scorer': WebSocketFrameScorer(),
+            'frame_scorer': WebSocketFrameScorer(max_frame_bytes=SESSION_MAX_FRAME_BYTES),
+            'ingest_slot': LatestFrameSlot(),
+            'ingest_worker': None,
             'created_at': time.time(),
             'last_activity': time.time(),
+            'activity_synced': 0.0,
+            'token': session_token,
+            'desktop_worker': None,
+            'shared_iphones': {},
+            'scorer_worker': None,
+            'webcam_epoch': None,
         }
     else:
         _user_sessions[session_token]['last_activity'] = time.time()
     return _user_sessions[session_token]
 
+async def _attach_session(session_token: str) -> dict:
+    """Come _get_or_create_session, ma una sessione nuova per questo worker
+    riprende lo stato condiviso dallo store (altro worker o riavvio)."""
+    fresh = session_token not in _user_sessions
+    sess = _get_or_create_session(session_token)
+    if fresh:
+        state = await _session_store.load(session_token)
+        if state:
+            sess['created_at'] = state.get('created_at', sess['created_at'])
+            _apply_shared_state(sess, state)
+    return sess
+
+def _apply_shared_state(session: dict, state: dict):
+    """Allinea la copia locale allo stato condiviso letto dallo store."""
+    for field in SHARED_SESSION_FIELDS:
+        if field in state:
+            session[field] = state[field]
+    if state.get('webcam_epoch') != session.get('webcam_epoch'):
+        # Nuova sessione webcam avviata (anche da un altro worker)
+        session['webcam_epoch'] = state.get('webcam_epoch')
+        session['preview_best_score'] = 0.0
+    session['desktop_worker'] = (state.get('desktop') or {}).get('worker')
+    session['shared_iphones'] = {
+        did: info for did, info in (state.get('iphones') or {}).items()
+        if info.get('worker') in _live_workers
+    }
+    session['scorer_worker'] = (state.get('scorer') or {}).get('worker')
+
+def _session_workers(session: dict) -> set:
+    """Worker vivi (diversi da questo) che ospitano desktop, iPhone o scorer della sessione."""
+    workers = {session.get('desktop_worker'), session.get('scorer_worker')}
+    workers.update(info.get('worker') for info in session.get('shared_iphones', {}).values())
+    return (workers & _live_workers) - {WORKER_ID}
+
+async def _commit_session(session: dict, mutate=None, **fields) -> dict:
+    """Scrive nello store i campi indicati (e la mutazione di membership) e
+    invia 'sync' agli altri worker coinvolti nella sessione."""
+    now = time.time()
+
+    def _mutate(state):
+        state.setdefault('created_at', session['created_at'])
+        state['last_activity'] = max(state.get('last_activity', 0), now)
+        state.update(fields)
+        iphones = state.setdefault('iphones', {})
+        for did in [d for d, info in iphones.items() if info.get('worker') not in _live_workers]:
+            del iphones[did]
+        if mutate is not None:
+            mutate(state)
+
+    state = await _session_store.update(session['token'], _mutate)
+    before = _session_workers(session)
+    _apply_shared_state(session, state)
+    for worker in before | _session_workers(session):
+        await _relay(worker, {'kind': 'sync', 'token': session['token']})
+    return state
+
+async def _relay(worker_id: str, message: dict):
+    """Recapita un messaggio a un altro worker tramite lo store."""
+    message['from'] = WORKER_ID
+    try:
+        await _session_store.publish(worker_id, message)
+    except Exception as e:
+        logger.warning(f"Relay verso {worker_id} fallito: {e}")
+
+def _evict_session(token: str, reason: str):
+    """Rimuove una sessione locale: ferma il worker e rilascia FaceMesh e frame."""
+    sess = _user_sessions.pop(token, None)
+    if sess is None:
+        return
+    logger.info(f"Rimossa sessione {reason}: {token[:8]}... ({_session_memory_bytes(sess) // 1024} KB)")
+    worker = sess.get('ingest_worker')
+    if worker is not None:
+        worker.cancel()
+    sess['frame_scorer'].close()
+
 def _cleanup_stale_sessions():
     """Rimuove sessioni scadute (inattive da più di SESSION_TTL secondi)."""
     now = time.time()
     stale = [t for t, s in _user_sessions.items()
              if now - s.get('last_activity', s['created_at']) > SESSION_TTL]
     for t in stale:
-        logger.info(f"Rimossa sessione scaduta: {t[:8]}...")
-        del _user_sessions[t]
+        _evict_session(t, "scaduta")
+
+def _session_memory_bytes(sess: dict) -> int:
+    """Memoria approssimata trattenuta da una sessione locale."""
+    return sess['frame_scorer'].memory_bytes() + sess['ingest_slot'].pending_nbytes()
+
+def _session_is_idle(sess: dict) -> bool:
+    """Nessun client connesso a questo worker per la sessione."""
+    return sess.get('desktop_ws') is None and not sess['iphone_devices']
 
-async def _send_to_desktop(session: dict, message: dict):
-    """Invia un messaggio al desktop di una sessione specifica."""
+# Statistiche degli stream process_frame dei desktop (una per connessione)
+_desktop_streams: set = set()
+
+def _active_capture_streams(now: float) -> list:
+    """Stream (slot iPhone e desktop process_frame) che hanno inviato frame di recente."""
+    slots = [s['ingest_slot'] for s in _user_sessions.values()] + list(_desktop_streams)
+    return [slot for slot in slots if slot.is_streaming(now)]
+
+def _capture_target(slot: 'LatestFrameSlot') -> dict:
+    """Target {fps, max_dim, quality} per uno stream, dal carico dell'intero worker."""
+    now = time.time()
+    streams = _active_capture_streams(now) or [slot]
+    utilisation = sum(s.utilisation() for s in streams)
+    queue_depth = sum(1 for s in streams if s.has_pending())
+    drop_ratio = slot.interval_drop_ratio()
+
+    # fps: capacità della sessione e quota equa del tempo di inferenza
+    fps = slot.sustainable_fps()
+    if slot.avg_process_ms:
+        share_ms = 1000.0 * FLOW_CONTROL_HEADROOM / len(streams)
+        fps = max(FLOW_CONTROL_MIN_FPS, min(fps, int(share_ms / slot.avg_process_ms)))
+
+    # Risoluzione/qualità: un livello per intervallo
+    if utilisation > CAPTURE_STEP_DOWN_LOAD or drop_ratio > CAPTURE_STEP_DOWN_DROPS:
+        slot.target_level = min(len(CAPTURE_LEVELS) - 1, slot.target_level + 1)
+    elif utilisation < CAPTURE_STEP_UP_LOAD and queue_depth <= 1 and drop_ratio == 0:
+        slot.target_level = max(0, slot.target_level - 1)
+    max_dim, quality = CAPTURE_LEVELS[slot.target_level]
+    return {
+        "fps": fps,
+        "max_dim": max_dim,
+        "quality": quality,
+        "server_load": round(utilisation, 2),
+        "queue_depth": queue_depth,
+        "active_streams": len(streams),
+    }
+
+def _flow_control_message(slot: 'LatestFrameSlot') -> dict:
+    """Messaggio flow_control: max_fps (client storici) + target di cattura."""
+    target = _capture_target(slot)
+    return {
+        "action": "flow_control",
+        "max_fps": target['fps'],
+        "target": target,
+        **slot.stats()
+    }
+
+def _enforce_memory_limit() -> int:
+    """Libera sessioni inattive (le più vecchie prima) finché si rientra nel tetto.
+
+    Restituisce la memoria stimata dopo l'eventuale eviction. Le sessioni con
+    client connessi non vengono mai rimosse.
+    """
+    total = sum(_session_memory_bytes(s) for s in _user_sessions.values())
+    if total <= SESSION_MEMORY_LIMIT:
+        return total
+    idle = sorted((s['last_activity'], t) for t, s in _user_sessions.items() if _session_is_idle(s))
+    for _, token in idle:
+        if total <= SESSION_MEMORY_LIMIT:
+            break
+        total -= _session_memory_bytes(_user_sessions[token])
+        _evict_session(token, "per limite memoria")
+    if total > SESSION_MEMORY_LIMIT:
+        logger.warning(f"Memoria sessioni {total // (1024 * 1024)} MB oltre il limite "
+                       f"({SESSION_MEMORY_LIMIT // (1024 * 1024)} MB) con sole sessioni attive")
+    return total
+
+async def _session_reaper_loop():
+    """Task periodico: sessioni scadute + tetto globale di memoria."""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            _cleanup_stale_sessions()
+            _enforce_memory_limit()
+        except Exception as e:
+            logger.error(f"Errore reaper sessioni: {e}")
+
+def _admin_status() -> dict:
+    """Conteggi e dimensioni delle sessioni locali per il messaggio admin_status."""
+    now = time.time()
+    sessions = []
+    for token, sess in _user_sessions.items():
+        sessions.append({
+            "token": token[:8] + "...",
+            "memory_bytes": _session_memory_bytes(sess),
+            "buffered_frames": len(sess['frame_scorer'].best_frames),
+            "idle_seconds": round(now - sess['last_activity'], 1),
+            "desktop_connected": sess.get('desktop_ws') is not None,
+            "iphones_connected": len(sess['iphone_devices']),
+            "scans": sess['frame_scorer'].scans,
+            "scan_avg_ms": round(sess['frame_scorer'].scan_avg_ms, 2) if sess['frame_scorer'].scan_avg_ms else None,
+            **sess['frame_scorer'].roi_stats(),
+        })
+    sessions.sort(key=lambda s: s['memory_bytes'], reverse=True)
+    return {
+        "action": "admin_status",
+        "worker": WORKER_ID,
+        "session_count": len(sessions),
+        "idle_session_count": sum(1 for s in _user_sessions.values() if _session_is_idle(s)),
+        "memory_bytes": sum(s['memory_bytes'] for s in sessions),
+        "memory_limit_bytes": SESSION_MEMORY_LIMIT,
+        "session_frame_limit_bytes": SESSION_MAX_FRAME_BYTES,
+        "sessions": sessions,
+    }
+
+async def _send_to_desktop(session: dict, message, relay: bool = True):
+    """Invia un messaggio al desktop di una sessione specifica (dict JSON o bytes binari).
+
+    Se il desktop è connesso a un altro worker il messaggio viene inoltrato via relay.
+    """
     ws = session.get('desktop_ws')
     if ws is not None:
         try:
-            await ws.send(json.dumps(message))
+            await ws.send(message if isinstance(message, bytes) else _dumps(message))
         except Exception:
             session['desktop_ws'] = None
+    elif relay:
+        worker = session.get('desktop_worker')
+        if worker and worker != WORKER_ID and worker in _live_workers:
+            await _relay(worker, {'kind': 'to_desktop', 'token': session['token'], 'message': message})
+
+async def _send_to_iphones(session: dict, message: dict, relay: bool = True):
+    """Invia un messaggio JSON a tutti gli iPhone della sessione, locali e remoti."""
+    for dev in session['iphone_devices'].values():
+        iws = dev.get('websocket')
+        if iws is not None:
+            try:
+                await iws.send(_dumps(message))
+            except Exception:
+                pass
+    if relay:
+        remote = {info.get('worker') for info in session.get('shared_iphones', {}).values()}
+        for worker in (remote & _live_workers) - {WORKER_ID}:
+            await _relay(worker, {'kind': 'to_iphones', 'token': session['token'], 'message': message})
+
+def _ws_write_buffer_size(ws) -> int:
+    """Byte in attesa di invio sul socket (0 se il transport non è accessibile)."""
+    transport = getattr(ws, 'transport', None)
+    if transport is None:
+        return 0
+    try:
+        return transport.get_write_buffer_size()
+    except Exception:
+        return 0
+
+def _apply_preview_config(session: dict, cfg):
+    """Salva i parametri di anteprima dichiarati dal desktop (None = nessun limite)."""
+    if not isinstance(cfg, dict):
+        session['preview'] = None
+        return
+    max_width = cfg.get('max_width')
+    max_fps = cfg.get('max_fps')
+    quality = cfg.get('quality', PREVIEW_DEFAULT_QUALITY)
+    session['preview'] = {
+        'max_width': int(max_width) if max_width else None,
+        'max_fps': float(max_fps) if max_fps else None,
+        'quality': max(10, min(95, int(quality))),
+    }
+
+def _desktop_preview_frame(session: dict, frame_data: 'IncomingFrame', score: float):
+    """Decide se e come allegare il frame al messaggio per il desktop.
+
+    Restituisce (frame | None, is_preview): frame è l'IncomingFrame originale
+    (inoltrato senza conversioni se non trasformato) oppure i byte JPEG
+    dell'anteprima ridotta.
+    None = invia solo i metadati (limite max_fps). Il nuovo miglior frame ad
+    alto score viene sempre inoltrato a piena risoluzione: il desktop lo usa
+    per il canvas di analisi.
+    """
+    now = time.time()
+    if score >= PREVIEW_FULL_RES_SCORE and score > session.get('preview_best_score', 0):
+        session['preview_best_score'] = score
+        session['preview_last_sent'] = now
+        return frame_data, False
+
+    cfg = session.get('preview')
+    if not cfg:
+        return frame_data, False
+
+    if cfg['max_fps'] and now - session.get('preview_last_sent', 0.0) < 1.0 / cfg['max_fps']:
+        return None, True
+    session['preview_last_sent'] = now
+
+    if not cfg['max_width']:
+        return frame_data, False
+    size = frame_data.size
+    if size is None or size[0] <= cfg['max_width']:
+        return frame_data, False
+    # Decodifica ridotta (DCT) alla larghezza più vicina all'anteprima richiesta
+    w, h = size
+    img = frame_data.image_for(-(-cfg['max_width'] * max(w, h) // w))
+    h, w = img.shape[:2]
+    scale = cfg['max_width'] / w
+    small = cv2.resize(img, (cfg['max_width'], max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    _, buf = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, cfg['quality']])
+    return buf.tobytes(), True
+
+async def _process_iphone_frame(session: dict, item: dict):
+    """Scoring di un iphone_frame prelevato dallo slot + risposte a iPhone e desktop."""
+    websocket = item['websocket']
+    device_id = item['device_id']
+    # bytes (protocollo binario) o stringa base64 (legacy): decodificato una sola volta
+    frame_data = IncomingFrame(item['frame_data'])
+
+    # Se operatore sdraiato: ruota il frame 180° prima dell'analisi.
+    # La rotazione lavora sull'ndarray già decodificato; il JPEG ruotato viene
+    # generato solo se il frame entra nel buffer o viene inoltrato al desktop.
+    if session.get('operator_lying'):
+        try:
+            frame_data.rotate_180()
+        except Exception as _e:
+            logger.warning(f"Rotazione frame fallita: {_e}")
+
+    slot = session['ingest_slot']
+    t0 = time.perf_counter()
+    # Usa lo scorer di questa sessione
+    result = await session['frame_scorer'].process_frame(frame_data)
+    slot.record_processing((time.perf_counter() - t0) * 1000.0)
+
+    result['action'] = 'frame_processed'
+    result['source'] = 'iphone'
+    result['deviceId'] = device_id
+    result['frames_dropped'] = slot.frames_dropped
+
+    # Rispondi all'iPhone nello stesso protocollo della richiesta e nella codifica landmark scelta
+    encoding = item.get('landmark_encoding', 'float')
+    if item.get('binary'):
+        await websocket.send(_encode_binary_message(BIN_MSG_FRAME_PROCESSED, item.get('seq'), result,
+                                                    landmark_encoding=encoding))
+    else:
+        await websocket.send(_dumps(_json_landmarks(result, encoding)))
+
+    # Flow control: comunica periodicamente all'iPhone rate sostenibile e target di cattura
+    now = time.time()
+    if now - slot.last_flow_control >= FLOW_CONTROL_INTERVAL:
+        slot.last_flow_control = now
+        await websocket.send(_dumps(_flow_control_message(slot)))
+
+    # Invia frame processato SOLO al desktop di questa sessione.
+    # Se il socket desktop ha troppi byte in coda (LAN congestionata) si salta il
+    # messaggio: il prossimo frame porterà comunque lo stato più recente.
+    desktop_ws = session.get('desktop_ws')
+    if desktop_ws is not None and _ws_write_buffer_size(desktop_ws) > PREVIEW_WRITE_WATERMARK:
+        session['preview_skipped'] = session.get('preview_skipped', 0) + 1
+    elif session.get('active_webcam'):
+        jpeg, is_preview = _desktop_preview_frame(session, frame_data, result.get('current_score', 0))
+        desktop_message = {
+            "action": "iphone_frame_processed",
+            "deviceId": device_id,
+            "score": result.get('current_score', 0),
+            "current_score": result.get('current_score', 0),
+            "faces_detected": result.get('faces_detected', 0),
+            "total_frames_collected": result.get('total_frames_collected', 0),
+            "landmarks": result.get('landmarks'),
+            "image_size": result.get('image_size'),
+            "pose": result.get('pose'),
+            "score_breakdown": result.get('score_breakdown'),
+            "timestamp": time.time(),
+            "frame_is_preview": is_preview,
+        }
+        desktop_encoding = session.get('desktop_landmarks', 'float')
+        if session.get('desktop_binary'):
+            await _send_to_desktop(session, _encode_binary_message(
+                BIN_MSG_IPHONE_FRAME_PROCESSED, item.get('seq'), desktop_message,
+                jpeg=_jpeg_bytes(jpeg) if jpeg is not None else None,
+                landmark_encoding=desktop_encoding
+            ))
+        else:
+            desktop_message = _json_landmarks(desktop_message, desktop_encoding)
+            if jpeg is not None:
+                desktop_message['frame_data'] = _jpeg_b64(jpeg)
+            await _send_to_desktop(session, desktop_message)
+
+async def _iphone_frame_worker(session: dict):
+    """Worker per-sessione: processa sempre l'ultimo frame depositato nello slot."""
+    slot = session['ingest_slot']
+    while True:
+        item = await slot.get()
+        try:
+            await _process_iphone_frame(session, item)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Errore worker iphone_frame: {e}")
+
+def _ensure_ingest_worker(session: dict):
+    """Avvia (o riavvia se terminato) il worker di ingestione della sessione."""
+    worker = session.get('ingest_worker')
+    if worker is None or worker.done():
+        session['ingest_worker'] = asyncio.create_task(_iphone_frame_worker(session))
+
+def _remote_scorer_worker(session: dict | None) -> str | None:
+    """Worker (diverso da questo) che possiede il buffer frame della sessione, se vivo."""
+    if not session:
+        return None
+    worker = session.get('scorer_worker')
+    if worker and worker != WORKER_ID and worker in _live_workers:
+        return worker
+    return None
+
+def _results_message(scorer: 'WebSocketFrameScorer', request: dict) -> dict:
+    """Messaggio results_ready per una richiesta get_results."""
+    result = scorer.get_best_frames_result(final=bool(request.get('final')))
+    result['action'] = 'results_ready'
+    if 'request_id' in request:
+        result['request_id'] = request['request_id']
+    if request.get('final'):
+        result['is_final'] = True
+    return result
+
+async def _handle_relay_message(message: dict):
+    """Esegue un messaggio ricevuto da un altro worker."""
+    kind = message.get('kind')
+    session = _user_sessions.get(message.get('token'))
+    if session is None:
+        return
+    if kind == 'sync':
+        state = await _session_store.load(session['token'])
+        if state:
+            _apply_shared_state(session, state)
+    elif kind == 'to_desktop':
+        await _send_to_desktop(session, message['message'], relay=False)
+    elif kind == 'to_iphones':
+        await _send_to_iphones(session, message['message'], relay=False)
+    elif kind == 'scorer':
+        # Comandi del desktop per lo scorer che vive su questo worker (iPhone qui)
+        if message.get('command') == 'start_session':
+            session['frame_scorer'].start_session(message['session_id'])
+        elif message.get('command') == 'get_results':
+            result = _results_message(session['frame_scorer'], message)
+            await _relay(message['from'], {'kind': 'to_desktop', 'token': session['token'], 'message': result})
+    else:
+        logger.warning(f"Messaggio relay sconosciuto: {kind}")
+
+async def _relay_listener():
+    """Riceve i messaggi indirizzati a questo worker (riconnette in caso di errore)."""
+    while True:
+        try:
+            async for message in _session_store.listen(WORKER_ID):
+                try:
+                    await _handle_relay_message(message)
+                except Exception as e:
+                    logger.error(f"Errore relay {message.get('kind')}: {e}")
+        except Exception as e:
+            logger.warning(f"Listener relay interrotto: {e}")
+        await asyncio.sleep(1.0)
+
+async def _worker_heartbeat_loop():
+    """Heartbeat del worker, elenco worker vivi e attività delle sessioni locali.
+
+    last_activity e last_frame vengono scritti nello store qui, non a ogni frame.
+    """
+    global _live_workers
+    last_prune = 0.0
+    while True:
+        try:
+            await _session_store.heartbeat(WORKER_ID, WORKER_TTL)
+            _live_workers = (await _session_store.live_workers()) | {WORKER_ID}
+
+            for token, sess in list(_user_sessions.items()):
+                if sess['last_activity'] <= sess['activity_synced']:
+                    continue
+                sess['activity_synced'] = sess['last_activity']
+                last_frames = {did: dev.get('last_frame') for did, dev in sess['iphone_devices'].items()}
+
+                def _touch(state, t=sess['last_activity'], frames=last_frames):
+                    state['last_activity'] = max(state.get('last_activity', 0), t)
+                    for did, ts in frames.items():
+                        info = state.get('iphones', {}).get(did)
+                        if info is not None and info.get('worker') == WORKER_ID:
+                            info['last_frame'] = ts
+                await _session_store.update(token, _touch)
+
+            now = time.time()
+            if now - last_prune >= STORE_PRUNE_INTERVAL:
+                last_prune = now
+                for token in await _session_store.tokens():
+                    state = await _session_store.load(token)
+                    if state and now - state.get('last_activity', 0) > SESSION_TTL:
+                        await _session_store.delete(token)
+                        logger.info(f"Rimossa dallo store sessione scaduta: {token[:8]}...")
+        except Exception as e:
+            logger.warning(f"Heartbeat worker fallito: {e}")
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
 
 # ── Compatibilità legacy (nessun session_token) ──────────────────────────────
 # Usato solo se il client NON fornisce session_token (deprecato - sarà rimosso)
@@ -658,7 +1994,7 @@ async def broadcast_to_desktop(message):
         disconnected = set()
         for ws in _legacy_desktop_websockets:
             try:
-                await ws.send(json.dumps(message))
+                await ws.send(_dumps(message))
             except Exception:
                 disconnected.add(ws)
         _legacy_desktop_websockets.difference_update(disconnected)
@@ -669,7 +2005,7 @@ async def broadcast_to_active_desktops(message):
         disconnected = set()
         for ws in _legacy_active_webcams:
             try:
-                await ws.send(json.dumps(message))
+                await ws.send(_dumps(message))
             except Exception:
                 disconnected.add(ws)
         _legacy_active_webcams.difference_update(disconnected)
@@ -687,22 +2023,37 @@ async def handle_websocket(websocket):
     iphone_device_id = None
     # session_token associato a questa connessione (None = modalità legacy)
     conn_session_token: str | None = None
-
-    # Pulizia periodica sessioni scadute (ogni nuova connessione)
-    _cleanup_stale_sessions()
+    # Statistiche dello stream process_frame di questa connessione (flow control)
+    desktop_stream: LatestFrameSlot | None = None
+    # flow_control sugli stream process_frame solo se richiesto ('capture_target': true):
+    # i client storici leggono una risposta per frame in lockstep
+    wants_capture_target = False
+    # 'landmark_encoding' vale per tipo di messaggio, mai per l'intera connessione:
+    #   start_session / process_frame   → frame_processed di questa connessione
+    #                                     (i frame binari non hanno il campo: usano l'ultimo valore)
+    #   iphone_connect / iphone_frame   → frame_processed inviati a questo iPhone
+    #   register_desktop / start_webcam → iphone_frame_processed inoltrati al desktop
+    #                                     (sess['desktop_landmarks'])
+    # Così la codifica chiesta per l'inoltro non altera le risposte JSON del desktop.
+    frame_encoding = 'float'
+    iphone_encoding = 'float'
 
     try:
         async for message in websocket:
             try:
-                data = json.loads(message)
+                # Frame binari (header + JPEG grezzo) o messaggi JSON legacy
+                binary_request = isinstance(message, (bytes, bytearray))
+                data = _decode_binary_request(message) if binary_request else json.loads(message)
                 action = data.get('action')
+                if data.get('capture_target'):
+                    wants_capture_target = True
 
                 # Leggi session_token dal messaggio (se presente)
                 msg_token = data.get('session_token') or conn_session_token
 
                 # Recupera scorer corretto: per-sessione o legacy
                 if msg_token:
-                    sess = _get_or_create_session(msg_token)
+                    sess = await _attach_session(msg_token)
                     scorer = sess['frame_scorer']
                 else:
                     sess = None
@@ -711,12 +2062,23 @@ async def handle_websocket(websocket):
                 # === AZIONI STANDARD (WEBCAM DESKTOP) ===
                 if action == 'start_session':
                     session_id = data.get('session_id', f"session_{int(time.time())}")
-                    scorer.start_session(session_id)
+                    frame_encoding = _requested_encoding(data, frame_encoding)
+                    remote_scorer = _remote_scorer_worker(sess)
+                    if remote_scorer:
+                        # Il buffer frame vive sul worker dell'iPhone
+                        await _relay(remote_scorer, {'kind': 'scorer', 'token': msg_token,
+                                                     'command': 'start_session', 'session_id': session_id})
+                    else:
+                        scorer.start_session(session_id)
 
                     is_desktop_client = True
                     if sess:
                         sess['desktop_ws'] = websocket
                         conn_session_token = msg_token
+                        shared = {'desktop': {'worker': WORKER_ID}}
+                        if not remote_scorer:
+                            shared['scorer'] = {'worker': WORKER_ID, 'session_id': session_id}
+                        await _commit_session(sess, **shared)
                     else:
                         _legacy_desktop_websockets.add(websocket)
 
@@ -725,7 +2087,7 @@ async def handle_websocket(websocket):
                         "session_id": session_id,
                         "message": "Sessione iniziata. Invia frame con action='process_frame'"
                     }
-                    await websocket.send(json.dumps(response))
+                    await websocket.send(_dumps(response))
 
                 elif action == 'scan_frame':
                     # Scan veloce: calcola solo il yaw, senza salvare il frame nel buffer.
@@ -736,38 +2098,62 @@ async def handle_websocket(websocket):
                     client_t = data.get('t', 0)
                     client_seq = data.get('seq')
                     if not frame_data:
-                        await websocket.send(json.dumps({"action": "frame_scanned", "yaw": None, "t": client_t, "seq": client_seq, "faces_detected": 0}))
+                        await websocket.send(_dumps({"action": "frame_scanned", "yaw": None, "t": client_t, "seq": client_seq, "faces_detected": 0}))
                         continue
                     yaw_result = await scorer.scan_frame_yaw(frame_data)
-                    await websocket.send(json.dumps({
+                    await websocket.send(_dumps({
                         "action": "frame_scanned",
                         "yaw": yaw_result.get("yaw"),
                         "t": client_t,
                         "seq": client_seq,
-                        "faces_detected": yaw_result.get("faces_detected", 0)
+                        "faces_detected": yaw_result.get("faces_detected", 0),
+                        "scan_ms": yaw_result.get("scan_ms")
                     }))
 
                 elif action == 'process_frame':
                     frame_data = data.get('frame_data')
                     if not frame_data:
-                        await websocket.send(json.dumps({"error": "frame_data mancante"}))
+                        await websocket.send(_dumps({"error": "frame_data mancante"}))
                         continue
 
+                    if desktop_stream is None:
+                        desktop_stream = LatestFrameSlot()
+                        _desktop_streams.add(desktop_stream)
+                    desktop_stream.record_arrival()
+                    t0 = time.perf_counter()
                     result = await scorer.process_frame(frame_data)
+                    desktop_stream.record_processing((time.perf_counter() - t0) * 1000.0)
                     result['action'] = 'frame_processed'
-                    await websocket.send(json.dumps(result))
+                    frame_encoding = _requested_encoding(data, frame_encoding)
+                    if binary_request:
+                        await websocket.send(_encode_binary_message(BIN_MSG_FRAME_PROCESSED, data.get('seq'), result,
+                                                                    landmark_encoding=frame_encoding))
+                    else:
+                        await websocket.send(_dumps(_json_landmarks(result, frame_encoding)))
+
+                    now = time.time()
+                    if wants_capture_target and now - desktop_stream.last_flow_control >= FLOW_CONTROL_INTERVAL:
+                        desktop_stream.last_flow_control = now
+                        await websocket.send(_dumps(_flow_control_message(desktop_stream)))
 
                 elif action == 'get_results':
-                    result = scorer.get_best_frames_result()
-                    result['action'] = 'results_ready'
-                    if 'request_id' in data:
-                        result['request_id'] = data['request_id']
-                    if data.get('final'):
-                        result['is_final'] = True
-                    await websocket.send(json.dumps(result))
+                    remote_scorer = _remote_scorer_worker(sess)
+                    if remote_scorer:
+                        # Risposta results_ready inoltrata al desktop via relay
+                        await _relay(remote_scorer, {'kind': 'scorer', 'token': msg_token, 'command': 'get_results',
+                                                     'request_id': data.get('request_id'), 'final': data.get('final')})
+                        continue
+                    await websocket.send(_dumps(_results_message(scorer, data)))
 
                 elif action == 'ping':
-                    await websocket.send(json.dumps({"action": "pong", "timestamp": time.time()}))
+                    await websocket.send(_dumps({"action": "pong", "timestamp": time.time()}))
+
+                elif action == 'admin_status':
+                    # Stato memoria/sessioni di questo worker (monitoraggio)
+                    if ADMIN_TOKEN and data.get('admin_token') != ADMIN_TOKEN:
+                        await websocket.send(_dumps({"action": "error", "message": "admin_token non valido"}))
+                        continue
+                    await websocket.send(_dumps(_admin_status()))
 
                 # === AZIONI IPHONE CAMERA ===
                 elif action == 'iphone_connect':
@@ -777,7 +2163,7 @@ async def handle_websocket(websocket):
                     if not token:
                         # Nessun token → connessione rifiutata per sicurezza
                         logger.warning(f"iPhone connect senza session_token (deviceId={device_id}). Connessione rifiutata.")
-                        await websocket.send(json.dumps({
+                        await websocket.send(_dumps({
                             "action": "error",
                             "message": "session_token obbligatorio. Usa il QR code aggiornato."
                         }))
@@ -786,21 +2172,28 @@ async def handle_websocket(websocket):
                     if device_id:
                         conn_session_token = token
                         iphone_device_id = device_id
-                        sess = _get_or_create_session(token)
+                        iphone_encoding = _requested_encoding(data)
+                        sess = await _attach_session(token)
 
                         # Registra iPhone nella sessione
-                        sess['iphone_devices'][device_id] = {
-                            'websocket': websocket,
+                        device_info = {
                             'connected_at': time.time(),
                             'user_agent': data.get('userAgent', 'Unknown'),
                             'last_frame': None
                         }
+                        sess['iphone_devices'][device_id] = {'websocket': websocket, **device_info}
 
                         # Avvia sessione frame scorer con ID univoco
                         ws_session_id = f"iphone_{device_id[:8]}_{int(time.time())}"
                         sess['frame_scorer'].start_session(ws_session_id)
 
-                        await websocket.send(json.dumps({
+                        # Membership condivisa: lo scorer della sessione è su questo worker
+                        def _add_iphone(st, did=device_id, info=device_info):
+                            st['iphones'][did] = {'worker': WORKER_ID, **info}
+                        await _commit_session(sess, _add_iphone,
+                                              scorer={'worker': WORKER_ID, 'session_id': ws_session_id})
+
+                        await websocket.send(_dumps({
                             "action": "connected",
                             "deviceId": device_id,
                             "session_id": ws_session_id,
@@ -817,17 +2210,18 @@ async def handle_websocket(websocket):
                         logger.info(f"iPhone connesso: token={token[:8]}... deviceId={device_id[:8]}...")
 
                 elif action == 'iphone_frame':
-                    device_id = data.get('deviceId')
+                    # Nei frame binari il deviceId è quello registrato con iphone_connect
+                    device_id = data.get('deviceId') or iphone_device_id
                     frame_data = data.get('frame')
 
                     if not frame_data:
-                        await websocket.send(json.dumps({"error": "frame mancante"}))
+                        await websocket.send(_dumps({"error": "frame mancante"}))
                         continue
 
                     token = conn_session_token or data.get('session_token')
                     if not token or token not in _user_sessions:
                         # Nessuna sessione attiva → scarta il frame silenziosamente
-                        await websocket.send(json.dumps({"error": "sessione non trovata, riconnettiti"}))
+                        await websocket.send(_dumps({"error": "sessione non trovata, riconnettiti"}))
                         continue
 
                     curr_sess = _user_sessions[token]
@@ -836,50 +2230,25 @@ async def handle_websocket(websocket):
                     if device_id and device_id in curr_sess['iphone_devices']:
                         curr_sess['iphone_devices'][device_id]['last_frame'] = time.time()
 
-                    # Se operatore sdraiato: ruota il frame 180° prima dell'analisi
-                    if curr_sess.get('operator_lying'):
-                        try:
-                            _fb = base64.b64decode(frame_data)
-                            _narr = np.frombuffer(_fb, np.uint8)
-                            _img = cv2.imdecode(_narr, cv2.IMREAD_COLOR)
-                            if _img is not None:
-                                _img = cv2.rotate(_img, cv2.ROTATE_180)
-                                _, _buf = cv2.imencode('.jpg', _img, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                                frame_data = base64.b64encode(_buf).decode('utf-8')
-                        except Exception as _e:
-                            logger.warning(f"Rotazione frame fallita: {_e}")
-
-                    # Usa lo scorer di questa sessione
-                    result = await curr_sess['frame_scorer'].process_frame(frame_data)
-                    result['action'] = 'frame_processed'
-                    result['source'] = 'iphone'
-                    result['deviceId'] = device_id
-
-                    # Rispondi all'iPhone
-                    await websocket.send(json.dumps(result))
-
-                    # Invia frame processato SOLO al desktop di questa sessione
-                    if curr_sess.get('active_webcam'):
-                        desktop_message = {
-                            "action": "iphone_frame_processed",
-                            "deviceId": device_id,
-                            "score": result.get('current_score', 0),
-                            "current_score": result.get('current_score', 0),
-                            "faces_detected": result.get('faces_detected', 0),
-                            "total_frames_collected": result.get('total_frames_collected', 0),
-                            "landmarks": result.get('landmarks'),
-                            "pose": result.get('pose'),
-                            "score_breakdown": result.get('score_breakdown'),
-                            "timestamp": time.time(),
-                            "frame_data": frame_data
-                        }
-                        await _send_to_desktop(curr_sess, desktop_message)
+                    # Latest-frame-wins: deposita nello slot e torna subito a leggere.
+                    # Lo scoring avviene nel worker della sessione sull'ultimo frame.
+                    curr_sess['ingest_slot'].put({
+                        'websocket': websocket,
+                        'device_id': device_id,
+                        'frame_data': frame_data,
+                        'binary': binary_request,
+                        'seq': data.get('seq'),
+                        'landmark_encoding': _requested_encoding(data, iphone_encoding),
+                    })
+                    _ensure_ingest_worker(curr_sess)
 
                 elif action == 'iphone_disconnect':
                     device_id = data.get('deviceId')
                     token = conn_session_token or data.get('session_token')
                     if token and token in _user_sessions:
                         _user_sessions[token]['iphone_devices'].pop(device_id, None)
+                        await _commit_session(_user_sessions[token],
+                                              lambda st, did=device_id: st['iphones'].pop(did, None))
                         await _send_to_desktop(_user_sessions[token], {
                             "action": "iphone_disconnected",
                             "deviceId": device_id,
@@ -892,9 +2261,19 @@ async def handle_websocket(websocket):
 
                     if token:
                         conn_session_token = token
-                        sess = _get_or_create_session(token)
+                        sess = await _attach_session(token)
                         sess['desktop_ws'] = websocket
-                        iphones_in_session = sess.get('iphone_devices', {})
+                        # binary=True: il desktop riceve iphone_frame_processed in formato binario
+                        sess['desktop_binary'] = bool(data.get('binary'))
+                        # landmark_encoding: codifica dei landmark negli iphone_frame_processed
+                        sess['desktop_landmarks'] = _requested_encoding(data)
+                        if 'preview' in data:
+                            _apply_preview_config(sess, data['preview'])
+                        await _commit_session(sess, desktop={'worker': WORKER_ID},
+                                              desktop_binary=sess['desktop_binary'],
+                                              desktop_landmarks=sess['desktop_landmarks'], preview=sess['preview'])
+                        # iPhone di tutti i worker (vista condivisa)
+                        iphones_in_session = sess.get('shared_iphones', {})
                     else:
                         # Legacy fallback
                         _legacy_desktop_websockets.add(websocket)
@@ -909,7 +2288,7 @@ async def handle_websocket(websocket):
                         for did, info in iphones_in_session.items()
                     ]
 
-                    await websocket.send(json.dumps({
+                    await websocket.send(_dumps({
                         "action": "desktop_registered",
                         "connected_iphones": connected_list
                     }))
@@ -920,15 +2299,27 @@ async def handle_websocket(websocket):
 
                     if token:
                         conn_session_token = token
-                        sess = _get_or_create_session(token)
+                        sess = await _attach_session(token)
                         sess['desktop_ws'] = websocket
                         sess['active_webcam'] = True
+                        if 'binary' in data:
+                            sess['desktop_binary'] = bool(data['binary'])
+                        if 'landmark_encoding' in data:
+                            sess['desktop_landmarks'] = _requested_encoding(data)
+                        if 'preview' in data:
+                            _apply_preview_config(sess, data['preview'])
+                        # Nuova sessione webcam: il prossimo frame eccellente torna a piena risoluzione
+                        # (webcam_epoch azzera preview_best_score anche sul worker dell'iPhone)
+                        sess['preview_best_score'] = 0.0
+                        await _commit_session(sess, desktop={'worker': WORKER_ID}, active_webcam=True,
+                                              webcam_epoch=time.time(), desktop_binary=sess['desktop_binary'],
+                                              desktop_landmarks=sess['desktop_landmarks'], preview=sess['preview'])
                     else:
                         # Legacy fallback
                         _legacy_desktop_websockets.add(websocket)
                         _legacy_active_webcams.add(websocket)
 
-                    await websocket.send(json.dumps({
+                    await websocket.send(_dumps({
                         "action": "webcam_started",
                         "message": "Desktop pronto a ricevere frames iPhone"
                     }))
@@ -937,13 +2328,25 @@ async def handle_websocket(websocket):
                     token = conn_session_token or data.get('session_token')
                     if token and token in _user_sessions:
                         _user_sessions[token]['active_webcam'] = False
+                        await _commit_session(_user_sessions[token], active_webcam=False)
                     _legacy_active_webcams.discard(websocket)
 
-                    await websocket.send(json.dumps({
+                    await websocket.send(_dumps({
                         "action": "webcam_stopped",
                         "message": "Desktop fermato"
                     }))
 
+                elif action == 'preview_config':
+                    # Desktop aggiorna i parametri di anteprima (es. apertura/chiusura fullscreen)
+                    token = conn_session_token or data.get('session_token')
+                    if token and token in _user_sessions:
+                        _apply_preview_config(_user_sessions[token], data.get('preview'))
+                        preview = _user_sessions[token].get('preview')
+                        await _commit_session(_user_sessions[token], preview=preview)
+                    else:
+                        preview = None
+                    await websocket.send(_dumps({"action": "preview_config_ack", "preview": preview}))
+
                 elif action == 'operator_orientation':
                     # Desktop invia preferenza orientamento operatore → salva in sessione e forward agli iPhone
                     token = conn_session_token or data.get('session_token')
@@ -951,22 +2354,27 @@ async def handle_websocket(websocket):
                     if token and token in _user_sessions:
                         sess = _user_sessions[token]
                         sess['operator_lying'] = lying  # salva per rotazione frame
-                        for did, dev in sess['iphone_devices'].items():
-                            iws = dev.get('websocket')
-                            if iws is not None:
-                                try:
-                                    await iws.send(json.dumps({
-                                        "action": "operator_orientation",
-                                        "lying": lying
-                                    }))
-                                except Exception:
-                                    pass
-                    await websocket.send(json.dumps({"action": "operator_orientation_ack", "lying": lying}))
+                        # Lo store propaga la rotazione al worker che processa i frame
+                        await _commit_session(sess, operator_lying=lying)
+                        await _send_to_iphones(sess, {
+                            "action": "operator_orientation",
+                            "lying": lying
+                        })
+                    await websocket.send(_dumps({"action": "operator_orientation_ack", "lying": lying}))
 
                 elif action == 'get_iphone_status':
                     token = conn_session_token or data.get('session_token')
+                    ingest_stats = None
                     if token and token in _user_sessions:
-                        devices = _user_sessions[token]['iphone_devices']
+                        sess = _user_sessions[token]
+                        state = await _session_store.load(token)
+                        if state:
+                            _apply_shared_state(sess, state)
+                        # Vista condivisa; last_frame dei device locali è più aggiornato
+                        devices = {did: {**info, **{k: v for k, v in sess['iphone_devices'].get(did, {}).items()
+                                                    if k != 'websocket'}}
+                                   for did, info in sess['shared_iphones'].items()}
+                        ingest_stats = sess['ingest_slot'].stats()
                     else:
                         devices = connected_iphone_devices  # legacy
 
@@ -980,23 +2388,26 @@ async def handle_websocket(websocket):
                         for did, info in devices.items()
                     ]
 
-                    await websocket.send(json.dumps({
+                    await websocket.send(_dumps({
                         "action": "iphone_status",
                         "connected_count": len(devices),
-                        "devices": connected_list
+                        "devices": connected_list,
+                        "ingest": ingest_stats
                     }))
 
                 else:
-                    await websocket.send(json.dumps({"error": f"Azione sconosciuta: {action}"}))
+                    await websocket.send(_dumps({"error": f"Azione sconosciuta: {action}"}))
 
             except json.JSONDecodeError:
-                await websocket.send(json.dumps({"error": "Messaggio JSON non valido"}))
+                await websocket.send(_dumps({"error": "Messaggio JSON non valido"}))
+            except BinaryProtocolError as e:
+                await websocket.send(_dumps({"error": f"Messaggio binario non valido: {e}"}))
             except websockets.exceptions.ConnectionClosed:
                 break
             except Exception as e:
                 logger.error(f"Errore handling message: {e}")
                 try:
-                    await websocket.send(json.dumps({"error": f"Errore server: {str(e)}"}))
+                    await websocket.send(_dumps({"error": f"Errore server: {str(e)}"}))
                 except websockets.exceptions.ConnectionClosed:
                     break
 
@@ -1005,6 +2416,9 @@ async def handle_websocket(websocket):
     except Exception as e:
         logger.error(f"Errore WebSocket: {e}")
     finally:
+        if desktop_stream is not None:
+            _desktop_streams.discard(desktop_stream)
+
         # Pulizia desktop dalla sessione
         if is_desktop_client:
             _legacy_desktop_websockets.discard(websocket)
@@ -1013,12 +2427,33 @@ async def handle_websocket(websocket):
                 s = _user_sessions[conn_session_token]
                 if s.get('desktop_ws') is websocket:
                     s['desktop_ws'] = None
+                    s['desktop_binary'] = False
+                    s['desktop_landmarks'] = 'float'
                     s['active_webcam'] = False
 
+                    def _drop_desktop(st):
+                        if (st.get('desktop') or {}).get('worker') == WORKER_ID:
+                            st['desktop'] = None
+                            st['desktop_binary'] = False
+                            st['desktop_landmarks'] = 'float'
+                            st['active_webcam'] = False
+                    try:
+                        await _commit_session(s, _drop_desktop)
+                    except Exception as e:
+                        logger.warning(f"Aggiornamento store (desktop) fallito: {e}")
+
         # Pulizia iPhone dalla sessione
         if iphone_device_id and conn_session_token and conn_session_token in _user_sessions:
             s = _user_sessions[conn_session_token]
             s['iphone_devices'].pop(iphone_device_id, None)
+
+            def _drop_iphone(st, did=iphone_device_id):
+                if (st.get('iphones', {}).get(did) or {}).get('worker') == WORKER_ID:
+                    st['iphones'].pop(did, None)
+            try:
+                await _commit_session(s, _drop_iphone)
+            except Exception as e:
+                logger.warning(f"Aggiornamento store (iPhone) fallito: {e}")
             await _send_to_desktop(s, {
                 "action": "iphone_disconnected",
                 "deviceId": iphone_device_id,
@@ -1036,10 +2471,20 @@ async def handle_websocket(websocket):
 async def main():
     """Avvia il server WebSocket"""
     host = "0.0.0.0"
-    port = 8765
-    logger.info(f"WebSocket server avviato su {host}:{port}")
-    async with websockets.serve(handle_websocket, host, port):
-        await asyncio.Future()
+    # Più worker sulla stessa macchina: porte diverse dietro il load balancer
+    port = int(os.environ.get('KIMERIKA_WS_PORT', 8765))
+    logger.info(f"WebSocket server avviato su {host}:{port} (worker {WORKER_ID}, store {SESSION_STORE_URL})")
+    await _session_store.heartbeat(WORKER_ID, WORKER_TTL)
+    background = [asyncio.create_task(_relay_listener()),
+                  asyncio.create_task(_worker_heartbeat_loop()),
+                  asyncio.create_task(_session_reaper_loop())]
+    try:
+        async with websockets.serve(handle_websocket, host, port):
+            await asyncio.Future()
+    finally:
+        for task in background:
+            task.cancel()
+        await _session_store.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Benchmark di regressione e throughput dei rilevatori di puntini su un corpus di foto.
+
+Esegue in parallelo (un processo per worker) sui file di una cartella:
+  - white_v3 : _detect_white_dots_v3 di webapp/api/main.py (dlib)
+  - white_v2 : WhiteDotsProcessorV2.detect_white_dots (MediaPipe)
+  - green    : GreenDotsProcessor.detect_green_dots
+e riporta per rilevatore: percentili di latenza, throughput, picco di memoria
+dei worker e precision/recall/F1 rispetto ai puntini di riferimento.
+
+Etichette (coordinate in pixel dell'immagine come la decodifica OpenCV):
+  - file accanto alla foto con lo stesso nome e estensione .json, oppure
+  - --labels file.json con {"nome_foto.jpg": <etichetta>, ...}
+dove <etichetta> è uno tra:
+  {"white": [{"x": .., "y": ..}, ...], "green": [...]}
+  {"dots": [...]}                       (puntini bianchi)
+  risultato di dot_selector (tools/dot_selector_result.json): usa candidates_good
+Le foto senza etichetta contano solo per i tempi.
+
+Uso:
+    python scripts/benchmark_dots_corpus.py corpus/ --jobs 4
+    python scripts/benchmark_dots_corpus.py corpus/ --detectors white_v3 green --json oggi.json
+    python scripts/benchmark_dots_corpus.py corpus/ --baseline ieri.json   # exit 1 se regressione
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+DETECTORS = ('white_v3', 'white_v2', 'green')
+# Rilevatore → chiave delle etichette di riferimento
+_LABEL_KIND = {'white_v3': 'white', 'white_v2': 'white', 'green': 'green'}
+
+
+# ── Etichette ────────────────────────────────────────────────────────────────
+
+def _parse_label(data) -> dict:
+    """Normalizza un'etichetta in {'white': [(x, y)], 'green': [(x, y)]} (liste opzionali)."""
+    def points(items):
+        return [(float(d['x']), float(d['y'])) for d in items]
+
+    if isinstance(data, list):
+        return {'white': points(data)}
+    if 'candidates_good' in data:
+        return {'white': points(data['candidates_good'])}
+    label = {}
+    if 'dots' in data:
+        label['white'] = points(data['dots'])
+    for kind in ('white', 'green'):
+        if kind in data:
+            label[kind] = points(data[kind])
+    return label
+
+
+def _load_labels(images: list, labels_path: str = None) -> dict:
+    shared = {}
+    if labels_path:
+        with open(labels_path) as fh:
+            shared = json.load(fh)
+    labels = {}
+    for path in images:
+        name = os.path.basename(path)
+        sidecar = os.path.splitext(path)[0] + '.json'
+        if name in shared:
+            labels[path] = _parse_label(shared[name])
+        elif os.path.exists(sidecar):
+            with open(sidecar) as fh:
+                labels[path] = _parse_label(json.load(fh))
+    return labels
+
+
+def match_points(predicted: list, truth: list, radius: float) -> int:
+    """Abbinamento uno-a-uno greedy per distanza crescente; ritorna i veri positivi."""
+    if not predicted or not truth:
+        return 0
+    p = np.asarray(predicted, dtype=np.float64)
+    t = np.asarray(truth, dtype=np.float64)
+    dist = np.hypot(p[:, None, 0] - t[None, :, 0], p[:, None, 1] - t[None, :, 1])
+    pi, ti = np.nonzero(dist <= radius)
+    used_p, used_t = set(), set()
+    tp = 0
+    for k in np.argsort(dist[pi, ti], kind='stable'):
+        a, b = int(pi[k]), int(ti[k])
+        if a in used_p or b in used_t:
+            continue
+        used_p.add(a)
+        used_t.add(b)
+        tp += 1
+    return tp
+
+
+# ── Worker ───────────────────────────────────────────────────────────────────
+
+_worker_detectors = {}
+
+
+def _init_worker(names: list):
+    """Carica i rilevatori una volta per processo (modelli e moduli in cache)."""
+    sys.path.insert(0, os.path.join(_ROOT, 'src'))
+    sys.path.insert(0, os.path.join(_ROOT, 'face-landmark-localization-master'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        if 'white_v3' in names:
+            import importlib.util
+            spec = importlib.util.spec_from_file_location(
+                'kimerika_api_main', os.path.join(_ROOT, 'webapp', 'api', 'main.py'))
+            api_main = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(api_main)
+            _worker_detectors['white_v3'] = lambda bgr, pil: api_main._detect_white_dots_v3(bgr)
+        if 'white_v2' in names:
+            from white_dots_processor_v2 import WhiteDotsProcessorV2
+            white = WhiteDotsProcessorV2()
+            _worker_detectors['white_v2'] = lambda bgr, pil: white.detect_white_dots(pil)
+        if 'green' in names:
+            from green_dots_processor import GreenDotsProcessor
+            green = GreenDotsProcessor()
+            _worker_detectors['green'] = lambda bgr, pil: green.detect_green_dots(pil)
+
+
+def _peak_rss_mb() -> float:
+    if not RESOURCE_AVAILABLE:
+        return float('nan')
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta KiB, macOS byte
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _run_one(name: str, path: str) -> dict:
+    from PIL import Image
+
+    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+    if bgr is None:
+        return {'detector': name, 'path': path, 'error': 'immagine non leggibile'}
+    pil = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    detect = _worker_detectors[name]
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = detect(bgr, pil)
+    except Exception as e:  # un errore su una foto non ferma il corpus
+        return {'detector': name, 'path': path, 'error': f"{type(e).__name__}: {e}"}
+    elapsed = time.perf_counter() - t0
+    return {
+        'detector': name,
+        'path': path,
+        'latency_ms': elapsed * 1000,
+        'dots': [(float(d['x']), float(d['y'])) for d in result.get('dots', [])],
+        'error': result.get('error'),
+        'worker': os.getpid(),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+# ── Report ───────────────────────────────────────────────────────────────────
+
+def _summarise(name: str, rows: list, labels: dict, radius: float, wall_s: float) -> dict:
+    ok = [r for r in rows if 'latency_ms' in r]
+    lat = np.array([r['latency_ms'] for r in ok]) if ok else np.array([np.nan])
+    per_worker = {}
+    for r in ok:
+        per_worker[r['worker']] = max(per_worker.get(r['worker'], 0.0), r['peak_rss_mb'])
+
+    tp = n_pred = n_true = n_labelled = 0
+    kind = _LABEL_KIND[name]
+    for r in ok:
+        truth = labels.get(r['path'], {}).get(kind)
+        if truth is None:
+            continue
+        n_labelled += 1
+        tp += match_points(r['dots'], truth, radius)
+        n_pred += len(r['dots'])
+        n_true += len(truth)
+    precision = tp / n_pred if n_pred else float('nan')
+    recall = tp / n_true if n_true else float('nan')
+    f1 = (2 * precision * recall / (precision + recall)
+          if n_pred and n_true and (precision + recall) > 0 else float('nan'))
+
+    return {
+        'images': len(rows),
+        'failed': len(rows) - len(ok),
+        'no_face': sum(1 for r in ok if r.get('error')),
+        'latency_p50_ms': float(np.percentile(lat, 50)),
+        'latency_p90_ms': float(np.percentile(lat, 90)),
+        'latency_p99_ms': float(np.percentile(lat, 99)),
+        'latency_max_ms': float(np.max(lat)),
+        'throughput_img_s': len(ok) / wall_s if wall_s > 0 else float('nan'),
+        'peak_rss_mb': max(per_worker.values()) if per_worker else float('nan'),
+        'labelled': n_labelled,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+    }
+
+
+def _compare(summary: dict, baseline: dict, max_slowdown: float, max_f1_drop: float) -> list:
+    """Regressioni rispetto a un report precedente (--json)."""
+    problems = []
+    for name, cur in summary.items():
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        if ref['latency_p50_ms'] > 0 and cur['latency_p50_ms'] > ref['latency_p50_ms'] * max_slowdown:
+            problems.append(f"{name}: p50 {ref['latency_p50_ms']:.1f} → {cur['latency_p50_ms']:.1f} ms")
+        if not np.isnan(ref.get('f1', np.nan)) and not np.isnan(cur['f1']) \
+                and cur['f1'] < ref['f1'] - max_f1_drop:
+            problems.append(f"{name}: F1 {ref['f1']:.3f} → {cur['f1']:.3f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rilevatori puntini su un corpus di foto")
+    parser.add_argument("folder", help="cartella con le foto (ed eventuali etichette .json)")
+    parser.add_argument("--detectors", nargs="+", choices=DETECTORS, default=list(DETECTORS),
+                        help="rilevatori da misurare")
+    parser.add_argument("--labels", help="file JSON con le etichette di tutte le foto")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="processi worker in parallelo")
+    parser.add_argument("--match-radius", type=float, default=12.0,
+                        help="distanza massima in px per abbinare un puntino al riferimento")
+    parser.add_argument("--json", help="salva il riepilogo in questo file (usabile come --baseline)")
+    parser.add_argument("--baseline", help="riepilogo precedente da confrontare")
+    parser.add_argument("--max-slowdown", type=float, default=1.2,
+                        help="regressione se p50 > baseline × questo fattore")
+    parser.add_argument("--max-f1-drop", type=float, default=0.02,
+                        help="regressione se F1 scende più di questo valore")
+    args = parser.parse_args()
+
+    images = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder)
+                    if f.lower().endswith(_EXTENSIONS))
+    if not images:
+        print(f"Nessuna immagine in {args.folder}")
+        return 1
+    labels = _load_labels(images, args.labels)
+    print(f"Corpus: {len(images)} foto, {len(labels)} etichettate | worker: {args.jobs}")
+
+    summary = {}
+    for name in args.detectors:
+        rows = []
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                                 initargs=([name],)) as pool:
+            futures = [pool.submit(_run_one, name, path) for path in images]
+            for future in as_completed(futures):
+                rows.append(future.result())
+        wall = time.perf_counter() - t0
+        for r in rows:
+            if 'latency_ms' not in r:
+                print(f"⚠️  [{name}] {os.path.basename(r['path'])}: {r['error']}")
+        summary[name] = _summarise(name, rows, labels, args.match_radius, wall)
+
+    print(f"\n{'rilevatore':<10} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'img/s':>7} {'RSS MB':>7} {'prec':>6} {'rec':>6} {'F1':>6} {'etich.':>6} {'errori':>6}")
+    for name, s in summary.items():
+        print(f"{name:<10} {s['latency_p50_ms']:8.1f} {s['latency_p90_ms']:8.1f} {s['latency_p99_ms']:8.1f} "
+              f"{s['latency_max_ms']:8.1f} {s['throughput_img_s']:7.2f} {s['peak_rss_mb']:7.0f} "
+              f"{s['precision']:6.3f} {s['recall']:6.3f} {s['f1']:6.3f} {s['labelled']:>6} "
+              f"{s['failed'] + s['no_face']:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"\nRiepilogo salvato in {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            problems = _compare(summary, json.load(fh), args.max_slowdown, args.max_f1_drop)
+        if problems:
+            print("\n⚠️ Regressioni rispetto alla baseline:")
+            for p in problems:
+                print(f"   {p}")
+            return 1
+        print("\nNessuna regressione rispetto alla baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark della detection volto di eyebrows.py a risoluzioni comuni.
+
+Per ogni larghezza confronta:
+  - hog       : HOG dlib a piena risoluzione, upsample=1 (comportamento storico)
+  - hog-small : HOG su copia ridotta a --detect-max-width, rettangolo riscalato
+  - seed      : face_rect già noto → HOG saltato, solo shape predictor e segmentazione
+
+Riporta i tempi e, per hog-small e seed, lo scarto del rettangolo e l'IoU delle
+maschere sopracciglia rispetto a hog.
+
+Uso:
+    python scripts/benchmark_eyebrows_detection.py IMG_7655.JPG
+    python scripts/benchmark_eyebrows_detection.py foto.jpg --widths 640 1200 1920 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(_ROOT, 'face-landmark-localization-master'))
+from eyebrows import detect_face_rect, extract_eyebrows_from_array  # noqa: E402
+
+_DAT = os.path.join(_ROOT, 'face-landmark-localization-master', 'shape_predictor_68_face_landmarks.dat')
+
+
+def _time(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _mask_iou(a: dict, b: dict) -> float:
+    ma = cv2.bitwise_or(a["left_mask"], a["right_mask"]) > 0
+    mb = cv2.bitwise_or(b["left_mask"], b["right_mask"]) > 0
+    union = np.count_nonzero(ma | mb)
+    return np.count_nonzero(ma & mb) / union if union else 1.0
+
+
+def _rect_delta(a: tuple, b: tuple) -> int:
+    return int(max(abs(p - q) for p, q in zip(a, b)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection volto eyebrows.py")
+    parser.add_argument("image", help="immagine con un volto")
+    parser.add_argument("--widths", type=int, nargs="+", default=[640, 960, 1200, 1920],
+                        help="larghezze a cui ridimensionare l'immagine")
+    parser.add_argument("--detect-max-width", type=int, default=600,
+                        help="larghezza della copia ridotta per hog-small")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per misura")
+    parser.add_argument("--predictor", default=_DAT, help="percorso shape_predictor_68_face_landmarks.dat")
+    args = parser.parse_args()
+
+    source = cv2.imread(args.image)
+    if source is None:
+        print(f"Impossibile leggere: {args.image}")
+        return 1
+
+    # Prima chiamata fuori misura: carica predictor e detector in cache
+    extract_eyebrows_from_array(source, predictor_path=args.predictor)
+
+    print(f"{'width':>6} {'hog ms':>9} {'small ms':>9} {'seed ms':>9} {'extract ms':>11} "
+          f"{'Δrect small':>12} {'IoU small':>10} {'IoU seed':>9}")
+    for width in args.widths:
+        scale = width / source.shape[1]
+        img = cv2.resize(source, (width, max(1, round(source.shape[0] * scale))),
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        t_hog, face = _time(lambda: detect_face_rect(gray), args.repeat)
+        if face is None:
+            print(f"{width:>6} volto non rilevato")
+            continue
+        t_small, face_small = _time(lambda: detect_face_rect(gray, args.detect_max_width), args.repeat)
+
+        t_full, ref = _time(lambda: extract_eyebrows_from_array(img, predictor_path=args.predictor),
+                            args.repeat)
+        t_seed, seeded = _time(lambda: extract_eyebrows_from_array(
+            img, predictor_path=args.predictor, face_rect=ref["face_rect"]), args.repeat)
+        small = extract_eyebrows_from_array(img, predictor_path=args.predictor,
+                                            detect_max_width=args.detect_max_width)
+
+        if face_small is None or not small["face_detected"]:
+            delta, iou_small = "n/d", "n/d"
+        else:
+            delta = f"{_rect_delta(ref['face_rect'], small['face_rect'])} px"
+            iou_small = f"{_mask_iou(ref, small):.3f}"
+        print(f"{width:>6} {t_hog * 1000:9.1f} {t_small * 1000:9.1f} {t_seed * 1000:9.1f} "
+              f"{t_full * 1000:11.1f} {delta:>12} {iou_small:>10} {_mask_iou(ref, seeded):9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark di GreenDotsProcessor.detect_green_dots contro l'implementazione
+storica pixel per pixel con clustering BFS (riportata qui sotto come riferimento).
+
+Verifica che i puntini rilevati coincidano (x, y, size, score) e misura i tempi.
+
+Uso:
+    python scripts/benchmark_green_dots.py IMG_7655.JPG
+    python scripts/benchmark_green_dots.py foto.jpg --max-width 600 --repeat 5
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from green_dots_processor import GreenDotsProcessor  # noqa: E402
+
+
+def cluster_pixels_reference(processor: GreenDotsProcessor, pixels: list) -> list:
+    """BFS originale: per ogni pixel scansiona l'intera lista (quadratico)."""
+    visited = set()
+    clusters = []
+    for pixel in pixels:
+        key = f"{pixel['x']},{pixel['y']}"
+        if key in visited:
+            continue
+        cluster = []
+        queue = [pixel]
+        while queue:
+            current = queue.pop(0)
+            current_key = f"{current['x']},{current['y']}"
+            if current_key in visited:
+                continue
+            visited.add(current_key)
+            cluster.append(current)
+            for neighbor in pixels:
+                neighbor_key = f"{neighbor['x']},{neighbor['y']}"
+                if neighbor_key not in visited:
+                    dx = abs(current["x"] - neighbor["x"])
+                    dy = abs(current["y"] - neighbor["y"])
+                    if dx <= processor.clustering_radius and dy <= processor.clustering_radius:
+                        queue.append(neighbor)
+        if processor.cluster_min <= len(cluster) <= processor.cluster_max:
+            clusters.append(cluster)
+    return clusters
+
+
+def detect_green_dots_reference(processor: GreenDotsProcessor, image: Image.Image) -> dict:
+    """Implementazione originale: scansione Python di ogni pixel."""
+    img_array = np.array(image)
+    height, width = img_array.shape[:2]
+
+    green_pixels = []
+    for y in range(height):
+        for x in range(width):
+            r, g, b = img_array[y, x][:3]
+            if processor.is_green_pixel(r, g, b):
+                h, s, v = processor.rgb_to_hsv(r, g, b)
+                green_pixels.append(
+                    {"x": x, "y": y, "r": r, "g": g, "b": b, "h": h, "s": s, "v": v}
+                )
+
+    clusters = cluster_pixels_reference(processor, green_pixels)
+
+    dots = []
+    for cluster in clusters:
+        avg_x = sum(p["x"] for p in cluster) / len(cluster)
+        avg_y = sum(p["y"] for p in cluster) / len(cluster)
+        avg_saturation = sum(p["s"] for p in cluster) / len(cluster)
+        score = len(cluster) * (1 + avg_saturation / 100)
+        if avg_saturation <= 20 and len(cluster) < 3:
+            continue
+        variance_x = sum((p["x"] - avg_x) ** 2 for p in cluster) / len(cluster)
+        variance_y = sum((p["y"] - avg_y) ** 2 for p in cluster) / len(cluster)
+        compactness = math.sqrt(variance_x + variance_y) / math.sqrt(len(cluster))
+        if avg_saturation <= 20:
+            if compactness >= 1.0:
+                continue
+        elif compactness > 2.5:
+            continue
+        dots.append({"x": round(avg_x), "y": round(avg_y), "size": len(cluster),
+                     "score": score, "pixels": cluster})
+
+    dots = processor.filter_close_dots(dots, min_distance=10)
+    return {"dots": dots, "total_dots": len(dots), "total_green_pixels": len(green_pixels)}
+
+
+def _signature(results: dict) -> list:
+    return sorted((d["x"], d["y"], d["size"], d["score"]) for d in results["dots"])
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detect_green_dots (vettoriale vs pixel per pixel)")
+    # Il riferimento è quadratico nei pixel candidati: per foto con molte zone
+    # chiare usare --max-width piccolo o --skip-reference
+    parser.add_argument("image", help="immagine da analizzare")
+    parser.add_argument("--max-width", type=int, default=600,
+                        help="ridimensiona a questa larghezza (0 = originale; il riferimento è lento)")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni della versione vettoriale")
+    parser.add_argument("--skip-reference", action="store_true", help="misura solo la versione attuale")
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert("RGB")
+    if args.max_width and image.width > args.max_width:
+        scale = args.max_width / image.width
+        image = image.resize((args.max_width, int(image.height * scale)), Image.LANCZOS)
+    print(f"Immagine: {image.width}x{image.height}")
+
+    processor = GreenDotsProcessor()
+    current = processor.detect_green_dots(image)
+    t_current = _time(lambda: processor.detect_green_dots(image), args.repeat)
+    print(f"detect_green_dots:  {t_current * 1000:9.1f} ms  "
+          f"({current['total_dots']} puntini, {current['total_green_pixels']} pixel candidati)")
+
+    if args.skip_reference:
+        return 0
+
+    t0 = time.perf_counter()
+    reference = detect_green_dots_reference(processor, image)
+    t_reference = time.perf_counter() - t0
+    print(f"riferimento:        {t_reference * 1000:9.1f} ms  "
+          f"({reference['total_dots']} puntini, {reference['total_green_pixels']} pixel candidati)")
+    print(f"speedup:            {t_reference / t_current:9.1f}x")
+
+    same = (_signature(current) == _signature(reference)
+            and current["total_green_pixels"] == reference["total_green_pixels"])
+    print("rilevamenti identici" if same else "⚠️ rilevamenti DIVERSI dal riferimento")
+    if same:
+        same_clusters = (sorted(sorted((p["x"], p["y"]) for p in d["pixels"]) for d in current["dots"])
+                         == sorted(sorted((p["x"], p["y"]) for p in d["pixels"]) for d in reference["dots"]))
+        print("pixel dei cluster identici" if same_clusters else "⚠️ pixel dei cluster DIVERSI")
+        same = same_clusters
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Confronto di accuratezza tra i backend sopracciglia di eyebrows.py (dlib vs mediapipe).
+
+Per ogni immagine del campione esegue extract_eyebrows_from_array con entrambi i
+backend e, per sopracciglio sinistro e destro, misura rispetto a dlib (riferimento):
+  - IoU delle maschere
+  - rapporto aree (mediapipe / dlib)
+  - distanza tra i centroidi, normalizzata sull'altezza del volto dlib
+e i tempi dei due backend. In coda stampa media e mediana di ogni metrica.
+
+Uso:
+    python scripts/compare_eyebrow_backends.py foto1.jpg foto2.jpg
+    python scripts/compare_eyebrow_backends.py cartella_campioni/ --csv report.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(_ROOT, 'face-landmark-localization-master'))
+import eyebrows  # noqa: E402
+
+_DAT = os.path.join(_ROOT, 'face-landmark-localization-master', 'shape_predictor_68_face_landmarks.dat')
+_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _collect(paths: list) -> list:
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(_EXTENSIONS))
+        else:
+            images.append(path)
+    return images
+
+
+def _compare_masks(ref: np.ndarray, other: np.ndarray, face_h: int) -> dict:
+    a, b = ref > 0, other > 0
+    union = np.count_nonzero(a | b)
+    area_ref, area_other = np.count_nonzero(a), np.count_nonzero(b)
+    if area_ref and area_other:
+        ys_a, xs_a = np.nonzero(a)
+        ys_b, xs_b = np.nonzero(b)
+        shift = float(np.hypot(xs_a.mean() - xs_b.mean(), ys_a.mean() - ys_b.mean())) / max(face_h, 1)
+    else:
+        shift = float('nan')
+    return {
+        'iou': np.count_nonzero(a & b) / union if union else 1.0,
+        'area_ratio': area_other / area_ref if area_ref else float('nan'),
+        'centroid_shift': shift,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto backend sopracciglia dlib vs mediapipe")
+    parser.add_argument("paths", nargs="+", help="immagini o cartelle di immagini")
+    parser.add_argument("--predictor", default=_DAT, help="percorso shape_predictor_68_face_landmarks.dat")
+    parser.add_argument("--csv", help="salva le metriche per immagine in questo file CSV")
+    args = parser.parse_args()
+
+    if not (eyebrows.DLIB_AVAILABLE and eyebrows.MEDIAPIPE_AVAILABLE):
+        print("Servono sia dlib sia mediapipe per il confronto.")
+        return 1
+
+    rows = []
+    for path in _collect(args.paths):
+        img = cv2.imread(path)
+        if img is None:
+            print(f"⚠️  {path}: impossibile leggere")
+            continue
+        t0 = time.perf_counter()
+        ref = eyebrows.extract_eyebrows_from_array(img, predictor_path=args.predictor, backend="dlib")
+        t1 = time.perf_counter()
+        other = eyebrows.extract_eyebrows_from_array(img, backend="mediapipe")
+        t2 = time.perf_counter()
+        name = os.path.basename(path)
+        if not (ref["face_detected"] and other["face_detected"]):
+            print(f"⚠️  {name}: volto rilevato da dlib={ref['face_detected']} mediapipe={other['face_detected']}")
+            continue
+
+        face_h = ref["face_rect"][3] - ref["face_rect"][1] + 1
+        row = {'image': name, 'dlib_ms': (t1 - t0) * 1000, 'mediapipe_ms': (t2 - t1) * 1000}
+        for side in ('left', 'right'):
+            for key, value in _compare_masks(ref[f"{side}_mask"], other[f"{side}_mask"], face_h).items():
+                row[f"{side}_{key}"] = value
+        rows.append(row)
+        print(f"{name:<30} IoU sx {row['left_iou']:.3f} dx {row['right_iou']:.3f}  "
+              f"aree {row['left_area_ratio']:.2f}/{row['right_area_ratio']:.2f}  "
+              f"shift {row['left_centroid_shift']:.3f}/{row['right_centroid_shift']:.3f}  "
+              f"{row['dlib_ms']:.0f} ms vs {row['mediapipe_ms']:.0f} ms")
+
+    if not rows:
+        print("Nessuna immagine confrontabile.")
+        return 1
+
+    print(f"\nRiepilogo su {len(rows)} immagini (riferimento dlib):")
+    for key in [k for k in rows[0] if k != 'image']:
+        values = np.array([r[key] for r in rows], dtype=np.float64)
+        print(f"  {key:<22} media {np.nanmean(values):8.3f}   mediana {np.nanmedian(values):8.3f}")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"CSV salvato in {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
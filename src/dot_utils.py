@@ -0,0 +1,259 @@
+"""
+Funzioni condivise dai processori di puntini (verdi e bianchi).
+
+Tutte lavorano su array NumPy dei pixel candidati invece che su liste di
+dizionari, così il costo resta lineare nel numero di pixel:
+
+- rgb_to_hsv_planes: conversione RGB → HSV (scala 0-360 / 0-100 / 0-100) vettoriale
+- cluster_labels: clustering dei pixel candidati con raggio di Chebyshev
+- cluster_statistics: dimensione, centroide, compattezza e medie per cluster
+- PointGrid: indice a griglia uniforme per le ricerche di vicinanza tra puntini
+- nms_by_distance: soppressione dei puntini troppo vicini (NMS) su PointGrid
+
+Dipendenze: opencv-python, numpy
+"""
+
+import math
+
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+
+def rgb_to_hsv_planes(rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Versione vettoriale di rgb_to_hsv dei processori.
+
+    Replica operazione per operazione la versione scalare (float64,
+    arrotondamento half-even come round()), quindi i valori coincidono.
+
+    Args:
+        rgb: Array (..., 3) uint8
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: piani H (0-360), S (0-100), V (0-100) int16
+    """
+    r = rgb[..., 0] / 255.0
+    g = rgb[..., 1] / 255.0
+    b = rgb[..., 2] / 255.0
+
+    max_val = np.maximum(np.maximum(r, g), b)
+    min_val = np.minimum(np.minimum(r, g), b)
+    diff = max_val - min_val
+
+    # Hue (stessa priorità dei rami della versione scalare: r, poi g, poi b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = np.select(
+            [diff == 0, max_val == r, max_val == g],
+            [0.0, ((g - b) / diff) % 6, (b - r) / diff + 2],
+            (r - g) / diff + 4,
+        )
+        s = np.where(max_val == 0, 0.0, np.rint((diff / max_val) * 100))
+    h = np.rint(h * 60)
+    h[h < 0] += 360
+
+    v = np.rint(max_val * 100)
+
+    return h.astype(np.int16), s.astype(np.int16), v.astype(np.int16)
+
+
+def cluster_labels(xs: np.ndarray, ys: np.ndarray, radius: int) -> Tuple[np.ndarray, int]:
+    """
+    Raggruppa i pixel candidati: due pixel stanno nello stesso cluster se sono
+    collegati da una catena di pixel a distanza di Chebyshev ≤ radius
+    (stesso criterio della BFS storica).
+
+    Ogni pixel viene dilatato in un quadrato radius × radius: due quadrati sono
+    8-connessi esattamente quando |dx| ≤ radius e |dy| ≤ radius, quindi le
+    componenti connesse dell'immagine dilatata sono i cluster.
+
+    Args:
+        xs, ys: Coordinate dei pixel candidati (in ordine di scansione)
+        radius: Raggio di clustering in pixel
+
+    Returns:
+        Tuple[np.ndarray, int]: etichetta 0..n-1 per ogni pixel (numerate nell'ordine
+        del primo pixel di ciascun cluster, come la BFS) e numero di cluster
+    """
+    count = len(xs)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), 0
+    if radius <= 0:
+        return np.arange(count, dtype=np.int64), count
+
+    # Immagine limitata al bbox dei candidati, con margine per il quadrato
+    pad = radius - 1
+    x0, y0 = int(xs.min()), int(ys.min())
+    px = xs - x0 + pad
+    py = ys - y0 + pad
+    canvas = np.zeros((int(py.max()) + 1, int(px.max()) + 1), dtype=np.uint8)
+    canvas[py, px] = 255
+    if radius > 1:
+        kernel = np.ones((radius, radius), dtype=np.uint8)
+        canvas = cv2.dilate(canvas, kernel, anchor=(0, 0))
+    _, label_img = cv2.connectedComponents(canvas, connectivity=8)
+
+    raw = label_img[py, px]
+    uniq, first = np.unique(raw, return_index=True)
+    remap = np.empty(int(uniq.max()) + 1, dtype=np.int64)
+    remap[uniq[np.argsort(first, kind="stable")]] = np.arange(len(uniq))
+    return remap[raw], len(uniq)
+
+
+def cluster_statistics(
+    labels: np.ndarray,
+    n_clusters: int,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    values: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Statistiche di tutti i cluster in un solo passaggio (bincount per etichetta).
+
+    Args:
+        labels: Etichetta di cluster per pixel (da cluster_labels)
+        n_clusters: Numero di cluster
+        xs, ys: Coordinate dei pixel
+        values: Piani per pixel di cui calcolare la media (es. {'s': s, 'v': v})
+
+    Returns:
+        Dict[str, np.ndarray]: 'size', 'cx', 'cy', 'compactness'
+        (deviazione standard dal centroide / sqrt(size)) e 'mean_<nome>' per ogni valore
+    """
+    fx = xs.astype(np.float64)
+    fy = ys.astype(np.float64)
+    size = np.bincount(labels, minlength=n_clusters)
+    counts = np.maximum(size, 1).astype(np.float64)
+
+    cx = np.bincount(labels, weights=fx, minlength=n_clusters) / counts
+    cy = np.bincount(labels, weights=fy, minlength=n_clusters) / counts
+    variance_x = np.bincount(labels, weights=(fx - cx[labels]) ** 2, minlength=n_clusters) / counts
+    variance_y = np.bincount(labels, weights=(fy - cy[labels]) ** 2, minlength=n_clusters) / counts
+
+    stats = {
+        "size": size,
+        "cx": cx,
+        "cy": cy,
+        "compactness": np.sqrt(variance_x + variance_y) / np.sqrt(counts),
+    }
+    for name, plane in (values or {}).items():
+        stats[f"mean_{name}"] = (
+            np.bincount(labels, weights=plane.astype(np.float64), minlength=n_clusters) / counts
+        )
+    return stats
+
+
+def group_by_label(labels: np.ndarray, n_clusters: int):
+    """
+    Indici dei pixel di ciascun cluster (ordine di scansione conservato).
+
+    Returns:
+        List[np.ndarray]: per ogni etichetta, gli indici dei suoi pixel
+    """
+    order = np.argsort(labels, kind="stable")
+    bounds = np.cumsum(np.bincount(labels, minlength=n_clusters))[:-1]
+    return np.split(order, bounds)
+
+
+class PointGrid:
+    """
+    Indice spaziale a griglia uniforme per le ricerche di vicinanza tra puntini.
+
+    I punti sono distribuiti in celle quadrate di lato cell_size: una ricerca
+    entro un raggio esamina solo le celle che il cerchio può toccare, quindi il
+    costo non cresce con il numero totale di punti indicizzati.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = max(float(cell_size), 1.0)
+        self._cells: Dict[Tuple[int, int], list] = {}
+
+    def _key(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def add(self, x: float, y: float, item=None) -> None:
+        """Indicizza il punto (x, y) con un oggetto associato opzionale."""
+        self._cells.setdefault(self._key(x, y), []).append((x, y, item))
+
+    def candidates(self, x: float, y: float, radius: float):
+        """
+        Punti (x, y, item) delle celle che coprono il quadrato di lato 2·radius
+        centrato in (x, y). È un superinsieme: il test esatto di distanza (e il
+        criterio < o ≤) resta al chiamante.
+        """
+        gx0, gy0 = self._key(x - radius, y - radius)
+        gx1, gy1 = self._key(x + radius, y + radius)
+        for gx in range(gx0, gx1 + 1):
+            for gy in range(gy0, gy1 + 1):
+                yield from self._cells.get((gx, gy), ())
+
+    def any_within(self, x: float, y: float, radius: float) -> bool:
+        """True se almeno un punto indicizzato è a distanza < radius da (x, y)."""
+        return any(math.hypot(x - px, y - py) < radius
+                   for px, py, _ in self.candidates(x, y, radius))
+
+
+def dot_priority(dot: dict) -> tuple:
+    """
+    Chiave di ordinamento per la NMS: forzati prima, poi score decrescente
+    (size se manca lo score), poi circolarità decrescente.
+    """
+    return (0 if dot.get('forced') else 1,
+            -dot.get('score', dot.get('size', 0)),
+            -dot.get('circ', 0))
+
+
+def nms_by_distance(
+    points: List[dict],
+    min_dist: float,
+    inclusive: bool = False,
+    nearest: bool = False,
+) -> Tuple[List[dict], list]:
+    """
+    Non-maximum suppression per distanza su puntini (dict con 'x' e 'y').
+
+    I punti sono elaborati in ordine di dot_priority e uno viene scartato se
+    cade entro min_dist da un punto già tenuto. I tenuti sono indicizzati in
+    una PointGrid, quindi ogni punto si confronta solo con i vicini.
+
+    Args:
+        points: Puntini candidati
+        min_dist: Distanza minima in pixel tra puntini tenuti (≤ 0 = nessuna soppressione)
+        inclusive: Scarta anche a distanza esattamente min_dist (≤ invece di <)
+        nearest: Per ogni scartato cerca il tenuto più vicino (a parità di
+            distanza il primo tenuto, come la scansione lineare); serve solo
+            a spiegare lo scarto in debug
+
+    Returns:
+        Tuple[List[dict], list]: tenuti in ordine di priorità e scartati come
+        tuple (punto, tenuto_più_vicino, distanza); gli ultimi due sono None
+        se nearest=False
+    """
+    ordered = sorted(points, key=dot_priority)
+    if min_dist <= 0:
+        return ordered, []
+
+    def _close(dist: float) -> bool:
+        return dist <= min_dist if inclusive else dist < min_dist
+
+    grid = PointGrid(min_dist)
+    kept: List[dict] = []
+    rejected = []
+    for point in ordered:
+        x, y = point['x'], point['y']
+        if nearest:
+            best = None
+            for kx, ky, idx in grid.candidates(x, y, min_dist):
+                dist = math.hypot(x - kx, y - ky)
+                if _close(dist) and (best is None or (dist, idx) < best):
+                    best = (dist, idx)
+            if best is not None:
+                rejected.append((point, kept[best[1]], best[0]))
+                continue
+        elif any(_close(math.hypot(x - kx, y - ky))
+                 for kx, ky, _ in grid.candidates(x, y, min_dist)):
+            rejected.append((point, None, None))
+            continue
+        grid.add(x, y, len(kept))
+        kept.append(point)
+    return kept, rejected
@@ -31,6 +31,14 @@ try:
 except ImportError:
     MEDIAPIPE_AVAILABLE = False
 
+# Importabile sia come src.green_dots_processor sia con src/ nel sys.path
+try:
+    from src.dot_utils import (rgb_to_hsv_planes, cluster_labels, cluster_statistics,
+                               group_by_label, nms_by_distance)
+except ImportError:
+    from dot_utils import (rgb_to_hsv_planes, cluster_labels, cluster_statistics,
+                           group_by_label, nms_by_distance)
+
 
 class GreenDotsProcessor:
     """
@@ -130,7 +138,8 @@ class GreenDotsProcessor:
 
     def cluster_pixels(self, pixels: List[Dict]) -> List[List[Dict]]:
         """
-        Raggruppa i pixel verdi in cluster usando algoritmo BFS.
+        Raggruppa i pixel verdi in cluster (componenti connesse con raggio
+        clustering_radius, vedi dot_utils.cluster_labels).
 
         Args:
             pixels: Lista di pixel verdi con coordinate e informazioni colore
@@ -138,49 +147,49 @@ class GreenDotsProcessor:
         Returns:
             List[List[Dict]]: Lista di cluster, ogni cluster è una lista di pixel
         """
-        visited = set()
-        clusters = []
-
-        for pixel in pixels:
-            key = f"{pixel['x']},{pixel['y']}"
-            if key in visited:
-                continue
+        if not pixels:
+            return []
+        xs = np.fromiter((p["x"] for p in pixels), dtype=np.int64, count=len(pixels))
+        ys = np.fromiter((p["y"] for p in pixels), dtype=np.int64, count=len(pixels))
+        labels, n_clusters = cluster_labels(xs, ys, self.clustering_radius)
 
-            # Trova tutti i pixel connessi (BFS)
-            cluster = []
-            queue = [pixel]
-
-            while queue:
-                current = queue.pop(0)
-                current_key = f"{current['x']},{current['y']}"
-
-                if current_key in visited:
-                    continue
+        clusters = []
+        for indices in group_by_label(labels, n_clusters):
+            if self.cluster_min <= len(indices) <= self.cluster_max:
+                clusters.append([pixels[i] for i in indices.tolist()])
+        return clusters
 
-                visited.add(current_key)
-                cluster.append(current)
+    def rgb_to_hsv_planes(self, rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Versione vettoriale di rgb_to_hsv su un intero array RGB (valori identici).
 
-                # Cerca pixel adiacenti
-                for neighbor in pixels:
-                    neighbor_key = f"{neighbor['x']},{neighbor['y']}"
-                    if neighbor_key not in visited:
-                        dx = abs(current["x"] - neighbor["x"])
-                        dy = abs(current["y"] - neighbor["y"])
-                        if (
-                            dx <= self.clustering_radius
-                            and dy <= self.clustering_radius
-                        ):
-                            queue.append(neighbor)
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: piani H (0-360), S (0-100), V (0-100)
+        """
+        return rgb_to_hsv_planes(rgb)
 
-            if self.cluster_min <= len(cluster) <= self.cluster_max:
-                clusters.append(cluster)
+    def green_pixel_mask(self, h: np.ndarray, s: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """
+        Versione vettoriale di is_green_pixel sui piani HSV.
 
-        return clusters
+        Returns:
+            np.ndarray: maschera booleana dei pixel verdi o bianchi
+        """
+        is_green = (
+            (h >= self.hue_min) & (h <= self.hue_max)
+            & (s >= self.saturation_min)
+            & (v >= self.value_min) & (v <= self.value_max)
+        )
+        is_white = (s <= 20) & (v >= 78) & (v <= 95)
+        return is_green | is_white
 
     def detect_green_dots(self, image: Image.Image) -> Dict:
         """
         Rileva i puntini verdi in un'immagine.
 
+        Classificazione dei pixel e statistiche dei cluster sono operazioni
+        su array interi (risultati identici alla scansione pixel per pixel).
+
         Args:
             image: Immagine PIL da analizzare
 
@@ -190,61 +199,56 @@ class GreenDotsProcessor:
         # Converti l'immagine PIL in numpy array
         img_array = np.array(image)
         height, width = img_array.shape[:2]
+        rgb = img_array[..., :3]
+
+        # Maschera verde/bianco e piani HSV su tutta l'immagine
+        h_plane, s_plane, v_plane = self.rgb_to_hsv_planes(rgb)
+        mask = self.green_pixel_mask(h_plane, s_plane, v_plane)
+
+        # Pixel candidati in ordine di scansione (riga per riga, come il loop originale)
+        ys, xs = np.nonzero(mask)
+        cand_s = s_plane[ys, xs]
+
+        # Cluster come componenti connesse e statistiche di tutti i cluster in un colpo
+        labels, n_clusters = cluster_labels(xs, ys, self.clustering_radius)
+        stats = cluster_statistics(labels, n_clusters, xs, ys, {"s": cand_s})
+        counts = stats["size"]
+        avg_saturation = stats["mean_s"]
+        compactness = stats["compactness"]
+        # Score del cluster (basato su dimensione e saturazione media)
+        scores = counts * (1 + avg_saturation / 100)
+
+        is_white = avg_saturation <= 20
+        keep = (counts >= self.cluster_min) & (counts <= self.cluster_max) & np.where(
+            is_white,
+            # Puntini bianchi: almeno 3 pixel ed estremamente compatti (< 1.0)
+            (counts >= 3) & (compactness < 1.0),
+            # Puntini verdi possono essere meno compatti (bordi definiti)
+            compactness <= 2.5,
+        )
 
-        green_pixels = []
-
-        # Scansiona tutti i pixel
-        for y in range(height):
-            for x in range(width):
-                r, g, b = img_array[y, x][:3]
-
-                if self.is_green_pixel(r, g, b):
-                    h, s, v = self.rgb_to_hsv(r, g, b)
-                    green_pixels.append(
-                        {"x": x, "y": y, "r": r, "g": g, "b": b, "h": h, "s": s, "v": v}
-                    )
-
-        # Raggruppa i pixel verdi in cluster
-        clusters = self.cluster_pixels(green_pixels)
+        # Dizionari per pixel solo per i cluster tenuti ("pixels" del risultato)
+        members = group_by_label(labels, n_clusters)
+        cand_rgb = rgb[ys, xs].tolist()
+        cand_h = h_plane[ys, xs].tolist()
+        cand_v = v_plane[ys, xs].tolist()
+        cand_s_list = cand_s.tolist()
+        xs_list, ys_list = xs.tolist(), ys.tolist()
 
-        # Calcola centroidi per ogni cluster
         dots = []
-        for cluster in clusters:
-            avg_x = sum(p["x"] for p in cluster) / len(cluster)
-            avg_y = sum(p["y"] for p in cluster) / len(cluster)
-            
-            # Calcola score del cluster (basato su dimensione e saturazione media)
-            avg_saturation = sum(p["s"] for p in cluster) / len(cluster)
-            score = len(cluster) * (1 + avg_saturation / 100)
-            
-            # FILTRA: puntini bianchi (bassa saturazione) devono avere almeno 3 pixel
-            if avg_saturation <= 20 and len(cluster) < 3:
-                continue  # Scarta puntino bianco troppo piccolo
-            
-            # FILTRA: esclude puntini con bordi non definiti (pixel dispersi)
-            # Calcola deviazione standard dalla posizione del centroide
-            variance_x = sum((p["x"] - avg_x)**2 for p in cluster) / len(cluster)
-            variance_y = sum((p["y"] - avg_y)**2 for p in cluster) / len(cluster)
-            std_dev = math.sqrt(variance_x + variance_y)
-            
-            # Se deviazione standard troppo alta rispetto alla dimensione, bordi non definiti
-            compactness = std_dev / math.sqrt(len(cluster))
-            
-            # Soglia più stringente per puntini BIANCHI (devono essere più compatti)
-            if avg_saturation <= 20:
-                if compactness >= 1.0:  # Puntini bianchi devono essere estremamente compatti (< 1.0)
-                    continue
-            else:
-                if compactness > 2.5:  # Puntini verdi possono essere meno compatti
-                    continue
-
+        for label in np.flatnonzero(keep).tolist():
+            pixels = []
+            for i in members[label].tolist():
+                r, g, b = cand_rgb[i]
+                pixels.append({"x": xs_list[i], "y": ys_list[i], "r": r, "g": g, "b": b,
+                               "h": cand_h[i], "s": cand_s_list[i], "v": cand_v[i]})
             dots.append(
                 {
-                    "x": round(avg_x),
-                    "y": round(avg_y),
-                    "size": len(cluster),
-                    "score": score,
-                    "pixels": cluster,
+                    "x": round(float(stats["cx"][label])),
+                    "y": round(float(stats["cy"][label])),
+                    "size": int(counts[label]),
+                    "score": float(scores[label]),
+                    "pixels": pixels,
                 }
             )
 
@@ -255,7 +259,7 @@ class GreenDotsProcessor:
         results = {
             "dots": dots,
             "total_dots": len(dots),
-            "total_green_pixels": len(green_pixels),
+            "total_green_pixels": len(xs),
             "image_size": (width, height),
             "parameters": {
                 "hue_range": (self.hue_min, self.hue_max),
@@ -281,22 +285,8 @@ class GreenDotsProcessor:
         if len(dots) <= 1:
             return dots
             
-        # Ordina per score decrescente
-        sorted_dots = sorted(dots, key=lambda d: d.get('score', d['size']), reverse=True)
-        
-        filtered = []
-        for dot in sorted_dots:
-            # Controlla se è troppo vicino a puntini già accettati
-            too_close = False
-            for accepted in filtered:
-                distance = math.sqrt((dot['x'] - accepted['x'])**2 + (dot['y'] - accepted['y'])**2)
-                if distance < min_distance:
-                    too_close = True
-                    break
-            
-            if not too_close:
-                filtered.append(dot)
-        
+        # Priorità per score decrescente; i tenuti sono indicizzati a griglia
+        filtered, _ = nms_by_distance(dots, min_distance)
         return filtered
 
     def divide_dots_by_vertical_center(
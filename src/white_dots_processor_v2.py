@@ -8,7 +8,6 @@ Versione 2: Ricerca limitata ai pixel dentro le maschere.
 import numpy as np
 from PIL import Image, ImageDraw
 from typing import Dict, List, Tuple, Optional
-from collections import deque
 import math
 import cv2
 
@@ -18,6 +17,14 @@ try:
 except ImportError:
     MEDIAPIPE_AVAILABLE = False
 
+# Importabile sia come src.white_dots_processor_v2 sia con src/ nel sys.path
+try:
+    from src.dot_utils import (rgb_to_hsv_planes, cluster_labels, cluster_statistics,
+                               group_by_label, PointGrid, nms_by_distance)
+except ImportError:
+    from dot_utils import (rgb_to_hsv_planes, cluster_labels, cluster_statistics,
+                           group_by_label, PointGrid, nms_by_distance)
+
 
 # ── Costanti formula di scoring calibrata da dot_selector ─────────────────
 _MULTI_CONFIGS = [
@@ -259,7 +266,8 @@ class WhiteDotsProcessorV2:
 
     def cluster_pixels(self, pixels: List[Dict]) -> List[List[Dict]]:
         """
-        Raggruppa i pixel bianchi in cluster usando algoritmo BFS.
+        Raggruppa i pixel bianchi in cluster (componenti connesse con raggio
+        clustering_radius, vedi dot_utils.cluster_labels).
 
         Args:
             pixels: Lista di pixel bianchi con coordinate e informazioni colore
@@ -269,48 +277,15 @@ class WhiteDotsProcessorV2:
         """
         if not pixels:
             return []
+        xs = np.fromiter((p['x'] for p in pixels), dtype=np.int64, count=len(pixels))
+        ys = np.fromiter((p['y'] for p in pixels), dtype=np.int64, count=len(pixels))
+        labels, n_clusters = cluster_labels(xs, ys, self.clustering_radius)
 
-        # Crea dizionario per lookup veloce
-        pixel_dict = {}
-        for p in pixels:
-            key = (p['x'], p['y'])
-            pixel_dict[key] = p
-
-        visited = set()
         clusters = []
-
-        for pixel in pixels:
-            key = (pixel['x'], pixel['y'])
-            if key in visited:
-                continue
-
-            # BFS per trovare tutti i pixel connessi
-            cluster = []
-            queue = deque([pixel])
-
-            while queue:
-                current = queue.popleft()
-                current_key = (current['x'], current['y'])
-
-                if current_key in visited:
-                    continue
-
-                visited.add(current_key)
-                cluster.append(current)
-
-                # Cerca pixel adiacenti nel raggio configurato
-                for dx in range(-self.clustering_radius, self.clustering_radius + 1):
-                    for dy in range(-self.clustering_radius, self.clustering_radius + 1):
-                        if dx == 0 and dy == 0:
-                            continue
-                        neighbor_key = (current['x'] + dx, current['y'] + dy)
-                        if neighbor_key in pixel_dict and neighbor_key not in visited:
-                            queue.append(pixel_dict[neighbor_key])
-
+        for indices in group_by_label(labels, n_clusters):
             # Filtra per dimensione cluster
-            if self.cluster_min <= len(cluster) <= self.cluster_max:
-                clusters.append(cluster)
-
+            if self.cluster_min <= len(indices) <= self.cluster_max:
+                clusters.append([pixels[i] for i in indices.tolist()])
         return clusters
 
     def calculate_compactness(self, cluster: List[Dict]) -> float:
@@ -384,81 +359,87 @@ class WhiteDotsProcessorV2:
         if len(dots) <= 1:
             return dots
 
-        # Ordina per score decrescente
-        sorted_dots = sorted(dots, key=lambda d: d.get('score', d['size']), reverse=True)
-
-        filtered = []
-        for dot in sorted_dots:
-            # Controlla se è troppo vicino a puntini già accettati
-            too_close = False
-            for accepted in filtered:
-                distance = math.sqrt(
-                    (dot['x'] - accepted['x']) ** 2 +
-                    (dot['y'] - accepted['y']) ** 2
-                )
-                if distance < self.min_distance:
-                    too_close = True
-                    break
-
-            if not too_close:
-                filtered.append(dot)
-
+        # Priorità per score decrescente; i tenuti sono indicizzati a griglia
+        filtered, _ = nms_by_distance(dots, self.min_distance)
         return filtered
 
     # ─────────────────────────────────────────────────────────────────────────
     # MODALITÀ ADATTIVA (default)
     # ─────────────────────────────────────────────────────────────────────────
-    def _single_pass_raw(
+    def _multi_pass_raw(
         self,
         v_ch: np.ndarray,
         s_ch: np.ndarray,
         combined_mask: np.ndarray,
-        brightness_percentile: int,
-        sat_cap: float,
-    ) -> Tuple[List[Dict], int]:
+        configs: List[Tuple[int, float]],
+    ) -> List[Tuple[List[Dict], int]]:
         """
-        Singolo pass di detection con parametri espliciti.
-        Ritorna lista dot grezzi (score = area × mean_v/255) e totale pixel luminosi.
+        Pass di detection per più coppie (brightness_percentile, sat_cap) con
+        un'unica estrazione dei pixel della maschera.
+
+        I pixel della maschera sono ordinati per V una volta sola: le soglie
+        percentile si leggono sull'array ordinato e i candidati di ogni pass
+        (V > soglia) ne sono un suffisso. Le componenti connesse lavorano sul
+        bounding box della maschera e le statistiche per etichetta con bincount.
+
+        Ritorna, per ogni config, lista dot grezzi (score = area × mean_v/255)
+        e totale pixel luminosi.
         """
-        ys, xs = np.where(combined_mask > 0)
+        ys, xs = np.nonzero(combined_mask)
         if len(ys) < 10:
-            return [], 0
+            return [([], 0) for _ in configs]
 
         v_in_mask = v_ch[ys, xs]
-        thresh_v = float(np.percentile(v_in_mask, brightness_percentile))
-        thresh_s = sat_cap / 100.0 * 255.0
-
-        bright = np.zeros(v_ch.shape, dtype=np.uint8)
-        bright[(v_ch > thresh_v) & (s_ch <= thresh_s) & (combined_mask > 0)] = 255
+        order = np.argsort(v_in_mask, kind='stable')
+        v_sorted = v_in_mask[order]
+        ys, xs = ys[order], xs[order]
+        s_sorted = s_ch[ys, xs]
+        thresholds = np.percentile(v_sorted, [cfg[0] for cfg in configs])
+
+        y0, x0 = int(ys.min()), int(xs.min())
+        box_shape = (int(ys.max()) - y0 + 1, int(xs.max()) - x0 + 1)
+
+        results = []
+        for (_, sat_cap), thresh_v in zip(configs, thresholds):
+            # Confronto nello stesso dtype del canale (come v_ch > soglia)
+            first = int(np.searchsorted(v_sorted, v_sorted.dtype.type(thresh_v), side='right'))
+            keep = s_sorted[first:] <= sat_cap / 100.0 * 255.0
+            py = ys[first:][keep] - y0
+            px = xs[first:][keep] - x0
+
+            bright = np.zeros(box_shape, dtype=np.uint8)
+            bright[py, px] = 255
+            n_labels, labels = cv2.connectedComponents(bright, connectivity=8)
+
+            lbl_px = labels[py, px]
+            areas = np.bincount(lbl_px, minlength=n_labels)
+            counts = np.maximum(areas, 1)
+            cxs = np.bincount(lbl_px, weights=px + x0, minlength=n_labels) / counts
+            cys = np.bincount(lbl_px, weights=py + y0, minlength=n_labels) / counts
+            mean_vs = np.bincount(lbl_px, weights=v_sorted[first:][keep], minlength=n_labels) / counts
+            mean_ss = np.bincount(lbl_px, weights=s_sorted[first:][keep], minlength=n_labels) / counts
 
-        n_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
-            bright, connectivity=8
-        )
-        total_bright = int(np.sum(bright > 0))
-
-        dots = []
-        for lbl in range(1, n_labels):
-            area = int(stats[lbl, cv2.CC_STAT_AREA])
-            if area < self.cluster_min or area > self.cluster_max:
-                continue
-            cx = float(centroids[lbl, 0])
-            cy = float(centroids[lbl, 1])
-            clust_mask = (labels == lbl)
-            mean_v = float(np.mean(v_ch[clust_mask]))
-            mean_s = float(np.mean(s_ch[clust_mask]))
-            score = area * (mean_v / 255.0)
-            dots.append({
-                'x': int(round(cx)),
-                'y': int(round(cy)),
-                'size': area,
-                'score': round(score, 2),
-                'compactness': 0.0,
-                'v': int(round(mean_v / 255.0 * 100)),
-                's': int(round(mean_s / 255.0 * 100)),
-                'h': 0,
-            })
-
-        return dots, total_bright
+            dots = []
+            for lbl in range(1, n_labels):
+                area = int(areas[lbl])
+                if area < self.cluster_min or area > self.cluster_max:
+                    continue
+                mean_v = float(mean_vs[lbl])
+                mean_s = float(mean_ss[lbl])
+                score = area * (mean_v / 255.0)
+                dots.append({
+                    'x': int(round(float(cxs[lbl]))),
+                    'y': int(round(float(cys[lbl]))),
+                    'size': area,
+                    'score': round(score, 2),
+                    'compactness': 0.0,
+                    'v': int(round(mean_v / 255.0 * 100)),
+                    's': int(round(mean_s / 255.0 * 100)),
+                    'h': 0,
+                })
+            results.append((dots, len(py)))
+
+        return results
 
     def _detect_adaptive(
         self,
@@ -480,31 +461,26 @@ class WhiteDotsProcessorV2:
         v_ch = hsv[:, :, 2].astype(np.float32)  # 0-255
         s_ch = hsv[:, :, 1].astype(np.float32)  # 0-255
 
-        # ── Pass primario con parametri utente ────────────────────────────
-        primary_dots, total_bright = self._single_pass_raw(
-            v_ch, s_ch, combined_mask,
-            self.brightness_percentile, self.sat_cap
-        )
+        # ── Pass primario (parametri utente) + pass per il source_count ──
+        configs = [(self.brightness_percentile, self.sat_cap)]
+        configs += [(cfg["brightness_percentile"], cfg["sat_cap"]) for cfg in _MULTI_CONFIGS]
+        passes = self._multi_pass_raw(v_ch, s_ch, combined_mask, configs)
+        primary_dots, total_bright = passes[0]
 
-        # ── Pass aggiuntivi per calcolare source_count ────────────────────
-        extra_runs: List[List[Dict]] = []
-        for cfg in _MULTI_CONFIGS:
-            extra, _ = self._single_pass_raw(
-                v_ch, s_ch, combined_mask,
-                cfg["brightness_percentile"], cfg["sat_cap"]
-            )
-            extra_runs.append(extra)
+        # Griglia spaziale per ogni pass aggiuntivo
+        extra_grids: List[PointGrid] = []
+        for extra, _ in passes[1:]:
+            grid = PointGrid(_MERGE_RADIUS_PX)
+            for od in extra:
+                grid.add(od['x'], od['y'])
+            extra_grids.append(grid)
 
         # ── Calcola source_count e applica nuova formula ──────────────────
         for dot in primary_dots:
             sc = 1  # trovato almeno nel pass primario
-            for run in extra_runs:
-                for od in run:
-                    dx = dot['x'] - od['x']
-                    dy = dot['y'] - od['y']
-                    if math.sqrt(dx * dx + dy * dy) < _MERGE_RADIUS_PX:
-                        sc += 1
-                        break
+            for grid in extra_grids:
+                if grid.any_within(dot['x'], dot['y'], _MERGE_RADIUS_PX):
+                    sc += 1
 
             raw_score = dot['score']   # area × mean_v/255
             sz        = dot['size']    # area
@@ -569,30 +545,33 @@ class WhiteDotsProcessorV2:
             dots, total_white_pixels = self._detect_adaptive(img_array, combined_mask)
         else:
             # ── MODALITÀ LEGACY: soglie HSV assolute ─────────────────────
+            # Classificazione, cluster e statistiche su array (un passaggio)
             rgb_array = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
-            white_pixels = []
-            mask_coords = np.where(combined_mask > 0)
-
-            for y, x in zip(mask_coords[0], mask_coords[1]):
-                r, g, b = rgb_array[y, x]
-                if self.is_white_pixel(r, g, b):
-                    h, s, v = self.rgb_to_hsv(r, g, b)
-                    white_pixels.append({'x': int(x), 'y': int(y), 'r': int(r),
-                                         'g': int(g), 'b': int(b), 'h': h, 's': s, 'v': v})
-
-            clusters = self.cluster_pixels(white_pixels)
-            total_white_pixels = len(white_pixels)
+            mask_ys, mask_xs = np.where(combined_mask > 0)
+            h_px, s_px, v_px = rgb_to_hsv_planes(rgb_array[mask_ys, mask_xs])
+            white = ((s_px >= self.saturation_min) & (s_px <= self.saturation_max)
+                     & (v_px >= self.value_min) & (v_px <= self.value_max))
+            xs, ys = mask_xs[white], mask_ys[white]
+            total_white_pixels = len(xs)
+
+            labels, n_clusters = cluster_labels(xs, ys, self.clustering_radius)
+            stats = cluster_statistics(labels, n_clusters, xs, ys,
+                                       {'h': h_px[white], 's': s_px[white], 'v': v_px[white]})
             dots = []
-            for cluster in clusters:
-                if len(cluster) > self.large_cluster_threshold:
-                    cluster = self.split_large_cluster(cluster)
-                avg_x = sum(p['x'] for p in cluster) / len(cluster)
-                avg_y = sum(p['y'] for p in cluster) / len(cluster)
-                avg_s = sum(p.get('s', 0) for p in cluster) / len(cluster)
-                avg_v = sum(p.get('v', 0) for p in cluster) / len(cluster)
-                avg_h = sum(p.get('h', 0) for p in cluster) / len(cluster)
-                compactness = self.calculate_compactness(cluster)
-                size = len(cluster)
+            for lbl in range(n_clusters):
+                size = int(stats['size'][lbl])
+                if size < self.cluster_min or size > self.cluster_max:
+                    continue
+                avg_x, avg_y = float(stats['cx'][lbl]), float(stats['cy'][lbl])
+                avg_h = float(stats['mean_h'][lbl])
+                avg_s = float(stats['mean_s'][lbl])
+                avg_v = float(stats['mean_v'][lbl])
+                compactness = float(stats['compactness'][lbl])
+                if size > self.large_cluster_threshold:
+                    # Cluster grande → un solo punto nel centroide (come split_large_cluster)
+                    avg_x, avg_y = int(avg_x), int(avg_y)
+                    avg_h, avg_s, avg_v = int(avg_h), int(avg_s), int(avg_v)
+                    size, compactness = 1, 0.0
                 score = size * (1.0 / (compactness + 0.1)) * (avg_v / 100)
                 if compactness >= 1.0:
                     continue
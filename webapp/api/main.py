@@ -19,6 +19,7 @@ import uuid
 from datetime import datetime
 import tempfile
 import os
+import time
 import sys
 import smtplib
 import ssl
@@ -65,9 +66,15 @@ _SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
 if _SRC_PATH not in sys.path:
     sys.path.insert(0, _SRC_PATH)
 
+from dot_utils import nms_by_distance, dot_priority
+
 # Disponibilità white dots: dipende solo da dlib/eyebrows
 WHITE_DOTS_AVAILABLE = True
 
+# Larghezza massima su cui gira il detector HOG di eyebrows.py (0 = piena risoluzione);
+# il rettangolo del volto viene riportato a piena risoluzione per lo shape predictor
+EYEBROWS_DETECT_MAX_WIDTH = int(os.getenv('EYEBROWS_DETECT_MAX_WIDTH', '0'))
+
 # ── Parametri pipeline white-dots (condivisi tra production e debug) ──────────
 WHITE_DOTS_TARGET_WIDTH  = 1200  # larghezza normalizzazione immagine
 WHITE_DOTS_OUTER_PX      = 35    # espansione maschera dlib (zona intera, non striscia)
@@ -1041,7 +1048,8 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
 
     Flusso:
     1. dlib → maschera binaria sopracciglio sx e dx
-    2. Maschera espansa outer_px (zona intera, NON striscia perimetrale)
+    2. Maschera espansa outer_px (zona intera, NON striscia perimetrale); le fasi
+       successive girano solo sul ritaglio che contiene le due zone espanse
     3. Highlight boost: pixel sopra highlight_thresh vengono potenziati verso 255
     4. Soglia assoluta: pixel con luma_min <= gray <= luma_max → candidati principali
        Soglia separata luma_lb/luma_max_lb → ricerca LB/RB agli estremi X
@@ -1087,14 +1095,32 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
         print(f"   📐 resize {_orig_w}×{_orig_h} → {img_bgr.shape[1]}×{img_bgr.shape[0]}")
 
     # Maschere dlib
-    res_dlib = extract_eyebrows_from_array(img_bgr, predictor_path=_dat)
+    res_dlib = extract_eyebrows_from_array(
+        img_bgr, predictor_path=_dat, detect_max_width=EYEBROWS_DETECT_MAX_WIDTH or None)
     if not res_dlib["face_detected"]:
         return {'error': 'Volto non rilevato da dlib.', 'dots': [], 'total_white_pixels': 0}
 
-    h, w = img_bgr.shape[:2]
+    all_dots      = []
+    left_polygon  = None
+    right_polygon = None
+    total_white   = 0
+
+    # ROI: unione dei box delle maschere dlib espansi di OUTER_PX (la dilatazione
+    # ellittica non va oltre). Tutte le elaborazioni girano sul ritaglio e le
+    # coordinate vengono riportate all'immagine con l'offset (x0, y0).
+    full_h, full_w = img_bgr.shape[:2]
+    ys_any, xs_any = np.nonzero(res_dlib['left_mask'] | res_dlib['right_mask'])
+    if len(xs_any) == 0:
+        return {'dots': [], 'total_white_pixels': 0, 'left_polygon': None, 'right_polygon': None}
+    x0 = max(0, int(xs_any.min()) - OUTER_PX)
+    y0 = max(0, int(ys_any.min()) - OUTER_PX)
+    x1 = min(full_w, int(xs_any.max()) + OUTER_PX + 1)
+    y1 = min(full_h, int(ys_any.max()) + OUTER_PX + 1)
+    img_roi = img_bgr[y0:y1, x0:x1]
+    h, w = img_roi.shape[:2]
 
     # Highlight boost separato: zona interna (inner) e strip esterna (outer)
-    gray_raw = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gray_raw = cv2.cvtColor(img_roi, cv2.COLOR_BGR2GRAY).astype(np.float32)
     # boost zona interna
     gray_inner_f = gray_raw.copy()
     mask_hi_inner = gray_raw >= HL_THRESH_INNER
@@ -1110,11 +1136,7 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
 
     k_outer = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (OUTER_PX*2+1, OUTER_PX*2+1))
 
-    all_dots      = []
-    left_polygon  = None
-    right_polygon = None
-    total_white   = 0
-    col_idx = np.indices((h, w))[1]   # matrice degli indici di colonna (calcolata una sola volta)
+    col_idx = np.arange(w)[np.newaxis, :]   # indici di colonna del ritaglio (broadcast sulle righe)
 
     def _filter_by_circularity(cc_mask, lbl_map, stats_cc, centroids, n_lbl, gray_img,
                                 min_circ, max_circ, min_peri, max_peri, forced=False):
@@ -1122,7 +1144,15 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
         result = []
         for lbl in range(1, n_lbl):
             area = int(stats_cc[lbl, cv2.CC_STAT_AREA])
-            blob_mask = (lbl_map == lbl).astype(np.uint8)
+            # Analisi limitata al bounding box del blob (costo indipendente dalla
+            # dimensione immagine); bordo di 1 px così il contorno non tocca il
+            # margine del ritaglio. arcLength è invariante per traslazione.
+            bx = int(stats_cc[lbl, cv2.CC_STAT_LEFT])
+            by = int(stats_cc[lbl, cv2.CC_STAT_TOP])
+            bw = int(stats_cc[lbl, cv2.CC_STAT_WIDTH])
+            bh = int(stats_cc[lbl, cv2.CC_STAT_HEIGHT])
+            blob = lbl_map[by:by + bh, bx:bx + bw] == lbl
+            blob_mask = np.pad(blob.astype(np.uint8), 1)
             cnts, _ = cv2.findContours(blob_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
             if not cnts:
                 continue
@@ -1132,9 +1162,9 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
             circularity = (4.0 * math.pi * area / (perimeter ** 2)) if perimeter > 0 else 0.0
             if circularity < min_circ or circularity > max_circ:
                 continue
-            cx = float(centroids[lbl, 0])
-            cy = float(centroids[lbl, 1])
-            mean_luma = float(np.mean(gray_img[lbl_map == lbl]))
+            cx = float(centroids[lbl, 0]) + x0
+            cy = float(centroids[lbl, 1]) + y0
+            mean_luma = float(np.mean(gray_img[by:by + bh, bx:bx + bw][blob]))
             d = {
                 'x':     int(round(cx)),
                 'y':     int(round(cy)),
@@ -1147,15 +1177,17 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
             result.append(d)
         return result
 
-    for side, mask in [('left', res_dlib['left_mask']), ('right', res_dlib['right_mask'])]:
+    for side, mask_full in [('left', res_dlib['left_mask']), ('right', res_dlib['right_mask'])]:
+        mask = mask_full[y0:y1, x0:x1]
         if not np.any(mask):
             continue
 
         # Zona di ricerca: maschera espansa (INTERA, non solo bordo)
         expanded = cv2.dilate(mask, k_outer, iterations=1)
 
-        # Salva contorno per overlay frontend
-        cnts, _ = cv2.findContours(expanded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Salva contorno per overlay frontend (coordinate immagine intera)
+        cnts, _ = cv2.findContours(expanded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                   offset=(x0, y0))
         if cnts:
             polygon = max(cnts, key=cv2.contourArea).squeeze()
             if side == 'left':
@@ -1223,57 +1255,41 @@ def _detect_white_dots_v3(img_bgr: np.ndarray,
 
 
 def _nms_by_distance(pts: list, min_dist: float, debug: bool = False) -> tuple:
-    """NMS per distanza: rimuove punti troppo vicini, tenendo quello con score più alto.
-    I punti forzati (flag 'forced'=True) vengono sempre mantenuti.
-    Criterio di selezione: score più alto, poi circolarità più alta.
+    """NMS per distanza: rimuove punti troppo vicini (≤ min_dist), tenendo quello con score più alto.
+    Priorità: forzati prima, poi score più alto, poi circolarità più alta (dot_utils.nms_by_distance,
+    indicizzata a griglia). Il motivo dello scarto ('nms_reason') viene calcolato solo in debug.
     Restituisce: (blob_kept, blob_rejected_by_nms)"""
     if min_dist <= 0:
         if debug:
             print(f"   [NMS] Disabilitato (min_dist={min_dist})")
         return pts, []
-    # Prima ordina: forzati prima, poi per score decrescente, poi circolarità decrescente
-    ordered = sorted(pts, key=lambda d: (0 if d.get('forced') else 1, -d.get('score', 0), -d.get('circ', 0)))
-    
+
     if debug:
         print(f"   [NMS] Ordine elaborazione (forzati prima, poi score/circ decrescente):")
-        for idx, p in enumerate(ordered):
+        for idx, p in enumerate(sorted(pts, key=dot_priority)):
             forced_tag = " [FORCED]" if p.get('forced') else ""
             print(f"      #{idx+1}: ({p['x']}, {p['y']}) score={p.get('score',0):.1f} circ={p.get('circ',0):.3f}{forced_tag}")
-    
-    kept = []
+
+    kept, rejected_info = nms_by_distance(pts, min_dist, inclusive=True, nearest=debug)
+
+    if debug:
+        for p in kept:
+            forced_tag = " [FORCED]" if p.get('forced') else ""
+            print(f"      ✅ KEPT: ({p['x']}, {p['y']}) score={p.get('score',0):.1f}{forced_tag}")
+
     rejected = []
-    for p in ordered:
-        too_close = False
-        closest_dist = float('inf')
-        closest_blob = None
-        for k in kept:
-            dist = math.hypot(p['x'] - k['x'], p['y'] - k['y'])
-            if debug and dist <= min_dist:
-                print(f"      ⚠️  Blob ({p['x']}, {p['y']}) è vicino a ({k['x']}, {k['y']}): dist={dist:.1f}px <= {min_dist}px")
-            if dist <= min_dist:  # <= invece di < per includere anche distanza esatta
-                too_close = True
-                if dist < closest_dist:
-                    closest_dist = dist
-                    closest_blob = k
-        if not too_close:
-            kept.append(p)
-            if debug:
-                forced_tag = " [FORCED]" if p.get('forced') else ""
-                print(f"      ✅ KEPT: ({p['x']}, {p['y']}) score={p.get('score',0):.1f}{forced_tag}")
-        else:
+    for p, closest_blob, closest_dist in rejected_info:
+        p['nms_rejected'] = True
+        if debug:
             # Aggiungi informazioni sul perché è stato eliminato
-            p['nms_rejected'] = True
             p['nms_reason'] = f"troppo vicino a blob score={closest_blob.get('score',0):.0f} (dist={closest_dist:.1f}px <= {min_dist}px)"
-            rejected.append(p)
-            if debug:
-                print(f"      ❌ REJECTED: ({p['x']}, {p['y']}) score={p.get('score',0):.1f} - {p['nms_reason']}")
-    
+            print(f"      ❌ REJECTED: ({p['x']}, {p['y']}) score={p.get('score',0):.1f} - {p['nms_reason']}")
+        rejected.append(p)
+
     if debug:
         print(f"   [NMS] Risultato finale: {len(pts)} → {len(kept)} blob (eliminati {len(rejected)})")
-    
-    return kept, rejected
-
 
+    return kept, rejected
 
 
 def process_green_dots_analysis(image_base64: str, **kwargs) -> Dict:
@@ -3934,6 +3950,128 @@ def _upscale_for_labels(img: np.ndarray, target_w: int = 2400) -> tuple:
     return img_up, scale
 
 
+def _prepare_debug_stage(img_bgr: np.ndarray, target_width: int) -> dict:
+    """
+    Stadi della pipeline debug indipendenti dai parametri di soglia: resize a
+    target_width, maschere dlib e grayscale float32. Sono gli stadi costosi che
+    una sessione di tuning calcola una volta sola per foto e larghezza.
+    """
+    from eyebrows import extract_eyebrows_from_array
+
+    _dat = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), '..', '..',
+        'face-landmark-localization-master', 'shape_predictor_68_face_landmarks.dat'
+    ))
+
+    _orig_h, _orig_w = img_bgr.shape[:2]
+    if _orig_w != target_width:
+        _scale  = target_width / _orig_w
+        img_bgr = cv2.resize(img_bgr, (target_width, max(1, round(_orig_h * _scale))),
+                             interpolation=cv2.INTER_AREA if _orig_w > target_width else cv2.INTER_LINEAR)
+
+    res_dlib = extract_eyebrows_from_array(
+        img_bgr, predictor_path=_dat, detect_max_width=EYEBROWS_DETECT_MAX_WIDTH or None)
+    return {
+        'img_bgr':  img_bgr,
+        'res_dlib': res_dlib,
+        'gray_raw': cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY).astype(np.float32),
+    }
+
+
+# ── Sessioni di tuning per /api/debug/trova-differenze ────────────────────────
+# La foto viene caricata una volta: gli stadi di _prepare_debug_stage restano in
+# cache per target_width e a ogni cambio slider si ricalcolano solo gli stadi di
+# soglia. Con lazy_images le immagini degli step (già ridotte al lato massimo di
+# risposta) vengono codificate solo quando il client le richiede.
+# La memoria è limitata da TTL, numero di sessioni, stadi per sessione e byte totali.
+TUNING_SESSION_TTL_S      = 15 * 60            # inattività massima di una sessione
+TUNING_SESSION_MAX        = 8                  # sessioni in memoria (oltre: si scarta la meno recente)
+TUNING_SESSION_MAX_STAGES = 3                  # target_width in cache per sessione
+TUNING_SESSION_MAX_BYTES  = 512 * 1024 * 1024  # memoria stimata di tutte le sessioni
+
+_tuning_sessions: Dict[str, dict] = {}
+_tuning_sessions_lock = threading.Lock()
+
+
+def _tuning_nbytes(obj) -> int:
+    """Byte approssimati di array e buffer contenuti in obj (dict/list/tuple annidati)."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_tuning_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_tuning_nbytes(v) for v in obj)
+    return 0
+
+
+def _update_tuning_nbytes(session: dict) -> None:
+    """Ricalcola la memoria della sessione (chiamare con session['lock'] acquisito)."""
+    session['nbytes'] = (session['image'].nbytes + _tuning_nbytes(session['stages'])
+                         + _tuning_nbytes(session['images']) + _tuning_nbytes(session['encoded']))
+
+
+def _evict_tuning_sessions(now: float, keep: str = None, new_bytes: int = 0) -> None:
+    """
+    Scarta le sessioni scadute e poi le meno recenti finché numero e byte
+    rientrano nei limiti; keep non viene mai scartata, new_bytes > 0 riserva
+    posto a una sessione in arrivo. Da chiamare con _tuning_sessions_lock.
+    """
+    for sid in [k for k, v in _tuning_sessions.items() if now - v['last_used'] > TUNING_SESSION_TTL_S]:
+        del _tuning_sessions[sid]
+    max_sessions = TUNING_SESSION_MAX - (1 if new_bytes else 0)
+    while True:
+        others = [k for k in _tuning_sessions if k != keep]
+        total = new_bytes + sum(v['nbytes'] for v in _tuning_sessions.values())
+        if not others or (len(_tuning_sessions) <= max_sessions and total <= TUNING_SESSION_MAX_BYTES):
+            return
+        del _tuning_sessions[min(others, key=lambda k: _tuning_sessions[k]['last_used'])]
+
+
+def _create_tuning_session(img_bgr: np.ndarray) -> str:
+    """Registra una nuova sessione di tuning e restituisce il suo id."""
+    now = time.time()
+    session_id = uuid.uuid4().hex
+    with _tuning_sessions_lock:
+        _evict_tuning_sessions(now, new_bytes=img_bgr.nbytes)
+        _tuning_sessions[session_id] = {
+            'image':     img_bgr,
+            'stages':    {},     # target_width → dict di _prepare_debug_stage (al più MAX_STAGES)
+            'images':    {},     # step → (img ridotta, quality) dell'ultimo render, finché non codificata
+            'encoded':   {},     # step → bytes JPEG già codificati dell'ultimo render
+            'render_id': 0,
+            'lock':      threading.Lock(),
+            'last_used': now,
+            'nbytes':    img_bgr.nbytes,
+        }
+    return session_id
+
+
+def _get_tuning_session(session_id: str) -> dict:
+    """Restituisce la sessione (aggiornandone l'ultimo uso) o 404 se scaduta/inesistente."""
+    now = time.time()
+    with _tuning_sessions_lock:
+        session = _tuning_sessions.get(session_id)
+        if session is None or now - session['last_used'] > TUNING_SESSION_TTL_S:
+            _tuning_sessions.pop(session_id, None)
+            raise HTTPException(status_code=404, detail="Sessione di tuning scaduta o inesistente")
+        session['last_used'] = now
+        return session
+
+
+def _decode_debug_image(data_url: str) -> np.ndarray:
+    """Decodifica un'immagine base64 (con o senza prefisso data:image/...) in BGR."""
+    b64 = data_url
+    if ',' in b64:
+        b64 = b64.split(',', 1)[1]
+    arr = np.frombuffer(base64.b64decode(b64), dtype=np.uint8)
+    img_bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    if img_bgr is None:
+        raise ValueError("Impossibile decodificare l'immagine")
+    return img_bgr
+
+
 def _generate_debug_steps(img_bgr: np.ndarray,
                            target_width: int        = None,
                            outer_px: int            = None,
@@ -3954,30 +4092,38 @@ def _generate_debug_steps(img_bgr: np.ndarray,
                            min_perimeter_outer: int = None,
                            max_perimeter_outer: int = None,
                            min_distance: int = None,
+                           prepared: dict = None,
+                           image_store: dict = None,
                            **_kwargs) -> list:
     """
     Pipeline debug step-by-step: zona espansa → highlight boost → rilevamento → anatomico.
-    """
-    try:
-        from eyebrows import extract_eyebrows_from_array
-    except ImportError:
-        return [{"step": 0, "name": "Errore", "description": "Modulo eyebrows (dlib) non disponibile.", "image_b64": ""}]
 
-    _dat = os.path.abspath(os.path.join(
-        os.path.dirname(__file__), '..', '..',
-        'face-landmark-localization-master', 'shape_predictor_68_face_landmarks.dat'
-    ))
+    prepared    : stadi già calcolati da _prepare_debug_stage (sessione di tuning)
+    image_store : se dato, le immagini degli step non vengono codificate ma salvate
+                  qui già ridotte (step → (img, quality)) per il rendering su richiesta
+    """
+    if prepared is None:
+        try:
+            import eyebrows  # noqa: F401
+        except ImportError:
+            return [{"step": 0, "name": "Errore", "description": "Modulo eyebrows (dlib) non disponibile.", "image_b64": ""}]
 
     steps = []
 
     def _push(step_n, name, desc, img, hires=False, extra=None):
         max_s = 2400 if hires else 1200
         qual  = 90   if hires else 82
+        if image_store is not None:
+            # Copia ridotta: la sessione non trattiene gli array di lavoro a piena risoluzione
+            image_store[step_n] = (_resize_debug(img, max_side=max_s).copy(), qual)
+            image_b64 = ""
+        else:
+            image_b64 = _img_to_b64(_resize_debug(img.copy(), max_side=max_s), quality=qual)
         entry = {
             "step": step_n,
             "name": name,
             "description": desc,
-            "image_b64": _img_to_b64(_resize_debug(img.copy(), max_side=max_s), quality=qual)
+            "image_b64": image_b64
         }
         if extra:
             entry.update(extra)
@@ -4003,21 +4149,19 @@ def _generate_debug_steps(img_bgr: np.ndarray,
     MAX_PERI_OUTER     = max_perimeter_outer    if max_perimeter_outer    is not None else WHITE_DOTS_MAX_PERIMETER_OUTER
     MIN_DISTANCE       = min_distance           if min_distance           is not None else WHITE_DOTS_MIN_DISTANCE
 
-    _orig_h, _orig_w = img_bgr.shape[:2]
-    if _orig_w != TARGET_WIDTH:
-        _scale  = TARGET_WIDTH / _orig_w
-        img_bgr = cv2.resize(img_bgr, (TARGET_WIDTH, max(1, round(_orig_h * _scale))),
-                             interpolation=cv2.INTER_AREA if _orig_w > TARGET_WIDTH else cv2.INTER_LINEAR)
+    if prepared is None:
+        prepared = _prepare_debug_stage(img_bgr, TARGET_WIDTH)
+    img_bgr  = prepared['img_bgr']
+    res_dlib = prepared['res_dlib']
 
     h, w = img_bgr.shape[:2]
 
-    res_dlib = extract_eyebrows_from_array(img_bgr, predictor_path=_dat)
     if not res_dlib["face_detected"]:
         _push(1, "Errore dlib", "Volto non rilevato da dlib — impossibile procedere.", img_bgr)
         return steps
 
     # Highlight boost separato per zona interna e strip esterna
-    gray_raw = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gray_raw = prepared['gray_raw']
     gray_inner_f = gray_raw.copy()
     mask_hi_inner = gray_raw >= HL_THRESH_INNER
     gray_inner_f[mask_hi_inner] = np.clip(
@@ -4355,7 +4499,9 @@ def _generate_debug_steps(img_bgr: np.ndarray,
 
 
 class WhiteDotsDebugRequest(BaseModel):
-    image: str
+    image: Optional[str] = None         # obbligatoria senza session_id
+    session_id: Optional[str] = None    # sessione di tuning (foto già caricata)
+    lazy_images: bool = False           # solo con session_id: immagini step via image_url
     target_width:           int   = WHITE_DOTS_TARGET_WIDTH
     outer_px:               int   = WHITE_DOTS_OUTER_PX
     luma_min:               int   = WHITE_DOTS_LUMA_MIN
@@ -4377,47 +4523,119 @@ class WhiteDotsDebugRequest(BaseModel):
     min_distance:           int   = WHITE_DOTS_MIN_DISTANCE
 
 
+class TuningSessionRequest(BaseModel):
+    image: str  # dataURL base64 (con o senza prefisso data:image/...)
+
+
+@app.post("/api/debug/trova-differenze/session")
+async def create_trova_differenze_session(payload: TuningSessionRequest):
+    """
+    Apre una sessione di tuning: la foto viene decodificata una volta e le
+    chiamate successive a /api/debug/trova-differenze con session_id riusano
+    resize, maschere dlib e grayscale.
+    Risposta: { success: true, session_id, width, height, ttl_s }
+    """
+    try:
+        img_bgr = _decode_debug_image(payload.image)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Immagine non valida: {e}")
+    session_id = _create_tuning_session(img_bgr)
+    h, w = img_bgr.shape[:2]
+    return {"success": True, "session_id": session_id, "width": w, "height": h,
+            "ttl_s": TUNING_SESSION_TTL_S}
+
+
+@app.delete("/api/debug/trova-differenze/session/{session_id}")
+async def delete_trova_differenze_session(session_id: str):
+    """Chiude la sessione di tuning e libera la cache."""
+    with _tuning_sessions_lock:
+        removed = _tuning_sessions.pop(session_id, None) is not None
+    return {"success": True, "removed": removed}
+
+
+@app.get("/api/debug/trova-differenze/session/{session_id}/step/{step_n}")
+async def get_trova_differenze_step_image(session_id: str, step_n: int):
+    """Codifica (una volta per render) e restituisce l'immagine JPEG di uno step."""
+    from fastapi.responses import Response
+    session = _get_tuning_session(session_id)
+    with session['lock']:
+        data = session['encoded'].get(step_n)
+        if data is None:
+            item = session['images'].pop(step_n, None)
+            if item is None:
+                raise HTTPException(status_code=404, detail=f"Step {step_n} non disponibile")
+            img, quality = item
+            _, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            data = session['encoded'][step_n] = buf.tobytes()
+            _update_tuning_nbytes(session)
+    return Response(content=data, media_type="image/jpeg",
+                    headers={"Cache-Control": "private, max-age=600"})
+
+
 @app.post("/api/debug/trova-differenze")
 async def debug_trova_differenze(payload: WhiteDotsDebugRequest):
     """
     Esegue la pipeline step-by-step e restituisce 3 step di debug.
+    Con session_id riusa gli stadi in cache della sessione di tuning; con
+    lazy_images ogni step ha image_url al posto di image_b64.
     Risposta: { success: true, steps: [...], total: 3 }
     """
+    params = dict(
+        target_width=payload.target_width,
+        outer_px=payload.outer_px,
+        luma_min=payload.luma_min,
+        luma_max=payload.luma_max,
+        luma_lb=payload.luma_lb,
+        luma_max_lb=payload.luma_max_lb,
+        highlight_thresh_inner=payload.highlight_thresh_inner,
+        highlight_strength_inner=payload.highlight_strength_inner,
+        highlight_thresh_outer=payload.highlight_thresh_outer,
+        highlight_strength_outer=payload.highlight_strength_outer,
+        min_circularity_inner=payload.min_circularity_inner,
+        max_circularity_inner=payload.max_circularity_inner,
+        min_perimeter_inner=payload.min_perimeter_inner,
+        max_perimeter_inner=payload.max_perimeter_inner,
+        min_circularity_outer=payload.min_circularity_outer,
+        max_circularity_outer=payload.max_circularity_outer,
+        min_perimeter_outer=payload.min_perimeter_outer,
+        max_perimeter_outer=payload.max_perimeter_outer,
+        min_distance=payload.min_distance,
+    )
     try:
-        import base64 as _b64
-        b64 = payload.image
-        if ',' in b64:
-            b64 = b64.split(',', 1)[1]
-        img_bytes = _b64.b64decode(b64)
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        img_bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img_bgr is None:
-            raise ValueError("Impossibile decodificare l'immagine")
-
-        steps = _generate_debug_steps(
-            img_bgr,
-            target_width=payload.target_width,
-            outer_px=payload.outer_px,
-            luma_min=payload.luma_min,
-            luma_max=payload.luma_max,
-            luma_lb=payload.luma_lb,
-            luma_max_lb=payload.luma_max_lb,
-            highlight_thresh_inner=payload.highlight_thresh_inner,
-            highlight_strength_inner=payload.highlight_strength_inner,
-            highlight_thresh_outer=payload.highlight_thresh_outer,
-            highlight_strength_outer=payload.highlight_strength_outer,
-            min_circularity_inner=payload.min_circularity_inner,
-            max_circularity_inner=payload.max_circularity_inner,
-            min_perimeter_inner=payload.min_perimeter_inner,
-            max_perimeter_inner=payload.max_perimeter_inner,
-            min_circularity_outer=payload.min_circularity_outer,
-            max_circularity_outer=payload.max_circularity_outer,
-            min_perimeter_outer=payload.min_perimeter_outer,
-            max_perimeter_outer=payload.max_perimeter_outer,
-            min_distance=payload.min_distance,
-        )
+        if payload.session_id:
+            session = _get_tuning_session(payload.session_id)
+            with session['lock']:
+                stages = session['stages']
+                prepared = stages.pop(payload.target_width, None)
+                if prepared is None:
+                    prepared = _prepare_debug_stage(session['image'], payload.target_width)
+                    while len(stages) >= TUNING_SESSION_MAX_STAGES:
+                        del stages[next(iter(stages))]  # la larghezza usata meno di recente
+                stages[payload.target_width] = prepared
+                image_store = {} if payload.lazy_images else None
+                steps = _generate_debug_steps(session['image'], prepared=prepared,
+                                              image_store=image_store, **params)
+                if image_store is not None:
+                    session['render_id'] += 1
+                    session['images'] = image_store
+                    session['encoded'] = {}
+                    for step in steps:
+                        if step["step"] in image_store:
+                            step["image_url"] = (f"/api/debug/trova-differenze/session/{payload.session_id}"
+                                                 f"/step/{step['step']}?r={session['render_id']}")
+                _update_tuning_nbytes(session)
+            with _tuning_sessions_lock:
+                _evict_tuning_sessions(time.time(), keep=payload.session_id)
+            return {"success": True, "steps": steps, "total": len(steps)}
+
+        if not payload.image:
+            raise HTTPException(status_code=400, detail="Serve image oppure session_id")
+        img_bgr = _decode_debug_image(payload.image)
+        steps = _generate_debug_steps(img_bgr, **params)
         return {"success": True, "steps": steps, "total": len(steps)}
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -4525,7 +4743,8 @@ async def eyebrow_symmetry(payload: EyebrowSymmetryRequest):
             raise ValueError("Impossibile decodificare l'immagine base64.")
 
         # --- segmentazione dlib ---
-        res = extract_eyebrows_from_array(img_bgr, predictor_path=_DAT_PATH)
+        res = extract_eyebrows_from_array(
+            img_bgr, predictor_path=_DAT_PATH, detect_max_width=EYEBROWS_DETECT_MAX_WIDTH or None)
         if not res["face_detected"]:
             return {"face_detected": False, "overlay_b64": "", "left_area": 0, "right_area": 0}
 
@@ -10,9 +10,35 @@ const FRAME_CONFIG = {
   maxBufferSize: 10,
   earlyStopThreshold: 0.92,
   minFramesForEarlyStop: 5,
-  samplingInterval: 66 // ~15 FPS
+  samplingInterval: 66, // ~15 FPS
+  serverTarget: null // {fps, max_dim, quality} dall'ultimo flow_control del server WebSocket
 };
 
+// ============================================================================
+// TARGET DI CATTURA NEGOZIATO DAL SERVER
+// Il server WebSocket invia in 'flow_control' un target {fps, max_dim, quality}
+// calcolato dal proprio carico: i loop di cattura non lo superano mai.
+// ============================================================================
+function applyServerCaptureTarget(target) {
+  if (!target || !target.fps) return;
+  const prev = FRAME_CONFIG.serverTarget;
+  if (!prev || prev.fps !== target.fps || prev.max_dim !== target.max_dim || prev.quality !== target.quality) {
+    console.log(`🎛️ Target server: ${target.fps} fps, lato max ${target.max_dim}px, qualità ${target.quality}`);
+  }
+  FRAME_CONFIG.serverTarget = target;
+}
+
+// Parametri effettivi: i valori locali limitati dal target server (se presente)
+function effectiveCaptureParams(intervalMs, maxPx, jpegQuality) {
+  const t = FRAME_CONFIG.serverTarget;
+  if (!t) return { intervalMs, maxPx, jpegQuality };
+  return {
+    intervalMs: Math.max(intervalMs, t.fps ? 1000 / t.fps : 0),
+    maxPx: t.max_dim ? Math.min(maxPx || Infinity, t.max_dim) : maxPx,
+    jpegQuality: t.quality ? Math.min(jpegQuality, t.quality / 100) : jpegQuality
+  };
+}
+
 // ============================================================================
 // TOP-K BUFFER
 // ============================================================================
@@ -160,7 +186,8 @@ class UnifiedFrameProcessor {
     try {
       const rawCanvas = await frameSource.captureFrame(options.time);
       const standardCanvas = standardizeResolution(rawCanvas);
-      const base64Image = standardCanvas.toDataURL('image/jpeg', FRAME_CONFIG.jpegQuality);
+      const { jpegQuality } = effectiveCaptureParams(0, null, FRAME_CONFIG.jpegQuality);
+      const base64Image = standardCanvas.toDataURL('image/jpeg', jpegQuality);
 
       const result = await analyzeImageViaAPI(base64Image);
 
@@ -221,18 +248,21 @@ class UnifiedFrameProcessor {
         await new Promise(resolve => setTimeout(resolve, 100));
       }
     } else if (frameSource.type === 'webcam') {
-      this.intervalId = setInterval(async () => {
-        if (!this.isProcessing) {
-          clearInterval(this.intervalId);
-          return;
-        }
+      // setTimeout a catena: l'intervallo segue il target del server a ogni frame
+      const tick = async () => {
+        if (!this.isProcessing) return;
+        const started = performance.now();
 
         await this.processFrame(frameSource, Date.now(), { onFrameProcessed: options.onProgress });
 
         if (this.buffer.shouldEarlyStop() && this.buffer.size >= FRAME_CONFIG.minFramesForEarlyStop) {
           this.stop();
+          return;
         }
-      }, FRAME_CONFIG.samplingInterval);
+        const { intervalMs } = effectiveCaptureParams(FRAME_CONFIG.samplingInterval, null, FRAME_CONFIG.jpegQuality);
+        this.intervalId = setTimeout(tick, Math.max(0, intervalMs - (performance.now() - started)));
+      };
+      this.intervalId = setTimeout(tick, FRAME_CONFIG.samplingInterval);
     }
 
     if (options.onComplete) {
@@ -247,7 +277,7 @@ class UnifiedFrameProcessor {
   stop() {
     this.isProcessing = false;
     if (this.intervalId) {
-      clearInterval(this.intervalId);
+      clearTimeout(this.intervalId);
       this.intervalId = null;
     }
   }
@@ -267,3 +297,5 @@ window.FrameSource = FrameSource;
 window.UnifiedFrameProcessor = UnifiedFrameProcessor;
 window.standardizeResolution = standardizeResolution;
 window.FRAME_CONFIG = FRAME_CONFIG;
+window.applyServerCaptureTarget = applyServerCaptureTarget;
+window.effectiveCaptureParams = effectiveCaptureParams;
@@ -2496,9 +2496,13 @@ async function startWebcamDirect() {
           session_id: `iphone_session_${new Date().toISOString().replace(/[:.]/g, '_')}`,
           session_token: window._iphoneSessionToken || ''
         }));
+        // Anteprima: il server riduce il frame iPhone alla larghezza utile del
+        // fullscreen desktop e ne limita la frequenza (i metadati arrivano sempre)
+        const previewWidth = Math.round(window.innerWidth * (window.devicePixelRatio || 1));
         webcamWebSocket.send(JSON.stringify({
           action: 'start_webcam',
-          session_token: window._iphoneSessionToken || ''
+          session_token: window._iphoneSessionToken || '',
+          preview: { max_width: Math.min(previewWidth, 1280), max_fps: 15, quality: 70 }
         }));
       }
 
@@ -2762,6 +2766,7 @@ async function connectWebcamWebSocket() {
       const wsUrl = `${protocol}//${hostname}/ws`;
 
       const newWebSocket = new WebSocket(wsUrl);
+      newWebSocket.binaryType = 'arraybuffer';
 
       newWebSocket.onopen = function () {
         // ✅ FIX: Assegna solo dopo che è connesso
@@ -2771,14 +2776,17 @@ async function connectWebcamWebSocket() {
         // Registra desktop per ricevere notifiche iPhone (con session_token per isolamento utente)
         webcamWebSocket.send(JSON.stringify({
           action: 'register_desktop',
-          session_token: window._iphoneSessionToken || ''
+          session_token: window._iphoneSessionToken || '',
+          binary: true,  // iphone_frame_processed come JPEG grezzo + landmark binari
+          landmark_encoding: 'int16_norm'  // landmark quantizzati a int16 (metà dei byte)
         }));
 
         // Avvia sessione
         const startMessage = {
           action: 'start_session',
           session_id: `webapp_session_${new Date().toISOString().replace(/[:.]/g, '_')}`,
-          session_token: window._iphoneSessionToken || ''
+          session_token: window._iphoneSessionToken || '',
+          capture_target: true  // ricevi flow_control con il target di cattura del server
         };
         webcamWebSocket.send(JSON.stringify(startMessage));
 
@@ -2787,7 +2795,9 @@ async function connectWebcamWebSocket() {
 
       newWebSocket.onmessage = function (event) {
         try {
-          const data = JSON.parse(event.data);
+          const data = typeof event.data === 'string'
+            ? JSON.parse(event.data)
+            : parseBinaryWsMessage(event.data);
           handleWebSocketMessage(data);
         } catch (error) {
           console.error('Errore parsing messaggio WebSocket:', error);
@@ -2813,6 +2823,62 @@ async function connectWebcamWebSocket() {
   });
 }
 
+/*
+ * Decodifica un messaggio binario del server WebSocket (vedi websocket_frame_api.py):
+ * header 12 byte | JSON metadati | landmark float32/int16 | JPEG grezzo (opzionale).
+ * I landmark diventano Float32Array normalizzati per gruppo, il JPEG un Blob in data.frame_blob.
+ */
+const _wsTextDecoder = new TextDecoder();
+
+// Landmark int16 ('landmark_encoding' int16_norm / int16_px) → float normalizzati [0,1]
+function dequantizeWsLandmarks(ints, data) {
+  const out = new Float32Array(ints.length);
+  if (data.landmark_encoding === 'int16_px' && data.image_size) {
+    const [w, h] = data.image_size;
+    for (let i = 0; i < ints.length; i += 2) {
+      out[i] = ints[i] / w;
+      out[i + 1] = ints[i + 1] / h;
+    }
+  } else {
+    const scale = data.landmark_scale || 32767;
+    for (let i = 0; i < ints.length; i++) out[i] = ints[i] / scale;
+  }
+  return out;
+}
+
+function parseBinaryWsMessage(buffer) {
+  const view = new DataView(buffer);
+  const jsonLen = view.getUint32(8, true);
+  const data = JSON.parse(_wsTextDecoder.decode(new Uint8Array(buffer, 12, jsonLen)));
+  data.seq = view.getUint32(4, true);
+  let offset = 12 + jsonLen;
+  if (data.landmarks_bytes && data.landmark_layout) {
+    const flat = data.landmark_dtype === 'i2'
+      ? dequantizeWsLandmarks(new Int16Array(buffer, offset, data.landmarks_bytes / 2), data)
+      : new Float32Array(buffer, offset, data.landmarks_bytes / 4);
+    data.landmarks = {};
+    for (const [group, [start, count]] of Object.entries(data.landmark_layout)) {
+      data.landmarks[group] = flat.subarray(start * 2, (start + count) * 2);
+    }
+    offset += data.landmarks_bytes;
+  }
+  if (data.jpeg_bytes) {
+    data.frame_blob = new Blob([new Uint8Array(buffer, offset, data.jpeg_bytes)], { type: 'image/jpeg' });
+  }
+  return data;
+}
+
+// Frame come base64 (senza prefisso data URL) da frame_data legacy o Blob binario
+function frameToBase64(frame) {
+  if (!(frame instanceof Blob)) return Promise.resolve(frame);
+  return new Promise((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onload = () => resolve(reader.result.slice(reader.result.indexOf(',') + 1));
+    reader.onerror = reject;
+    reader.readAsDataURL(frame);
+  });
+}
+
 function disconnectWebcamWebSocket() {
   if (webcamWebSocket) {
     if (webcamWebSocket.readyState === WebSocket.OPEN) {
@@ -2881,7 +2947,12 @@ function startFrameCapture(video) {
   function captureLoop(timestamp) {
     if (!isWebcamActive) return; // Ferma il loop se webcam disattivata
 
-    if (timestamp - lastCaptureTimestamp >= FRAME_INTERVAL_MS) {
+    // Il target del server (flow_control) può solo ridurre rate, risoluzione e qualità
+    const capture = typeof effectiveCaptureParams === 'function'
+      ? effectiveCaptureParams(FRAME_INTERVAL_MS, maxAllowed, jpegQuality)
+      : { intervalMs: FRAME_INTERVAL_MS, maxPx: maxAllowed, jpegQuality };
+
+    if (timestamp - lastCaptureTimestamp >= capture.intervalMs) {
       if (webcamWebSocket && webcamWebSocket.readyState === WebSocket.OPEN) {
         try {
           const vw = video.videoWidth || 640;
@@ -2897,8 +2968,8 @@ function startFrameCapture(video) {
           // 2. Scala se necessario (riuso resizedCanvas)
           let finalCanvas = rawCanvas;
           const maxDim = Math.max(vw, vh);
-          if (maxDim > maxAllowed) {
-            const scale = maxAllowed / maxDim;
+          if (maxDim > capture.maxPx) {
+            const scale = capture.maxPx / maxDim;
             const rw = Math.round(vw * scale);
             const rh = Math.round(vh * scale);
             if (resizedCanvas.width !== rw || resizedCanvas.height !== rh) {
@@ -2911,7 +2982,7 @@ function startFrameCapture(video) {
             finalCanvas = resizedCanvas;
           }
 
-          const frameBase64 = finalCanvas.toDataURL('image/jpeg', jpegQuality).split(',')[1];
+          const frameBase64 = finalCanvas.toDataURL('image/jpeg', capture.jpegQuality).split(',')[1];
 
           const frameMessage = {
             action: 'process_frame',
@@ -3912,6 +3983,13 @@ function handleWebSocketMessage(data) {
         // Risposta al ping - ignora
         break;
 
+      case 'flow_control':
+        // Target di cattura calcolato dal server sul proprio carico
+        if (typeof applyServerCaptureTarget === 'function') {
+          applyServerCaptureTarget(data.target);
+        }
+        break;
+
       default:
         if (data.error) {
           console.error('Errore dal server:', data.error);
@@ -8389,6 +8467,55 @@ document.addEventListener('DOMContentLoaded', () => {
   }, 300);
 });
 
+// Sessione di tuning trova-differenze: la foto viene caricata una volta sola
+// (il server tiene in cache resize, maschere dlib e grayscale) e ogni cambio
+// slider invia solo i parametri. Le immagini degli step arrivano come image_url.
+let _wdotsTuningSession = null; // { id, image }
+
+async function wdotsRequestDebugSteps(baseUrl, imageData, params) {
+  const openSession = async () => {
+    const resp = await fetch(`${baseUrl}/api/debug/trova-differenze/session`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ image: imageData }),
+      signal: AbortSignal.timeout(120000),
+    });
+    if (!resp.ok) {
+      const err = await resp.json().catch(() => ({ detail: resp.statusText }));
+      throw new Error(err.detail || `HTTP ${resp.status}`);
+    }
+    const data = await resp.json();
+    _wdotsTuningSession = { id: data.session_id, image: imageData };
+  };
+  const runSteps = () => fetch(`${baseUrl}/api/debug/trova-differenze`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ session_id: _wdotsTuningSession.id, lazy_images: true, ...params }),
+    signal: AbortSignal.timeout(120000),
+  });
+
+  if (!_wdotsTuningSession || _wdotsTuningSession.image !== imageData) await openSession();
+  let resp = await runSteps();
+  if (resp.status === 404) {
+    // sessione scaduta sul server: ricarica la foto e riprova una volta
+    await openSession();
+    resp = await runSteps();
+  }
+  if (!resp.ok) {
+    const err = await resp.json().catch(() => ({ detail: resp.statusText }));
+    throw new Error(err.detail || `HTTP ${resp.status}`);
+  }
+  return resp.json();
+}
+
+// Sorgente immagine di uno step: URL lazy della sessione oppure data URL inline
+function wdotsStepImageSrc(step, baseUrl) {
+  if (!step) return null;
+  if (step.image_url) return `${baseUrl}${step.image_url}`;
+  if (!step.image_b64) return null;
+  return step.image_b64.startsWith('data:') ? step.image_b64 : `data:image/jpeg;base64,${step.image_b64}`;
+}
+
 /**
  * Vista rapida: chiama /api/debug/trova-differenze e mostra Step1+Step2+Step3
  * nelle 3 card esistenti (zone, detect, masked).
@@ -8431,26 +8558,11 @@ async function showWhiteDotsDebugImages() {
     if (lumaSlider) params.luma_min = parseInt(lumaSlider.value);
     if (lumaMaxSlider) params.luma_max = parseInt(lumaMaxSlider.value);
 
-    const resp = await fetch(`${baseUrl}/api/debug/trova-differenze`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ image: canvasImageData, ...params }),
-      signal: AbortSignal.timeout(120000),
-    });
-
-    if (!resp.ok) {
-      const err = await resp.json().catch(() => ({ detail: resp.statusText }));
-      throw new Error(err.detail || `HTTP ${resp.status}`);
-    }
-
-    const data = await resp.json();
+    const data = await wdotsRequestDebugSteps(baseUrl, canvasImageData, params);
     if (!data.success || !Array.isArray(data.steps)) throw new Error('Risposta non valida dal server');
 
     // Step 1 → zona, Step 2 → detect, Step 3 → ordine anatomico
-    const b64 = (n) => {
-      const s = data.steps.find(s => s.step === n);
-      return s ? `data:image/jpeg;base64,${s.image_b64}` : null;
-    };
+    const b64 = (n) => wdotsStepImageSrc(data.steps.find(s => s.step === n), baseUrl);
     if (imgZ && b64(1)) { imgZ.src = b64(1); imgZ.style.display = 'block'; }
     if (imgD && b64(2)) { imgD.src = b64(2); imgD.style.display = 'block'; }
     if (imgM && b64(3)) { imgM.src = b64(3); imgM.style.display = 'block'; }
@@ -8651,19 +8763,7 @@ async function showDebugPipeline() {
       ? API_CONFIG.baseURL : window.location.origin;
 
     const params = readPipelineParams();
-    const resp = await fetch(`${baseUrl}/api/debug/trova-differenze`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ image: canvasImageData, ...params }),
-      signal: AbortSignal.timeout(120000)
-    });
-
-    if (!resp.ok) {
-      const err = await resp.json().catch(() => ({ detail: resp.statusText }));
-      throw new Error(err.detail || `HTTP ${resp.status}`);
-    }
-
-    const data = await resp.json();
+    const data = await wdotsRequestDebugSteps(baseUrl, canvasImageData, params);
     if (!data.success || !Array.isArray(data.steps)) throw new Error('Risposta non valida');
 
     const stepColors = ['#aaa', '#00d4ff', '#4dff91', '#ffd700', '#ff9900', '#ff66cc', '#ff4444', '#7dff7d', '#ffaa44', '#a0c4ff', '#7dff7d'];
@@ -8680,7 +8780,8 @@ async function showDebugPipeline() {
     }
 
     data.steps.forEach(step => {
-      if (!step.image_b64) return;
+      const stepSrc = wdotsStepImageSrc(step, baseUrl);
+      if (!stepSrc) return;
       const card = document.createElement('div');
       card.style.cssText = 'background:#1a1a1a; border:1px solid #2a2a2a; border-radius:8px; overflow:hidden;';
       const col = stepColors[step.step] || '#aaa';
@@ -8703,7 +8804,7 @@ async function showDebugPipeline() {
         wrap.style.cssText = 'position:relative;display:block;line-height:0;';
 
         const img = document.createElement('img');
-        img.src = step.image_b64;
+        img.src = stepSrc;
         img.style.cssText = 'width:100%;display:block;';
         wrap.appendChild(img);
 
@@ -8786,7 +8887,7 @@ async function showDebugPipeline() {
       } else {
         // ── altri step: immagine semplice ──────────────────────────────────
         const img = document.createElement('img');
-        img.src = step.image_b64;
+        img.src = stepSrc;
         img.alt = `step${step.step}`;
         img.style.cssText = 'width:100%;display:block;cursor:zoom-in;';
         img.addEventListener('click', () => {